@@ -1,52 +1,76 @@
 import logging
 import os
+import click
+import functools
 import io
+import hashlib
+import json
 import random
+import secrets
+import socket
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
 from datetime import datetime, date, timedelta
-from calendar import monthrange
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, g, request, jsonify, make_response, send_file, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from sqlalchemy import extract, func
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload, subqueryload
 from openpyxl import Workbook
 
 from models import (
-    db, Team, Member, Unavailability, Shift, ShiftSwap, Settings,
-    ShotefDay, SETTINGS_DEFAULTS,
+    db, Team, Member, Unavailability, Shift, ShiftSwap, Settings, SettingsVersion,
+    ShotefDay, GenerationJob, GenerationFingerprint, SchedulePreview, SETTINGS_DEFAULTS,
 )
+import cache as response_cache
+import history_import
+import ledger
+import migrations
+import planner
+import solver
+from queries import in_month, insert_on_conflict, month_bounds
 
 import time as _time
 
 UPLOAD_FOLDER = "static/uploads"
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
 
-# Simple response cache (TTL-based, auto-cleared on writes)
-_resp_cache: dict[str, tuple] = {}
-CACHE_TTL = 5  # seconds
+# Response cache (TTL-based, bounded, versioned per scope); backend chosen in cache.from_env.
+# Scopes: "global", "team:<id>", "teams" (the teams list) and "reports".
+_resp_cache = None
 
-def _cache_get(key: str):
-    if key in _resp_cache:
-        val, ts = _resp_cache[key]
-        if _time.time() - ts < CACHE_TTL:
-            return val
-        del _resp_cache[key]
-    return None
+def _cache_key(base: str, *scopes: str) -> str:
+    """``base`` tagged with the current versions of the scopes the response depends on."""
+    return f"{base}@{'.'.join(map(str, _resp_cache.versions(scopes)))}"
 
-def _cache_set(key: str, val):
-    _resp_cache[key] = (val, _time.time())
+def _team_scopes(team_id: int):
+    return ("global", f"team:{team_id}")
 
-def _cache_clear_team(team_id: int):
-    for k in [k for k in _resp_cache if f"/teams/{team_id}/" in k or k.endswith(f"/teams/{team_id}")]:
-        del _resp_cache[k]
+def _cache_get(key: str):
+    return _resp_cache.get(key)
 
-def _cache_clear_all():
-    _resp_cache.clear()
+def _cache_set(key: str, val):
+    """Serialize ``val`` once, store it with its strong ETag and return the entry."""
+    body = app.json.dumps(val)
+    entry = {"etag": hashlib.blake2b(body.encode(), digest_size=16).hexdigest(), "body": body}
+    _resp_cache.set(key, entry)
+    return entry
+
+def _cached_response(entry):
+    """JSON response for a cache entry; an ``If-None-Match`` on its ETag gets a bodiless 304."""
+    response = app.response_class(entry["body"], mimetype="application/json")
+    response.set_etag(entry["etag"])
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+def _cache_bump(*scopes: str):
+    _resp_cache.bump(scopes)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -70,17 +94,127 @@ else:
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.secret_key = os.environ.get("SECRET_KEY", "superSecretKey")
 
-CORS(app, resources={r"/api/*": {"origins": "*"}})
-
-@app.before_request
-def _clear_per_request_caches():
-    _settings_cache.clear()
-    if request.method in ("POST", "PUT", "DELETE"):
-        _cache_clear_all()
+CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=["ETag"])
+
+_resp_cache = response_cache.from_env(dumps=app.json.dumps, loads=app.json.loads)
+
+def _request_team_id(view_args):
+    """Team a write request touches, from its URL (or the ``team_id`` of a settings body)."""
+    if "team_id" in view_args:
+        return view_args["team_id"]
+    lookups = {
+        "member_id": lambda i: db.session.query(Member.team_id).filter(Member.id == i),
+        "unav_id": lambda i: db.session.query(Member.team_id)
+            .join(Unavailability, Unavailability.member_id == Member.id).filter(Unavailability.id == i),
+        "swap_id": lambda i: db.session.query(Shift.team_id)
+            .join(ShiftSwap, ShiftSwap.shift_id == Shift.id).filter(ShiftSwap.id == i),
+        "shift_id": lambda i: db.session.query(Shift.team_id).filter(Shift.id == i),
+        "sd_id": lambda i: db.session.query(ShotefDay.team_id).filter(ShotefDay.id == i),
+    }
+    for arg, lookup in lookups.items():
+        if arg in view_args:
+            return lookup(view_args[arg]).scalar()
+    return (request.get_json(silent=True) or {}).get("team_id")
+
+
+def invalidates(*scopes):
+    """Bump the response-cache ``scopes`` once the wrapped write succeeds.
+
+    ``"team"`` stands for the team the request touches, resolved before the view runs
+    so deletes still find it; a write with no team (global settings) bumps ``"global"``.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            team_id = _request_team_id(view_args) if "team" in scopes else None
+            response = make_response(view(**view_args))
+            if response.status_code < 400:
+                bumped = [scope for scope in scopes if scope != "team"]
+                if "team" in scopes:
+                    bumped.append(f"team:{team_id}" if team_id is not None else "global")
+                _cache_bump(*bumped)
+            return response
+        return wrapper
+    return decorator
 
 db.init_app(app)
+
+GENERATION_JOB_TIMEOUT = int(os.environ.get("GENERATION_JOB_TIMEOUT", "600"))  # seconds
+
+
+def _job_owner():
+    # Computed per call rather than at import: forked workers get their own pid.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner):
+    """True/False for a process on this host; None when that can't be told from here."""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _job_is_stale(job, at_startup=False):
+    """Whether an active job's process is gone, or its lease of ``GENERATION_JOB_TIMEOUT`` ran out.
+
+    At startup nothing has been queued yet, so a job carrying our own owner id was
+    left by an earlier process that had the same pid (e.g. pid 1 in a container).
+    """
+    if job.owner == _job_owner():
+        if at_startup:
+            return True
+    elif _owner_alive(job.owner) is False:
+        return True
+    since = job.started_at or job.created_at
+    return since is not None and datetime.utcnow() - since > timedelta(seconds=GENERATION_JOB_TIMEOUT)
+
+
+def _fail_stale_job(job):
+    job.status = "failed"
+    job.error = "Interrupted: the server process running it stopped"
+    job.active_key = None
+    job.finished_at = datetime.utcnow()
+
+
 with app.app_context():
     db.create_all()
+    migrations.upgrade(db.engine)
+    ledger.ensure_built(db.session)
+    if db.session.get(SettingsVersion, 1) is None:
+        try:
+            db.session.add(SettingsVersion(id=1, version=0))
+            db.session.commit()
+        except IntegrityError:  # another worker seeded it first
+            db.session.rollback()
+    # Jobs whose process is gone will never finish; other live workers keep theirs.
+    for job in GenerationJob.query.filter(GenerationJob.active_key.isnot(None)):
+        if _job_is_stale(job, at_startup=True):
+            _fail_stale_job(job)
+    db.session.commit()
+
+
+@app.cli.command("ledger")
+@click.argument("action", type=click.Choice(["verify", "rebuild"]))
+def ledger_command(action):
+    """Verify the fairness ledger against shifts/shift_swaps, or rebuild it from them."""
+    if action == "rebuild":
+        rows = ledger.rebuild(db.session)
+        db.session.commit()
+        click.echo(f"Ledger rebuilt: {rows} buckets")
+        return
+    mismatches = ledger.verify(db.session)
+    for (member_id, year, month, kind), have, want in mismatches:
+        click.echo(f"member {member_id} {year}-{month:02d} {kind}: ledger={have} raw={want}")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} ledger bucket(s) out of sync")
+    click.echo("Ledger OK")
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
@@ -89,30 +223,82 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-_settings_cache: dict[tuple, dict] = {}
+@dataclass(frozen=True)
+class TeamSettings:
+    """A team's effective settings (global rows overridden by team rows), parsed once."""
+    raw: dict                           # key -> stored string, as the settings API returns them
+    max_normal_shifts: int
+    max_thursday_shifts: int
+    max_weekend_shifts: int
+    justice_lookback_months: int
+    min_days_between_shifts: int
+    shotef_enabled: bool
+    shotef_settled_at: date = None
+
+    @classmethod
+    def parse(cls, raw):
+        def number(key):
+            try:
+                return int(raw[key])
+            except ValueError:
+                return int(SETTINGS_DEFAULTS[key])
+
+        try:
+            settled_at = datetime.strptime(raw["shotef_settled_at"], "%Y-%m-%d").date()
+        except ValueError:
+            settled_at = None
+        return cls(
+            raw=raw,
+            max_normal_shifts=number("max_normal_shifts"),
+            max_thursday_shifts=number("max_thursday_shifts"),
+            max_weekend_shifts=number("max_weekend_shifts"),
+            justice_lookback_months=number("justice_lookback_months"),
+            min_days_between_shifts=number("min_days_between_shifts"),
+            shotef_enabled=raw["shotef_enabled"].lower() == "true",
+            shotef_settled_at=settled_at,
+        )
+
+
+# team_id -> (settings version it was loaded at, TeamSettings); shared by every request
+# in the process and reloaded only once the version row moves on.
+_settings_cache: dict = {}
+
+def _settings_version():
+    """The settings version row, read at most once per app context (a request or a job)."""
+    if "settings_version" not in g:
+        g.settings_version = db.session.query(SettingsVersion.version).filter_by(id=1).scalar() or 0
+    return g.settings_version
+
+def get_team_settings(team_id=None):
+    """Typed settings for ``team_id`` (global settings for None), cached across requests."""
+    version = _settings_version()
+    cached = _settings_cache.get(team_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    raw = dict(SETTINGS_DEFAULTS)
+    rows = Settings.query.filter(or_(Settings.team_id.is_(None), Settings.team_id == team_id)).all()
+    for s in sorted(rows, key=lambda s: s.team_id is not None):
+        raw[s.key] = s.value
+    settings = TeamSettings.parse(raw)
+    _settings_cache[team_id] = (version, settings)
+    return settings
 
 def get_all_settings(team_id=None):
-    """Fetch all settings in one query, with team-level overrides."""
-    cache_key = ("settings", team_id)
-    if cache_key in _settings_cache:
-        return _settings_cache[cache_key]
-
-    result = dict(SETTINGS_DEFAULTS)
-    global_rows = Settings.query.filter_by(team_id=None).all()
-    for s in global_rows:
-        result[s.key] = s.value
-    if team_id is not None:
-        team_rows = Settings.query.filter_by(team_id=team_id).all()
-        for s in team_rows:
-            result[s.key] = s.value
-    _settings_cache[cache_key] = result
-    return result
+    """All settings as stored strings, with team-level overrides."""
+    return get_team_settings(team_id).raw
 
 def get_setting(key, team_id=None):
     return get_all_settings(team_id).get(key, SETTINGS_DEFAULTS.get(key, "0"))
 
-def invalidate_settings_cache():
-    _settings_cache.clear()
+def bump_settings_version():
+    """Mark every process's cached settings stale; lands with the caller's commit."""
+    updated = SettingsVersion.query.filter_by(id=1).update(
+        {SettingsVersion.version: SettingsVersion.version + 1}, synchronize_session=False,
+    )
+    if not updated:
+        db.session.add(SettingsVersion(id=1, version=1))
+    g.pop("settings_version", None)
 
 
 def json_error(message, code=400):
@@ -144,9 +330,10 @@ def spa_fallback(e):
 
 @app.route("/api/teams", methods=["GET"])
 def api_get_teams():
-    cached = _cache_get("teams-list")
+    cache_key = _cache_key("teams-list", "teams")
+    cached = _cache_get(cache_key)
     if cached is not None:
-        return jsonify(cached)
+        return _cached_response(cached)
     teams = Team.query.order_by(Team.name).all()
     member_counts = dict(
         db.session.query(Member.team_id, func.count(Member.id))
@@ -162,11 +349,11 @@ def api_get_teams():
             "total_shifts": total_shifts,
         },
     }
-    _cache_set("teams-list", result)
-    return jsonify(result)
+    return _cached_response(_cache_set(cache_key, result))
 
 
 @app.route("/api/teams", methods=["POST"])
+@invalidates("teams", "reports")
 def api_create_team():
     data = request.get_json() or {}
     name = (data.get("name") or "").strip()
@@ -203,6 +390,7 @@ def api_get_team(team_id):
 
 
 @app.route("/api/teams/<int:team_id>", methods=["PUT"])
+@invalidates("team", "teams", "reports")
 def api_update_team(team_id):
     team = Team.query.get_or_404(team_id)
     data = request.get_json() or {}
@@ -218,6 +406,7 @@ def api_update_team(team_id):
 
 
 @app.route("/api/teams/<int:team_id>", methods=["DELETE"])
+@invalidates("team", "teams", "reports")
 def api_delete_team(team_id):
     team = Team.query.get_or_404(team_id)
     db.session.delete(team)
@@ -226,6 +415,7 @@ def api_delete_team(team_id):
 
 
 @app.route("/api/teams/<int:team_id>/upload-picture", methods=["POST"])
+@invalidates("team", "teams")
 def api_upload_team_picture(team_id):
     team = Team.query.get_or_404(team_id)
     pic = request.files.get("picture")
@@ -265,6 +455,7 @@ def api_get_members(team_id):
 
 
 @app.route("/api/teams/<int:team_id>/members", methods=["POST"])
+@invalidates("team", "teams", "reports")
 def api_create_member(team_id):
     Team.query.get_or_404(team_id)
     data = request.get_json() or {}
@@ -277,7 +468,7 @@ def api_create_member(team_id):
     existing_members = Member.query.filter_by(team_id=team_id).all()
     credit = 0
     if existing_members:
-        lookback = int(get_setting("justice_lookback_months", team_id))
+        lookback = get_team_settings(team_id).justice_lookback_months
         counts = []
         for m in existing_members:
             q = Shift.query.filter_by(member_id=m.id)
@@ -300,6 +491,7 @@ def api_create_member(team_id):
 
 
 @app.route("/api/members/<int:member_id>", methods=["PUT"])
+@invalidates("team", "reports")
 def api_update_member(member_id):
     member = Member.query.get_or_404(member_id)
     data = request.get_json() or {}
@@ -321,6 +513,7 @@ def api_update_member(member_id):
 
 
 @app.route("/api/members/<int:member_id>", methods=["DELETE"])
+@invalidates("team", "teams", "reports")
 def api_delete_member(member_id):
     member = Member.query.get_or_404(member_id)
     db.session.delete(member)
@@ -329,6 +522,7 @@ def api_delete_member(member_id):
 
 
 @app.route("/api/members/<int:member_id>/upload-photo", methods=["POST"])
+@invalidates("team")
 def api_upload_member_photo(member_id):
     member = Member.query.get_or_404(member_id)
     photo = request.files.get("photo")
@@ -354,6 +548,7 @@ def api_get_unavailabilities(member_id):
 
 
 @app.route("/api/members/<int:member_id>/unavailabilities", methods=["POST"])
+@invalidates("team")
 def api_create_unavailability(member_id):
     Member.query.get_or_404(member_id)
     data = request.get_json() or {}
@@ -377,7 +572,31 @@ def api_create_unavailability(member_id):
     return jsonify(unav.to_dict()), 201
 
 
+def _parse_bulk_dates(values):
+    """Parse a bulk endpoint's date strings.
+
+    Returns ``({date: result}, results)``: ``results`` has one ``{"date", "status"}``
+    per input, in order, and the dict maps each distinct valid date to its entry for
+    the caller to fill in. Bad strings get ``"invalid"``, repeats ``"duplicate"``.
+    """
+    parsed, results = {}, []
+    for value in values:
+        result = {"date": value}
+        try:
+            d = datetime.strptime(str(value), "%Y-%m-%d").date()
+        except ValueError:
+            result["status"] = "invalid"
+        else:
+            if d in parsed:
+                result["status"] = "duplicate"
+            else:
+                parsed[d] = result
+        results.append(result)
+    return parsed, results
+
+
 @app.route("/api/members/<int:member_id>/unavailabilities/bulk", methods=["POST"])
+@invalidates("team")
 def api_bulk_create_unavailability(member_id):
     """Create unavailabilities for multiple dates at once."""
     Member.query.get_or_404(member_id)
@@ -388,23 +607,28 @@ def api_bulk_create_unavailability(member_id):
     if not dates:
         return json_error("At least one date is required")
 
-    added = 0
-    for date_str in dates:
-        try:
-            d_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-        except ValueError:
-            continue
-        existing = Unavailability.query.filter_by(member_id=member_id, date=d_obj).first()
-        if existing:
-            existing.reason = reason
-        else:
-            db.session.add(Unavailability(member_id=member_id, date=d_obj, reason=reason))
-            added += 1
+    parsed, results = _parse_bulk_dates(dates)
+    existing = {
+        d for (d,) in db.session.query(Unavailability.date)
+        .filter(Unavailability.member_id == member_id, Unavailability.date.in_(list(parsed)))
+    } if parsed else set()
+    insert_on_conflict(db.session, Unavailability, [
+        {"member_id": member_id, "date": d, "reason": reason} for d in parsed
+    ], ["member_id", "date"], update=["reason"])
     db.session.commit()
-    return jsonify({"message": f"{added} unavailabilit{'ies' if added != 1 else 'y'} added", "count": added}), 201
+
+    for d, result in parsed.items():
+        result["status"] = "updated" if d in existing else "added"
+    added = len(parsed) - len(existing)
+    return jsonify({
+        "message": f"{added} unavailabilit{'ies' if added != 1 else 'y'} added",
+        "count": added,
+        "results": results,
+    }), 201
 
 
 @app.route("/api/unavailabilities/<int:unav_id>", methods=["PUT"])
+@invalidates("team")
 def api_update_unavailability(unav_id):
     unav = Unavailability.query.get_or_404(unav_id)
     data = request.get_json() or {}
@@ -426,6 +650,7 @@ def api_update_unavailability(unav_id):
 
 
 @app.route("/api/unavailabilities/<int:unav_id>", methods=["DELETE"])
+@invalidates("team")
 def api_delete_unavailability(unav_id):
     unav = Unavailability.query.get_or_404(unav_id)
     db.session.delete(unav)
@@ -438,6 +663,7 @@ def api_delete_unavailability(unav_id):
 # ══════════════════════════════════════
 
 @app.route("/api/teams/<int:team_id>/schedule/swap", methods=["POST"])
+@invalidates("team", "reports")
 def api_swap_shift(team_id):
     Team.query.get_or_404(team_id)
     data = request.get_json() or {}
@@ -463,6 +689,7 @@ def api_swap_shift(team_id):
 
     original_member_id = shift.member_id
     shift.member_id = covering_member_id
+    shift.team_id = covering_member.team_id
     swap = ShiftSwap(
         shift_id=shift_id,
         original_member_id=original_member_id,
@@ -475,48 +702,105 @@ def api_swap_shift(team_id):
 
 
 @app.route("/api/swaps/<int:swap_id>", methods=["DELETE"])
+@invalidates("team", "reports")
 def api_revert_swap(swap_id):
     swap = ShiftSwap.query.get_or_404(swap_id)
     shift = Shift.query.get(swap.shift_id)
     if shift:
+        # Swaps stay within a team, so shift.team_id is already right.
         shift.member_id = swap.original_member_id
     db.session.delete(swap)
     db.session.commit()
     return jsonify({"message": "Swap reverted", "shift": shift.to_dict() if shift else None})
 
 
+def _swap_window():
+    """``(start, end, error)`` from the optional inclusive ``from``/``to`` ISO-date query args."""
+    try:
+        start = date.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        end = date.fromisoformat(request.args["to"]) if request.args.get("to") else None
+    except ValueError:
+        return None, None, "from/to must be dates (YYYY-MM-DD)"
+    return start, end, None
+
+
+def _swap_pair_counts(member_ids, start=None, end=None):
+    """``{(covering_id, original_id): swaps}`` between two of ``member_ids``, in one grouped query.
+
+    ``start``/``end`` bound the covered shift's date, inclusive.
+    """
+    if not member_ids:
+        return {}
+    q = (
+        db.session.query(ShiftSwap.covering_member_id, ShiftSwap.original_member_id, func.count(ShiftSwap.id))
+        .filter(and_(ShiftSwap.covering_member_id.in_(member_ids), ShiftSwap.original_member_id.in_(member_ids)))
+    )
+    if start or end:
+        q = q.join(Shift, ShiftSwap.shift_id == Shift.id)
+        if start:
+            q = q.filter(Shift.shift_date >= start)
+        if end:
+            q = q.filter(Shift.shift_date <= end)
+    rows = q.group_by(ShiftSwap.covering_member_id, ShiftSwap.original_member_id).all()
+    return {(covering_id, original_id): n for covering_id, original_id, n in rows}
+
+
 @app.route("/api/teams/<int:team_id>/swap-balance", methods=["GET"])
 def api_swap_balance(team_id):
     Team.query.get_or_404(team_id)
+    start, end, error = _swap_window()
+    if error:
+        return json_error(error)
     members = Member.query.filter_by(team_id=team_id).all()
-    member_ids = [m.id for m in members]
+    pairs = _swap_pair_counts([m.id for m in members], start, end)
+
+    covers_done, covers_received = defaultdict(int), defaultdict(int)
+    for (covering_id, original_id), n in pairs.items():
+        covers_done[covering_id] += n
+        covers_received[original_id] += n
 
     result = []
     for m in members:
-        covers_done = ShiftSwap.query.filter(
-            ShiftSwap.covering_member_id == m.id,
-            ShiftSwap.original_member_id.in_(member_ids),
-        ).count()
-        covers_received = ShiftSwap.query.filter(
-            ShiftSwap.original_member_id == m.id,
-            ShiftSwap.covering_member_id.in_(member_ids),
-        ).count()
         result.append({
             "member_id": m.id,
             "name": m.name,
-            "covers_done": covers_done,
-            "covers_received": covers_received,
-            "net_balance": covers_received - covers_done,
+            "covers_done": covers_done[m.id],
+            "covers_received": covers_received[m.id],
+            "net_balance": covers_received[m.id] - covers_done[m.id],
         })
 
     return jsonify({"balances": result})
 
 
+@app.route("/api/teams/<int:team_id>/swap-matrix", methods=["GET"])
+def api_swap_matrix(team_id):
+    """Who covered whom within the team: ``covers[i][j]`` is how often member i covered member j.
+
+    ``net[i][j] = covers[i][j] - covers[j][i]``; positive means member j owes member i.
+    """
+    Team.query.get_or_404(team_id)
+    start, end, error = _swap_window()
+    if error:
+        return json_error(error)
+    members = Member.query.filter_by(team_id=team_id).order_by(Member.name).all()
+    pairs = _swap_pair_counts([m.id for m in members], start, end)
+
+    ids = [m.id for m in members]
+    covers = [[pairs.get((a, b), 0) for b in ids] for a in ids]
+    net = [[covers[i][j] - covers[j][i] for j in range(len(ids))] for i in range(len(ids))]
+    return jsonify({
+        "members": [{"member_id": m.id, "name": m.name} for m in members],
+        "covers": covers,
+        "net": net,
+    })
+
+
 # ══════════════════════════════════════
 #  SCHEDULE GENERATION
 # ══════════════════════════════════════
 
 @app.route("/api/teams/<int:team_id>/schedule/assign", methods=["POST"])
+@invalidates("team", "teams", "reports")
 def api_assign_shift(team_id):
     """Manually assign a member to a specific date (used to fill 'no one available' slots)."""
     Team.query.get_or_404(team_id)
@@ -540,7 +824,7 @@ def api_assign_shift(team_id):
     if existing:
         return json_error(f"{member_name} already has a shift on {shift_date_str}")
 
-    db.session.add(Shift(shift_date=d, member_id=member.id))
+    db.session.add(Shift(shift_date=d, member_id=member.id, team_id=team_id))
     assigned_dates = [shift_date_str]
 
     paired_date = None
@@ -551,13 +835,9 @@ def api_assign_shift(team_id):
 
     if paired_date and paired_date.month == d.month:
         paired_existing = Shift.query.filter_by(member_id=member.id, shift_date=paired_date).first()
-        team_shift_on_paired = (
-            Shift.query.join(Member)
-            .filter(Member.team_id == team_id, Shift.shift_date == paired_date)
-            .first()
-        )
+        team_shift_on_paired = Shift.query.filter_by(team_id=team_id, shift_date=paired_date).first()
         if not paired_existing and not team_shift_on_paired:
-            db.session.add(Shift(shift_date=paired_date, member_id=member.id))
+            db.session.add(Shift(shift_date=paired_date, member_id=member.id, team_id=team_id))
             assigned_dates.append(paired_date.isoformat())
 
     db.session.commit()
@@ -567,6 +847,7 @@ def api_assign_shift(team_id):
 
 
 @app.route("/api/teams/<int:team_id>/schedule/generate", methods=["POST"])
+@invalidates("team", "teams", "reports")
 def api_generate_schedule(team_id):
     try:
         Team.query.get_or_404(team_id)
@@ -579,6 +860,9 @@ def api_generate_schedule(team_id):
         year, month = int(year), int(month)
         if not (1 <= month <= 12):
             return json_error("Month must be between 1 and 12")
+        options, error = _planner_options(data)
+        if error:
+            return json_error(error)
 
         today = date.today()
         current_month_start = date(today.year, today.month, 1)
@@ -586,457 +870,1194 @@ def api_generate_schedule(team_id):
         if target_month_start < current_month_start:
             return json_error("Cannot generate schedules for past months. Use 'Past Shifts' to add historical data.")
 
-        members = Member.query.filter_by(team_id=team_id).all()
-        if not members:
+        ctx = load_generation_context(team_id, year, month)
+        if ctx is None:
             return json_error("No members found for this team")
 
-        assignments, suggestions = create_schedule(team_id, year, month)
-        shotef_assignments, shotef_needs_substitute = generate_shotef(team_id, year, month)
-
-        return jsonify({
-            "assignments": assignments,
-            "suggestions": suggestions,
-            "shotef_assignments": shotef_assignments,
-            "shotef_needs_substitute": shotef_needs_substitute,
-        })
+        return jsonify(generate_or_reuse(ctx, options, data.get("seed"), reroll=bool(data.get("reroll"))))
     except Exception as e:
         db.session.rollback()
         logger.exception("Schedule generation failed")
         return json_error(str(e), 500)
 
 
-def create_schedule(team_id, year, month):
+@app.route("/api/teams/<int:team_id>/schedule/repair", methods=["POST"])
+@invalidates("team", "teams", "reports")
+def api_repair_schedule(team_id):
+    """Re-plan just the given dates of a generated month after availability changes."""
+    try:
+        Team.query.get_or_404(team_id)
+        data = request.get_json() or {}
+        year = data.get("year")
+        month = data.get("month")
+        date_strs = data.get("dates", [])
+
+        if not year or not month:
+            return json_error("Year and month are required")
+        year, month = int(year), int(month)
+        if not (1 <= month <= 12):
+            return json_error("Month must be between 1 and 12")
+        if not date_strs:
+            return json_error("dates are required")
+        try:
+            dates = [datetime.strptime(d, "%Y-%m-%d").date() for d in date_strs]
+        except ValueError:
+            return json_error("Invalid date format, use YYYY-MM-DD")
+        if any((d.year, d.month) != (year, month) for d in dates):
+            return json_error("All dates must be in the given month")
+        member_id = data.get("member_id")
+        if member_id is not None:
+            try:
+                member_id = int(member_id)
+            except (TypeError, ValueError):
+                return json_error("member_id must be an integer")
+            if not Member.query.filter_by(id=member_id, team_id=team_id).first():
+                return json_error("Member not found in this team", 404)
+
+        today = date.today()
+        if date(year, month, 1) < date(today.year, today.month, 1):
+            return json_error("Cannot repair past months")
+
+        return jsonify(repair_schedule(team_id, year, month, dates, member_id=member_id))
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Schedule repair failed")
+        return json_error(str(e), 500)
+
+
+def repair_schedule(team_id, year, month, dates, member_id=None):
+    """Apply ``solver.repair_night_plan`` to the stored month, changing only the nights it returns.
+
+    With ``member_id``, only the nights of ``dates`` that member holds are re-planned.
+    Repaired nights keep their shift row when someone takes them over; swaps on them
+    are dropped since the covered member is no longer the one on duty.
+    """
+    started = _time.perf_counter()
     all_members = Member.query.filter_by(team_id=team_id).all()
     members = [m for m in all_members if not m.is_leader]
-    member_ids = [m.id for m in members]
+    names = {m.id: m.name for m in all_members}
+    gen_start = _generation_start(year, month)
+    snapshot = _night_snapshot(team_id, members, year, month, date(year, month, 1))
+
+    rows = Shift.query.filter(Shift.team_id == team_id, in_month(Shift.shift_date, year, month)).all()
+    pool = set(snapshot.member_ids)
+    by_date = {}
+    for shift in rows:
+        # A leader's manual shift on the same night stays put; the pool's one is repaired.
+        if shift.shift_date not in by_date or shift.member_id in pool:
+            by_date[shift.shift_date] = shift
+    if member_id is not None:
+        dates = [d for d in dates if d in by_date and by_date[d].member_id == member_id]
+
+    changes = solver.repair_night_plan(
+        snapshot,
+        [(d, shift.member_id) for d, shift in by_date.items()],
+        [d.day for d in dates if d >= gen_start],
+        locked_days=range(1, gen_start.day),
+    )
 
-    max_normal = int(get_setting("max_normal_shifts", team_id))
-    max_thursday = int(get_setting("max_thursday_shifts", team_id))
-    max_weekend = int(get_setting("max_weekend_shifts", team_id))
-    lookback_months = int(get_setting("justice_lookback_months", team_id))
-    min_gap = int(get_setting("min_days_between_shifts", team_id))
+    report = []
+    for d in sorted(changes):
+        new_member_id = changes[d]
+        shift = by_date.get(d)
+        report.append({
+            "date": d.isoformat(),
+            "day_of_week": d.strftime("%A"),
+            "from": names.get(shift.member_id) if shift else None,
+            "to": names.get(new_member_id) if new_member_id else None,
+        })
+        if shift is not None:
+            for swap in list(shift.swaps):
+                db.session.delete(swap)
+            if new_member_id is None:
+                db.session.delete(shift)
+            else:
+                shift.member_id = new_member_id
+        elif new_member_id is not None:
+            db.session.add(Shift(shift_date=d, member_id=new_member_id, team_id=team_id))
+    db.session.commit()
 
-    _, last_day = monthrange(year, month)
-    end_date = date(year, month, last_day)
+    holders = {d: shift.member_id for d, shift in by_date.items()}
+    holders.update(changes)
+    still_open = sorted({d.isoformat() for d in dates if d >= gen_start and holders.get(d) is None})
+    return {
+        "changes": report,
+        "unfilled": still_open,
+        "elapsed_ms": round((_time.perf_counter() - started) * 1000, 1),
+    }
 
-    today = date.today()
-    is_current_month = (year == today.year and month == today.month)
-    gen_start = today if is_current_month else date(year, month, 1)
 
-    Shift.query.filter(
-        Shift.member_id.in_(member_ids),
-        Shift.shift_date >= gen_start,
-        Shift.shift_date <= end_date,
-    ).delete(synchronize_session="fetch")
-    db.session.flush()
+PREVIEW_TTL = timedelta(hours=1)
 
-    unav_dict = {m.id: set() for m in members}
-    reason_dict = {}
-    all_unav = Unavailability.query.filter(
-        Unavailability.member_id.in_(member_ids),
-        extract("year", Unavailability.date) == year,
-        extract("month", Unavailability.date) == month,
-    ).all()
-    for ua in all_unav:
-        unav_dict[ua.member_id].add(ua.date)
-        reason_dict[(ua.member_id, ua.date)] = ua.reason
 
-    # ── Justice computation with shift_credit + swap debt ──
-    cutoff = None
-    if lookback_months > 0:
-        cutoff = date(year, month, 1) - timedelta(days=lookback_months * 30)
+@app.route("/api/teams/<int:team_id>/schedule/preview", methods=["POST"])
+def api_preview_schedule(team_id):
+    """Plan a month in memory and hold it under a token; nothing in the schedule changes."""
+    try:
+        Team.query.get_or_404(team_id)
+        data = request.get_json() or {}
+        year = data.get("year")
+        month = data.get("month")
+
+        if not year or not month:
+            return json_error("Year and month are required")
+        year, month = int(year), int(month)
+        if not (1 <= month <= 12):
+            return json_error("Month must be between 1 and 12")
+        options, error = _planner_options(data)
+        if error:
+            return json_error(error)
 
-    member_past_count = {}
-    member_past_weekend = {}
-    member_past_thursday = {}
+        today = date.today()
+        if date(year, month, 1) < date(today.year, today.month, 1):
+            return json_error("Cannot generate schedules for past months. Use 'Past Shifts' to add historical data.")
 
-    for m in members:
-        base_q = Shift.query.filter(
-            Shift.member_id == m.id,
-            ~((extract("year", Shift.shift_date) == year) & (extract("month", Shift.shift_date) == month)),
+        ctx = load_generation_context(team_id, year, month)
+        if ctx is None:
+            return json_error("No members found for this team")
+        night, shotef = ctx.night, ctx.shotef
+        night_plan, shotef_plan = _plan_context(ctx, **options)
+        result = _generation_result(night_plan, shotef_plan)
+
+        now = datetime.utcnow()
+        SchedulePreview.query.filter(SchedulePreview.created_at < now - PREVIEW_TTL).delete(synchronize_session=False)
+        preview = SchedulePreview(
+            token=secrets.token_urlsafe(24),
+            team_id=team_id,
+            year=year,
+            month=month,
+            start_day=night.start_day,
+            payload=json.dumps({
+                "member_ids": night.member_ids,
+                "with_shotef": shotef is not None,
+                "shifts": [(d.isoformat(), member_id) for d, member_id in night_plan.shifts],
+                "result": result,
+            }),
+            created_at=now,
         )
-        if cutoff:
-            base_q = base_q.filter(Shift.shift_date >= cutoff)
+        db.session.add(preview)
+        db.session.commit()
+        return jsonify({"token": preview.token, "expires_at": (now + PREVIEW_TTL).isoformat(), **result})
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Schedule preview failed")
+        return json_error(str(e), 500)
 
-        total = base_q.count()
 
-        weekend_shifts = [s for s in base_q.all() if s.shift_date.weekday() in (4, 5)]
-        thursday_shifts = [s for s in base_q.all() if s.shift_date.weekday() == 3]
+@app.route("/api/teams/<int:team_id>/schedule/apply", methods=["POST"])
+@invalidates("team", "teams", "reports")
+def api_apply_preview(team_id):
+    """Persist a previewed plan atomically, replacing the month like generate does."""
+    data = request.get_json() or {}
+    token = data.get("token")
+    if not token:
+        return json_error("Token is required")
+    preview = SchedulePreview.query.filter_by(token=token, team_id=team_id).first()
+    if not preview:
+        return json_error("Preview not found or already applied", 404)
+
+    year, month = preview.year, preview.month
+    gen_start = date(year, month, preview.start_day)
+    if preview.created_at < datetime.utcnow() - PREVIEW_TTL:
+        db.session.delete(preview)
+        db.session.commit()
+        return json_error("Preview has expired; preview the month again", 410)
+    if gen_start < _generation_start(year, month):
+        return json_error("Preview starts on a day that has passed; preview the month again", 409)
+
+    payload = json.loads(preview.payload)
+    result = payload["result"]
+    planned = {member_id for _, member_id in payload["shifts"]}
+    planned.update(a["member_id"] for a in result["shotef_assignments"])
+    if Member.query.filter(Member.id.in_(planned), Member.team_id == team_id).count() != len(planned):
+        return json_error("Team members changed since the preview; preview the month again", 409)
+    night_plan = planner.NightPlan(shifts=[(date.fromisoformat(d), member_id) for d, member_id in payload["shifts"]])
+    shotef_plan = planner.ShotefPlan(assignments=result["shotef_assignments"])
+    try:
+        db.session.delete(preview)
+        changes = _persist_team_month(
+            team_id, year, month, payload["member_ids"], gen_start,
+            night_plan, shotef_plan, payload["with_shotef"],
+        )
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Applying preview failed")
+        return json_error(f"Could not apply preview: {e}", 409)
 
-        swap_q = ShiftSwap.query
-        if cutoff:
-            swap_q_covers = swap_q.join(Shift).filter(Shift.shift_date >= cutoff)
-        else:
-            swap_q_covers = swap_q
+    return jsonify({"year": year, "month": month, **result, "diff": changes})
 
-        covers_done = swap_q_covers.filter(ShiftSwap.covering_member_id == m.id).count()
-        covers_received = swap_q_covers.filter(ShiftSwap.original_member_id == m.id).count()
 
-        effective = total - covers_done + covers_received + m.shift_credit
-        member_past_count[m.id] = effective
-        member_past_weekend[m.id] = len(weekend_shifts)
-        member_past_thursday[m.id] = len(thursday_shifts)
+@app.route("/api/teams/<int:team_id>/schedule/generate-horizon", methods=["POST"])
+@invalidates("team", "teams", "reports")
+def api_generate_horizon(team_id):
+    """Generate several consecutive months (night shifts + Shotef) in one transaction."""
+    try:
+        Team.query.get_or_404(team_id)
+        data = request.get_json() or {}
+        year = data.get("year")
+        month = data.get("month")
+        months = data.get("months")
 
-    monthly_normal_count = defaultdict(int)
-    monthly_thursday_count = defaultdict(int)
-    monthly_weekend_count = defaultdict(int)
-    last_assignment_date: dict[int, date] = {}
+        if not year or not month or not months:
+            return json_error("Year, month and months are required")
+        year, month, months = int(year), int(month), int(months)
+        if not (1 <= month <= 12):
+            return json_error("Month must be between 1 and 12")
+        if not (1 <= months <= MAX_HORIZON_MONTHS):
+            return json_error(f"Months must be between 1 and {MAX_HORIZON_MONTHS}")
 
-    def is_thursday(d):
-        return d.weekday() == 3
+        today = date.today()
+        if date(year, month, 1) < date(today.year, today.month, 1):
+            return json_error("Cannot generate schedules for past months. Use 'Past Shifts' to add historical data.")
 
-    def is_weekend(d):
-        return d.weekday() in (4, 5)
+        if not Member.query.filter_by(team_id=team_id).first():
+            return json_error("No members found for this team")
 
-    def sort_key_for_type(m, day_type):
-        if day_type == "weekend":
-            type_count = member_past_weekend[m.id]
-        elif day_type == "thursday":
-            type_count = member_past_thursday[m.id]
-        else:
-            type_count = member_past_count[m.id]
-        monthly_sum = monthly_normal_count[m.id] + monthly_thursday_count[m.id] + monthly_weekend_count[m.id]
-        return (type_count, member_past_count[m.id], monthly_sum, random.random())
-
-    def check_gap(m_id, current):
-        last = last_assignment_date.get(m_id)
-        if last and (current - last).days < min_gap:
-            return False
-        return True
+        return jsonify({"months": create_horizon(team_id, year, month, months)})
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Horizon generation failed")
+        return json_error(str(e), 500)
 
-    current_date = gen_start
-    assignments = []
-    suggestions = []
 
-    while current_date.month == month:
-        if any(a["date"] == current_date.isoformat() for a in assignments):
-            current_date += timedelta(days=1)
-            continue
+GENERATION_MODES = ("greedy", "optimal")
+MAX_BUDGET_MS = 30000
+MAX_IMPROVE_MS = 10000
+FINGERPRINT_CACHE_SIZE = 500  # team-months whose last generate inputs are remembered
 
-        day_name = current_date.strftime("%A")
-
-        # ── Friday-Saturday pair ──
-        if day_name == "Friday":
-            next_day = current_date + timedelta(days=1)
-            pair_in_month = next_day.month == month
-
-            potential = [
-                m for m in members
-                if current_date not in unav_dict[m.id]
-                and (not pair_in_month or next_day not in unav_dict[m.id])
-                and monthly_weekend_count[m.id] < max_weekend
-                and check_gap(m.id, current_date)
-            ]
-
-            if not potential:
-                fri_unav, fri_opt = _build_suggestion_info(
-                    members, current_date, unav_dict, reason_dict,
-                    monthly_normal_count, monthly_thursday_count, monthly_weekend_count,
-                    max_normal, max_thursday, max_weekend,
-                    member_past_count, last_assignment_date, min_gap,
-                )
-                suggestions.append({
-                    "date": current_date.isoformat(),
-                    "day_of_week": "Friday",
-                    "unavailable_members": fri_unav,
-                    "optional_members": fri_opt,
-                })
-                assignments.append({"date": current_date.isoformat(), "day_of_week": "Friday", "member_name": "No one available"})
-                if pair_in_month:
-                    sat_unav, sat_opt = _build_suggestion_info(
-                        members, next_day, unav_dict, reason_dict,
-                        monthly_normal_count, monthly_thursday_count, monthly_weekend_count,
-                        max_normal, max_thursday, max_weekend,
-                        member_past_count, last_assignment_date, min_gap,
-                    )
-                    suggestions.append({
-                        "date": next_day.isoformat(),
-                        "day_of_week": "Saturday",
-                        "unavailable_members": sat_unav,
-                        "optional_members": sat_opt,
-                    })
-                    assignments.append({"date": next_day.isoformat(), "day_of_week": "Saturday", "member_name": "No one available"})
-            else:
-                potential.sort(key=lambda m: sort_key_for_type(m, "weekend"))
-                chosen = potential[0]
-                assignments.append({"date": current_date.isoformat(), "day_of_week": "Friday", "member_name": chosen.name})
-                if pair_in_month:
-                    assignments.append({"date": next_day.isoformat(), "day_of_week": "Saturday", "member_name": chosen.name})
-                    member_past_count[chosen.id] += 2
-                    member_past_weekend[chosen.id] += 1
-                    monthly_weekend_count[chosen.id] += 1
-                    last_assignment_date[chosen.id] = next_day
-                else:
-                    member_past_count[chosen.id] += 1
-                    member_past_weekend[chosen.id] += 1
-                    monthly_weekend_count[chosen.id] += 1
-                    last_assignment_date[chosen.id] = current_date
-
-            current_date = (next_day if pair_in_month else current_date) + timedelta(days=1)
-            continue
 
-        # ── Saturday at start of month ──
-        if current_date.day == 1 and day_name == "Saturday":
-            prev_friday = current_date - timedelta(days=1)
-            friday_shift = (
-                Shift.query.join(Member)
-                .filter(Member.team_id == team_id, Shift.shift_date == prev_friday)
-                .first()
-            )
-            if friday_shift:
-                member = Member.query.get(friday_shift.member_id)
-                if (
-                    member
-                    and current_date not in unav_dict.get(member.id, set())
-                    and monthly_weekend_count.get(member.id, 0) < max_weekend
-                ):
-                    assignments.append({"date": current_date.isoformat(), "day_of_week": "Saturday", "member_name": member.name})
-                    monthly_weekend_count[member.id] += 1
-                    member_past_count[member.id] = member_past_count.get(member.id, 0) + 1
-                    member_past_weekend[member.id] = member_past_weekend.get(member.id, 0) + 1
-                    last_assignment_date[member.id] = current_date
-                    current_date += timedelta(days=1)
-                    continue
-
-        # ── Normal days (Sun-Thu) or unhandled Saturday ──
-        day_type = "thursday" if is_thursday(current_date) else ("weekend" if is_weekend(current_date) else "normal")
-        potential = []
-        for m in members:
-            if current_date in unav_dict[m.id]:
-                continue
-            if not check_gap(m.id, current_date):
-                continue
-            if is_thursday(current_date) and monthly_thursday_count[m.id] >= max_thursday:
-                continue
-            if not is_weekend(current_date) and not is_thursday(current_date) and monthly_normal_count[m.id] >= max_normal:
-                continue
-            potential.append(m)
-
-        if not potential:
-            day_unav, day_opt = _build_suggestion_info(
-                members, current_date, unav_dict, reason_dict,
-                monthly_normal_count, monthly_thursday_count, monthly_weekend_count,
-                max_normal, max_thursday, max_weekend,
-                member_past_count, last_assignment_date, min_gap,
+def _planner_options(data):
+    """``(options, error)`` for ``_plan_night`` from a generate/preview request body."""
+    mode = data.get("mode", "greedy")
+    if mode not in GENERATION_MODES:
+        return None, f"Mode must be one of: {', '.join(GENERATION_MODES)}"
+    try:
+        budget_ms = int(data.get("time_budget_ms") or solver.DEFAULT_BUDGET_MS)
+        improve_ms = int(data.get("improve_ms") or 0)
+        seed = data.get("seed")
+        rng = random.Random(int(seed)) if seed is not None else random
+    except (TypeError, ValueError):
+        return None, "time_budget_ms, improve_ms and seed must be integers"
+    if not (0 < budget_ms <= MAX_BUDGET_MS):
+        return None, f"time_budget_ms must be between 1 and {MAX_BUDGET_MS}"
+    if not (0 <= improve_ms <= MAX_IMPROVE_MS):
+        return None, f"improve_ms must be between 0 and {MAX_IMPROVE_MS}"
+    return {"mode": mode, "budget_ms": budget_ms, "improve_ms": improve_ms, "rng": rng}, None
+
+
+def _plan_night(snapshot, mode="greedy", budget_ms=solver.DEFAULT_BUDGET_MS, improve_ms=0, rng=random):
+    if mode == "optimal":
+        plan = solver.plan_night_shifts_optimal(snapshot, budget_ms, rng)
+    else:
+        plan = planner.plan_night_shifts(snapshot, rng)
+    if improve_ms > 0:
+        plan = solver.improve_night_plan(snapshot, plan, improve_ms, rng)
+    return plan
+
+
+def _canonical(value):
+    """``value`` with sets and tuple-keyed dicts turned into sorted JSON-able lists."""
+    if isinstance(value, dict):
+        return sorted(([_canonical(k), _canonical(v)] for k, v in value.items()), key=repr)
+    if isinstance(value, (set, frozenset)):
+        return sorted((_canonical(v) for v in value), key=repr)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def _generation_fingerprint(ctx, options, seed):
+    """SHA-256 of everything a generate run reads.
+
+    The snapshots carry the member set, unavailability and history counters; the
+    team's effective settings, planner options and seed complete the inputs. Without a
+    seed the fingerprint still matches, so re-running returns the plan already drawn;
+    ``reroll`` on the request skips the lookup to draw a new one.
+    """
+    inputs = {
+        "night": _canonical(asdict(ctx.night)),
+        "shotef": _canonical(asdict(ctx.shotef)) if ctx.shotef else None,
+        "settings": ctx.settings.raw,
+        "options": {k: v for k, v in options.items() if k != "rng"},
+        "seed": int(seed) if seed is not None else None,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def _cached_generation(ctx, fingerprint):
+    """The stored generate response if ``fingerprint`` matches and its rows are untouched, else None."""
+    team_id, year, month = ctx.team_id, ctx.year, ctx.month
+    entry = GenerationFingerprint.query.filter_by(team_id=team_id, year=year, month=month).first()
+    if entry is None or entry.fingerprint != fingerprint:
+        return None
+    payload = json.loads(entry.payload)
+
+    pool = set(ctx.night.member_ids)
+    stored = {(d, member_id) for d, member_id in payload["shifts"]}
+    current = {
+        (d.isoformat(), member_id)
+        for member_id, d in db.session.query(Shift.member_id, Shift.shift_date).filter(
+            Shift.team_id == team_id,
+            Shift.shift_date >= ctx.gen_start,
+            in_month(Shift.shift_date, year, month),
+        )
+    }
+    if stored - current or {r for r in current if r[1] in pool} != {r for r in stored if r[1] in pool}:
+        return None
+    if ctx.shotef is not None:
+        stored_days = {(d, a["member_id"]) for a in payload["result"]["shotef_assignments"] for d in a["days"]}
+        current_days = {
+            (d.isoformat(), member_id)
+            for member_id, d in db.session.query(ShotefDay.member_id, ShotefDay.date).filter(
+                ShotefDay.team_id == team_id, in_month(ShotefDay.date, year, month),
             )
-            suggestions.append({
-                "date": current_date.isoformat(),
-                "day_of_week": day_name,
-                "unavailable_members": day_unav,
-                "optional_members": day_opt,
-            })
-            assignments.append({"date": current_date.isoformat(), "day_of_week": day_name, "member_name": "No one available"})
-        else:
-            potential.sort(key=lambda m: sort_key_for_type(m, day_type))
-            chosen = potential[0]
-            assignments.append({"date": current_date.isoformat(), "day_of_week": day_name, "member_name": chosen.name})
-            if is_thursday(current_date):
-                monthly_thursday_count[chosen.id] += 1
-                member_past_thursday[chosen.id] += 1
-            elif is_weekend(current_date):
-                monthly_weekend_count[chosen.id] += 1
-                member_past_weekend[chosen.id] += 1
-            else:
-                monthly_normal_count[chosen.id] += 1
-            member_past_count[chosen.id] += 1
-            last_assignment_date[chosen.id] = current_date
-
-        current_date += timedelta(days=1)
-
-    # Persist
-    for a in assignments:
-        if a["member_name"] != "No one available":
-            dt = datetime.strptime(a["date"], "%Y-%m-%d").date()
-            member_obj = Member.query.filter_by(team_id=team_id, name=a["member_name"]).first()
-            if member_obj:
-                db.session.add(Shift(shift_date=dt, member_id=member_obj.id))
+        }
+        if stored_days != current_days:
+            return None
+
+    entry.used_at = datetime.utcnow()
     db.session.commit()
+    unchanged = {"kept": sum(1 for r in stored if r[1] in pool), "reassigned": 0, "inserted": 0, "deleted": 0}
+    return {**payload["result"], "diff": unchanged, "cached": True}
+
+
+def _remember_generation(ctx, fingerprint, shifts, result):
+    """Record the fingerprint and response of a plan being persisted, pruning the least recently used.
+
+    Left uncommitted, so it lands in the same transaction as the plan.
+    """
+    payload = json.dumps({"shifts": [[d.isoformat(), member_id] for d, member_id in shifts], "result": result})
+    entry = GenerationFingerprint.query.filter_by(team_id=ctx.team_id, year=ctx.year, month=ctx.month).first()
+    if entry is None:
+        entry = GenerationFingerprint(team_id=ctx.team_id, year=ctx.year, month=ctx.month)
+        db.session.add(entry)
+    entry.fingerprint = fingerprint
+    entry.payload = payload
+    entry.created_at = entry.used_at = datetime.utcnow()
+    db.session.flush()
 
-    return assignments, suggestions
+    stale = [
+        row_id for (row_id,) in db.session.query(GenerationFingerprint.id)
+        .order_by(GenerationFingerprint.used_at.desc(), GenerationFingerprint.id.desc())
+        .offset(FINGERPRINT_CACHE_SIZE)
+    ]
+    if stale:
+        GenerationFingerprint.query.filter(GenerationFingerprint.id.in_(stale)).delete(synchronize_session=False)
+
+
+def generate_or_reuse(ctx, options, seed, reroll=False):
+    """Generate response for ``ctx``: the remembered plan if the inputs are unchanged, else a new one.
+
+    ``reroll`` always plans afresh (and remembers the new plan for the next run).
+    """
+    fingerprint = _generation_fingerprint(ctx, options, seed)
+    if not reroll:
+        cached = _cached_generation(ctx, fingerprint)
+        if cached is not None:
+            return cached
+    result, changes = create_schedule(ctx, **options, fingerprint=fingerprint)
+    return {**result, "diff": changes, "cached": False}
+
+
+def create_schedule(ctx, mode="greedy", budget_ms=solver.DEFAULT_BUDGET_MS, improve_ms=0, rng=random,
+                    fingerprint=None):
+    """Regenerate the month's night shifts and Shotef from ``ctx`` in one transaction.
+
+    ``mode="optimal"`` solves the month globally within ``budget_ms`` and falls back
+    to the greedy plan when that runs out of time or does no better. A positive
+    ``improve_ms`` runs the local-search pass over the result for that long. With a
+    ``fingerprint`` the response is remembered for ``_cached_generation`` in the same
+    commit. Returns ``(response body, night-shift diff counts)``.
+    """
+    night_plan, shotef_plan = _plan_context(ctx, mode, budget_ms, improve_ms, rng)
+    result = _generation_result(night_plan, shotef_plan)
+    if fingerprint:
+        _remember_generation(ctx, fingerprint, night_plan.shifts, result)
+    changes = _persist_team_month(
+        ctx.team_id, ctx.year, ctx.month, ctx.night.member_ids, ctx.gen_start,
+        night_plan, shotef_plan, ctx.shotef is not None,
+    )
+    return result, changes
 
 
-def _build_suggestion_info(members, d, unav_dict, reason_dict,
-                           m_normal, m_thursday, m_weekend,
-                           max_normal, max_thursday, max_weekend,
-                           member_past_count, last_assignment_date, min_gap):
-    """Return (unavailable_members, optional_members) for a date with no eligible member."""
-    unavailable = []
-    optional = []
-    for m in members:
-        reasons = []
-        if d in unav_dict[m.id]:
-            reasons.append(reason_dict.get((m.id, d), "Marked unavailable"))
+def _plan_context(ctx, mode="greedy", budget_ms=solver.DEFAULT_BUDGET_MS, improve_ms=0, rng=random):
+    """``(NightPlan, ShotefPlan)`` for ``ctx``; night shifts draw from ``rng`` first, then Shotef."""
+    night_plan = _plan_night(ctx.night, mode, budget_ms, improve_ms, rng)
+    shotef_plan = planner.plan_shotef(ctx.shotef, rng) if ctx.shotef is not None else planner.ShotefPlan()
+    return night_plan, shotef_plan
+
+
+def _generation_result(night_plan, shotef_plan):
+    result = {
+        "assignments": night_plan.assignments,
+        "suggestions": night_plan.suggestions,
+        "shotef_assignments": shotef_plan.assignments,
+        "shotef_needs_substitute": shotef_plan.needs_substitute,
+    }
+    if night_plan.stats:
+        result["solver"] = night_plan.stats
+    return result
+
+
+def _persist_night_diff(team_id, member_ids, year, month, gen_start, plan):
+    """Bring the month's stored night shifts in line with ``plan`` using bulk statements.
+
+    A day already held by its planned member is kept with its swaps, a day held by
+    another non-leader is reassigned in place (its swaps dropped), planned days with no
+    row are inserted and generated rows the plan no longer wants are deleted. Returns
+    ``{kept, reassigned, inserted, deleted}``.
+    """
+    existing = defaultdict(list)
+    for shift_id, member_id, d in db.session.query(Shift.id, Shift.member_id, Shift.shift_date).filter(
+        Shift.team_id == team_id,
+        Shift.shift_date >= gen_start,
+        in_month(Shift.shift_date, year, month),
+    ).order_by(Shift.id):
+        existing[d].append((shift_id, member_id))
+
+    pool = set(member_ids)
+    planned = dict(plan.shifts)
+    kept, reassign, insert, delete = 0, [], [], []
+    for d in sorted(set(planned) | set(existing)):
+        rows = existing.get(d, [])
+        generated = [(shift_id, member_id) for shift_id, member_id in rows if member_id in pool]
+        want = planned.get(d)
+        if want is None:
+            delete.extend(shift_id for shift_id, _ in generated)
+            continue
+        held = next((shift_id for shift_id, member_id in rows if member_id == want), None)
+        if held is not None:
+            kept += 1
+        elif generated:
+            held, old_member_id = generated[0]
+            reassign.append((held, d, old_member_id, want))
         else:
-            last = last_assignment_date.get(m.id)
-            if last and (d - last).days < min_gap:
-                reasons.append(f"Min gap not met ({min_gap} day{'s' if min_gap != 1 else ''})")
-            if d.weekday() == 3 and m_thursday[m.id] >= max_thursday:
-                reasons.append(f"Reached max Thursday shifts ({max_thursday})")
-            if d.weekday() in (4, 5) and m_weekend[m.id] >= max_weekend:
-                reasons.append(f"Reached max weekend shifts ({max_weekend})")
-            if d.weekday() not in (3, 4, 5) and m_normal[m.id] >= max_normal:
-                reasons.append(f"Reached max normal shifts ({max_normal})")
-            if not reasons:
-                reasons.append("Unknown constraint")
-
-        unavailable.append({"member_name": m.name, "reason": "; ".join(reasons)})
-        optional.append({
-            "member_name": m.name,
-            "shift_count": member_past_count.get(m.id, 0),
-            "reason": "; ".join(reasons),
-        })
+            insert.append({"shift_date": d, "member_id": want, "team_id": team_id})
+        delete.extend(shift_id for shift_id, _ in generated if shift_id != held)
+
+    if delete:
+        ledger.bulk_delete_shifts(db.session, Shift.id.in_(delete))
+    ledger.bulk_reassign_shifts(db.session, reassign)
+    ledger.bulk_insert_shifts(db.session, insert)
+    return {"kept": kept, "reassigned": len(reassign), "inserted": len(insert), "deleted": len(delete)}
+
+
+def _generation_start(year, month):
+    """First day to (re)generate: today for the current month, else the 1st."""
+    today = date.today()
+    if (year, month) == (today.year, today.month):
+        return today
+    return date(year, month, 1)
+
+
+def _lookback_cutoff(year, month, lookback_months):
+    if lookback_months > 0:
+        return date(year, month, 1) - timedelta(days=lookback_months * 30)
+    return None
+
+
+def _shotef_cutoff(year, month, settings):
+    """Shotef history starts at the last settlement, else at the lookback cut-off."""
+    if settings.shotef_settled_at:
+        return settings.shotef_settled_at
+    return _lookback_cutoff(year, month, settings.justice_lookback_months)
+
+
+def _unavailability_by_month(members, months):
+    """Load unavailability for consecutive ``months`` in one query.
+
+    Returns ``{(year, month): (per-member sets of unavailable days, {(member index, day): reason})}``.
+    """
+    index_of = {m.id: i for i, m in enumerate(members)}
+    result = {ym: ([set() for _ in members], {}) for ym in months}
+    if not members:
+        return result
+    rows = Unavailability.query.filter(
+        Unavailability.member_id.in_(list(index_of)),
+        Unavailability.date >= month_bounds(*months[0])[0],
+        Unavailability.date < month_bounds(*months[-1])[1],
+    ).all()
+    for ua in rows:
+        unavailable, reasons = result[(ua.date.year, ua.date.month)]
+        i = index_of[ua.member_id]
+        unavailable[i].add(ua.date.day)
+        reasons[(i, ua.date.day)] = ua.reason
+    return result
+
+
+def _effective_history(members, totals):
+    """(past_count, past_weekend, past_thursday) lists from ledger totals, with swap debt and credit."""
+    past_count, past_weekend, past_thursday = [], [], []
+    for m in members:
+        h = totals[m.id]
+        total = h["normal"] + h["thursday"] + h["weekend"]
+        past_count.append(total - h["covers_done"] + h["covers_received"] + m.shift_credit)
+        past_weekend.append(h["weekend"])
+        past_thursday.append(h["thursday"])
+    return past_count, past_weekend, past_thursday
+
+
+def _prev_friday(team_id, gen_start):
+    """(member_id, name) on the Friday before a month that starts on a Saturday."""
+    if gen_start.day != 1 or gen_start.weekday() != 5:
+        return None
+    friday_shift = Shift.query.filter_by(team_id=team_id, shift_date=gen_start - timedelta(days=1)).first()
+    if friday_shift and friday_shift.member:
+        return (friday_shift.member_id, friday_shift.member.name)
+    return None
+
 
-    optional.sort(key=lambda x: x["shift_count"])
-    return unavailable, optional
+def _night_caps(settings):
+    return {
+        "max_normal": settings.max_normal_shifts,
+        "max_thursday": settings.max_thursday_shifts,
+        "max_weekend": settings.max_weekend_shifts,
+        "min_gap": settings.min_days_between_shifts,
+    }
+
+
+def _night_snapshot(team_id, members, year, month, gen_start, replacing=False, settings=None, unavailability=None):
+    """Load everything the night-shift planner needs for one team-month.
+
+    With ``replacing``, the shifts a regeneration would delete are still in the
+    database; covers on them are left out of the history as if they were gone.
+    ``settings`` and the month's ``(unavailable, reasons)`` are read here unless given.
+    """
+    settings = settings or get_team_settings(team_id)
+    cutoff = _lookback_cutoff(year, month, settings.justice_lookback_months)
+    # ── Justice computation with shift_credit + swap debt ──
+    totals = ledger.member_totals(db.session, [m.id for m in members], since=cutoff, exclude_month=(year, month))
+    if replacing:
+        _drop_replaced_covers(team_id, totals, year, month, gen_start)
+    past_count, past_weekend, past_thursday = _effective_history(members, totals)
+    unavailable, reasons = unavailability or _unavailability_by_month(members, [(year, month)])[(year, month)]
+    return planner.NightSnapshot(
+        year=year,
+        month=month,
+        start_day=gen_start.day,
+        member_ids=[m.id for m in members],
+        names=[m.name for m in members],
+        unavailable=unavailable,
+        reasons=reasons,
+        past_count=past_count,
+        past_weekend=past_weekend,
+        past_thursday=past_thursday,
+        prev_friday=_prev_friday(team_id, gen_start),
+        **_night_caps(settings),
+    )
+
+
+def _drop_replaced_covers(team_id, totals, year, month, gen_start):
+    rows = (
+        db.session.query(ShiftSwap.covering_member_id, ShiftSwap.original_member_id)
+        .join(Shift, ShiftSwap.shift_id == Shift.id)
+        .filter(
+            Shift.team_id == team_id,
+            Shift.member_id.in_(list(totals)),
+            Shift.shift_date >= gen_start,
+            in_month(Shift.shift_date, year, month),
+        )
+        .all()
+    )
+    for covering_id, original_id in rows:
+        if covering_id in totals:
+            totals[covering_id]["covers_done"] -= 1
+        if original_id in totals:
+            totals[original_id]["covers_received"] -= 1
 
 
 # ══════════════════════════════════════
 #  SHOTEF (DAY DUTY) GENERATION
 # ══════════════════════════════════════
 
-def _get_shotef_week_blocks(year, month):
-    """Return list of (week_start_sunday, [days_in_month]) for Sun-Thu blocks."""
-    _, last_day = monthrange(year, month)
-    first = date(year, month, 1)
-    last = date(year, month, last_day)
-
-    blocks = []
-    d = first
-    while d <= last:
-        wd = d.weekday()  # Mon=0 .. Sun=6
-        if wd == 6:  # Sunday
-            week_start = d
-            days = []
-            for offset in range(5):  # Sun-Thu
-                day = d + timedelta(days=offset)
-                if day.month == month and day <= last:
-                    days.append(day)
-            if days:
-                blocks.append((week_start, days))
-            d = d + timedelta(days=5)  # skip to Friday
-        elif wd < 4:  # Mon-Thu at the start of the month (partial week)
-            sun_before = d - timedelta(days=(wd + 1) % 7)
-            days = []
-            cursor = d
-            while cursor.weekday() != 4 and cursor.month == month:
-                days.append(cursor)
-                cursor += timedelta(days=1)
-            if cursor.weekday() == 4 and cursor.month == month:
-                days.append(cursor)
-            if days:
-                blocks.append((sun_before, days))
-            d = cursor + timedelta(days=1)
-        else:
-            d += timedelta(days=1)
+def _shotef_enabled(team_id):
+    return get_team_settings(team_id).shotef_enabled
+
+
+def _delete_shotef_month(team_id, year, month):
+    ShotefDay.query.filter(
+        ShotefDay.team_id == team_id, in_month(ShotefDay.date, year, month),
+    ).delete(synchronize_session="fetch")
+
+
+def _add_shotef_days(team_id, plan):
+    rows = []
+    for a in plan.assignments:
+        for d_str in a["days"]:
+            d = date.fromisoformat(d_str)
+            rows.append({"team_id": team_id, "member_id": a["member_id"], "date": d, "year": d.year, "month": d.month})
+    db.session.bulk_insert_mappings(ShotefDay, rows)
+
 
-    return blocks
+def _shotef_counts(members, windows):
+    """Effective Shotef counts (history + credit) per ``(cutoff, exclude_month)`` window.
 
+    All windows share one grouped query; days before a mid-month cut-off are taken
+    back out with a second, day-level query over just those months.
+    """
+    member_ids = [m.id for m in members]
+    q = db.session.query(
+        ShotefDay.member_id, ShotefDay.year, ShotefDay.month, func.count(ShotefDay.id)
+    ).filter(ShotefDay.member_id.in_(member_ids))
+    cutoffs = [cutoff for cutoff, _ in windows]
+    if all(cutoffs):
+        q = q.filter(ShotefDay.date >= min(cutoffs).replace(day=1))
+    monthly = q.group_by(ShotefDay.member_id, ShotefDay.year, ShotefDay.month).all()
+
+    partial = [c for c in cutoffs if c and c.day > 1]
+    day_rows = db.session.query(ShotefDay.member_id, ShotefDay.date).filter(
+        ShotefDay.member_id.in_(member_ids),
+        ShotefDay.date >= min(partial).replace(day=1),
+        ShotefDay.date < max(partial),
+    ).all() if partial else []
+
+    results = []
+    for cutoff, exclude_month in windows:
+        counts = {m.id: m.shotef_credit for m in members}
+        floor = (cutoff.year, cutoff.month) if cutoff else None
+        for m_id, year, month, n in monthly:
+            if (floor and (year, month) < floor) or (year, month) == exclude_month:
+                continue
+            counts[m_id] += n
+        if cutoff and cutoff.day > 1 and (cutoff.year, cutoff.month) != exclude_month:
+            for m_id, d in day_rows:
+                if cutoff.replace(day=1) <= d < cutoff:
+                    counts[m_id] -= 1
+        results.append([counts[m.id] for m in members])
+    return results
+
+
+def _shotef_snapshot(team_id, members, year, month, settings=None, unavailability=None):
+    """Load everything the Shotef planner needs for one team-month (see ``_night_snapshot``)."""
+    settings = settings or get_team_settings(team_id)
+    counts = _shotef_counts(members, [(_shotef_cutoff(year, month, settings), (year, month))])[0]
+    unavailable, reasons = unavailability or _unavailability_by_month(members, [(year, month)])[(year, month)]
+    return planner.ShotefSnapshot(
+        year=year,
+        month=month,
+        member_ids=[m.id for m in members],
+        names=[m.name for m in members],
+        counts=counts,
+        unavailable=unavailable,
+        reasons=reasons,
+    )
 
-def generate_shotef(team_id, year, month):
-    """Generate Shotef (day duty) weekly rotation for a month using day-level assignments."""
-    shotef_enabled = get_setting("shotef_enabled", team_id)
-    if shotef_enabled.lower() != "true":
-        return [], []
 
+# ══════════════════════════════════════
+#  GENERATION CONTEXT
+# ══════════════════════════════════════
+
+@dataclass
+class GenerationContext:
+    """Everything one team-month regeneration reads, loaded once and shared by both planners."""
+    team_id: int
+    year: int
+    month: int
+    gen_start: date
+    settings: TeamSettings
+    night: planner.NightSnapshot
+    shotef: planner.ShotefSnapshot = None  # None when Shotef is off
+
+
+def load_generation_context(team_id, year, month):
+    """Load a ``GenerationContext`` for regenerating ``year``/``month``, read-only.
+
+    Members, settings and the month's unavailability are each read once and feed both
+    snapshots. Returns None if the team has no members.
+    """
     all_members = Member.query.filter_by(team_id=team_id).all()
+    if not all_members:
+        return None
     members = [m for m in all_members if not m.is_leader]
-    if not members:
-        return [], []
+    settings = get_team_settings(team_id)
+    gen_start = _generation_start(year, month)
+    unavailability = _unavailability_by_month(members, [(year, month)])[(year, month)]
 
-    ShotefDay.query.filter_by(team_id=team_id, year=year, month=month).delete(synchronize_session="fetch")
-    db.session.flush()
+    night = _night_snapshot(
+        team_id, members, year, month, gen_start, replacing=True, settings=settings, unavailability=unavailability,
+    )
+    shotef = None
+    if settings.shotef_enabled and members:
+        shotef = _shotef_snapshot(team_id, members, year, month, settings=settings, unavailability=unavailability)
+    return GenerationContext(team_id, year, month, gen_start, settings, night, shotef)
 
-    lookback_months = int(get_setting("justice_lookback_months", team_id))
-    settled_at_str = get_setting("shotef_settled_at", team_id)
 
-    cutoff = None
-    if settled_at_str:
+# ══════════════════════════════════════
+#  ALL-TEAMS GENERATION
+# ══════════════════════════════════════
+
+def _persist_team_month(team_id, year, month, member_ids, gen_start, night_plan, shotef_plan, with_shotef):
+    """Replace the month's generated rows with ``night_plan``/``shotef_plan`` and commit.
+
+    Returns the night-shift diff counts from ``_persist_night_diff``.
+    """
+    changes = _persist_night_diff(team_id, member_ids, year, month, gen_start, night_plan)
+    if with_shotef:
+        _delete_shotef_month(team_id, year, month)
+        db.session.flush()
+    _add_shotef_days(team_id, shotef_plan)
+    db.session.commit()
+    return changes
+
+
+def _plan_in_processes(jobs, max_workers=None):
+    """Run ``planner.plan_team_month(*args)`` for each ``{key: args}`` on a process pool.
+
+    Returns ``({key: result or exception}, workers used)``.
+    """
+    if not jobs:
+        return {}, 0
+    workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(planner.plan_team_month, *args): key for key, args in jobs.items()}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    return results, workers
+
+
+def generate_all_teams(year, month, max_workers=None):
+    """Generate ``year``/``month`` for every team, planning the teams in parallel processes.
+
+    Teams are snapshotted one by one (reads only), planned on a process pool, then
+    each team's result is persisted and committed on its own, so one failing team is
+    reported without aborting the rest.
+    """
+    started = _time.perf_counter()
+    teams = db.session.query(Team.id, Team.name).order_by(Team.id).all()
+    report = {team_id: {"team_id": team_id, "team_name": name, "status": "ok"} for team_id, name in teams}
+    jobs = {}
+
+    for team_id, _ in teams:
+        entry = report[team_id]
+        t0 = _time.perf_counter()
         try:
-            cutoff = datetime.strptime(settled_at_str, "%Y-%m-%d").date()
-        except ValueError:
-            pass
-    if not cutoff and lookback_months > 0:
-        cutoff = date(year, month, 1) - timedelta(days=lookback_months * 30)
+            ctx = load_generation_context(team_id, year, month)
+            if ctx is None:
+                entry.update(status="skipped", error="No members found for this team")
+            else:
+                jobs[team_id] = (ctx.night, ctx.shotef, random.getrandbits(64))
+        except Exception as e:
+            logger.exception("Snapshot failed for team %s", team_id)
+            entry.update(status="error", error=str(e))
+        entry["snapshot_ms"] = round((_time.perf_counter() - t0) * 1000, 1)
+
+    plans, workers = _plan_in_processes(jobs, max_workers)
+
+    for team_id in sorted(plans):
+        entry = report[team_id]
+        if isinstance(plans[team_id], Exception):
+            logger.error("Planning failed for team %s: %s", team_id, plans[team_id])
+            entry.update(status="error", error=str(plans[team_id]))
+            continue
+        night_plan, shotef_plan, elapsed = plans[team_id]
+        night, shotef, _ = jobs[team_id]
+        entry["plan_ms"] = round(elapsed * 1000, 1)
+        t0 = _time.perf_counter()
+        try:
+            changes = _persist_team_month(
+                team_id, year, month, night.member_ids, date(year, month, night.start_day),
+                night_plan, shotef_plan, shotef is not None,
+            )
+            entry.update(
+                diff=changes,
+                shifts=len(night_plan.shifts),
+                unfilled=len(night_plan.suggestions),
+                shotef_days=sum(len(a["days"]) for a in shotef_plan.assignments),
+            )
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Persisting schedule failed for team %s", team_id)
+            entry.update(status="error", error=str(e))
+        entry["persist_ms"] = round((_time.perf_counter() - t0) * 1000, 1)
+
+    return {
+        "year": year,
+        "month": month,
+        "workers": workers,
+        "elapsed_ms": round((_time.perf_counter() - started) * 1000, 1),
+        "teams": [report[team_id] for team_id, _ in teams],
+    }
+
+
+MAX_SIMULATION_RUNS = 64
+
+
+def simulate_schedule(team_id, year, month, runs, persist=False, max_workers=None):
+    """Plan the month ``runs`` times with different seeds and keep the best plan.
+
+    One snapshot feeds every run; runs are planned on a process pool and ranked by
+    ``solver.plan_score`` (unfilled nights, then fairness, then Shotef spread). Only
+    the best plan is persisted, and only if ``persist``. Its seed, passed as ``seed``
+    to the generate endpoint, reproduces it while the team's data is unchanged.
+    """
+    started = _time.perf_counter()
+    ctx = load_generation_context(team_id, year, month)
+    if ctx is None:
+        raise ValueError("No members found for this team")
+    night, shotef = ctx.night, ctx.shotef
+
+    seeds = random.sample(range(2 ** 31), runs)
+    plans, workers = _plan_in_processes({seed: (night, shotef, seed) for seed in seeds}, max_workers)
+    failed = [seed for seed in seeds if isinstance(plans[seed], Exception)]
+    if len(failed) == len(seeds):
+        raise plans[failed[0]]
+
+    scored = []
+    for seed in seeds:
+        if seed in failed:
+            continue
+        night_plan, shotef_plan, elapsed = plans[seed]
+        score = solver.plan_score(night, shotef, night_plan, shotef_plan)
+        scored.append({"seed": seed, **score, "plan_ms": round(elapsed * 1000, 1)})
+    best = min(scored, key=lambda r: (r["unfilled"], r["fairness"], r["shotef_spread"]))
+    night_plan, shotef_plan, _ = plans[best["seed"]]
+
+    if persist:
+        _persist_team_month(
+            team_id, year, month, night.member_ids, date(year, month, night.start_day),
+            night_plan, shotef_plan, shotef is not None,
+        )
+        logger.info("Persisted simulated schedule for team %s %d-%02d (seed %s)", team_id, year, month, best["seed"])
+
+    return {
+        "runs": scored,
+        "failed_runs": len(failed),
+        "best": {
+            **best,
+            "assignments": night_plan.assignments,
+            "suggestions": night_plan.suggestions,
+            "shotef_assignments": shotef_plan.assignments,
+            "shotef_needs_substitute": shotef_plan.needs_substitute,
+        },
+        "persisted": persist,
+        "workers": workers,
+        "elapsed_ms": round((_time.perf_counter() - started) * 1000, 1),
+    }
+
+
+@app.route("/api/teams/<int:team_id>/schedule/simulate", methods=["POST"])
+@invalidates("team", "teams", "reports")
+def api_simulate_schedule(team_id):
+    """Run several seeded plans of a month in parallel; return (and optionally save) the best."""
+    try:
+        Team.query.get_or_404(team_id)
+        data = request.get_json() or {}
+        year = data.get("year")
+        month = data.get("month")
+
+        if not year or not month:
+            return json_error("Year and month are required")
+        year, month = int(year), int(month)
+        if not (1 <= month <= 12):
+            return json_error("Month must be between 1 and 12")
+        runs = int(data.get("runs") or 8)
+        if not (1 <= runs <= MAX_SIMULATION_RUNS):
+            return json_error(f"Runs must be between 1 and {MAX_SIMULATION_RUNS}")
+        persist = bool(data.get("persist", False))
+
+        today = date.today()
+        if date(year, month, 1) < date(today.year, today.month, 1):
+            return json_error("Cannot generate schedules for past months. Use 'Past Shifts' to add historical data.")
+
+        if not Member.query.filter_by(team_id=team_id).first():
+            return json_error("No members found for this team")
+
+        return jsonify(simulate_schedule(team_id, year, month, runs, persist=persist))
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Schedule simulation failed")
+        return json_error(str(e), 500)
+
+
+@app.route("/api/schedule/generate-all", methods=["POST"])
+@invalidates("global", "teams", "reports")
+def api_generate_all():
+    """Generate one month for every team; per-team status and timings in the response."""
+    data = request.get_json() or {}
+    year = data.get("year")
+    month = data.get("month")
+
+    if not year or not month:
+        return json_error("Year and month are required")
+    year, month = int(year), int(month)
+    if not (1 <= month <= 12):
+        return json_error("Month must be between 1 and 12")
+
+    today = date.today()
+    if date(year, month, 1) < date(today.year, today.month, 1):
+        return json_error("Cannot generate schedules for past months. Use 'Past Shifts' to add historical data.")
+
+    return jsonify(generate_all_teams(year, month))
+
+
+@app.cli.command("generate-all")
+@click.argument("year", type=int)
+@click.argument("month", type=click.IntRange(1, 12))
+@click.option("--workers", type=int, default=None, help="Planner processes (default: one per core).")
+def generate_all_command(year, month, workers):
+    """Generate YEAR/MONTH for every team, planning teams in parallel."""
+    result = generate_all_teams(year, month, max_workers=workers)
+    _cache_bump("global", "teams", "reports")  # reaches the servers when they share a SQLite cache
+    for t in result["teams"]:
+        timings = " ".join(f"{k}={t[k]}" for k in ("snapshot_ms", "plan_ms", "persist_ms") if k in t)
+        detail = t.get("error") or f"{t['shifts']} shifts, {t['unfilled']} unfilled, {t['shotef_days']} shotef days"
+        click.echo(f"[{t['status']}] {t['team_name']}: {detail} ({timings})")
+    click.echo(f"{len(result['teams'])} team(s) in {result['elapsed_ms']} ms on {result['workers']} worker(s)")
+    if any(t["status"] == "error" for t in result["teams"]):
+        raise click.ClickException("Some teams failed")
+
+
+# ══════════════════════════════════════
+#  MULTI-MONTH HORIZON GENERATION
+# ══════════════════════════════════════
+
+MAX_HORIZON_MONTHS = 12
 
+
+def _horizon_months(year, month, months):
+    result = []
+    for _ in range(months):
+        result.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return result
+
+
+def create_horizon(team_id, year, month, months):
+    """Plan night shifts and Shotef for ``months`` consecutive months in one transaction.
+
+    Inputs are loaded once; each month's fairness counters are the stored history for
+    its own lookback window plus whatever earlier months of the horizon planned inside
+    that window, so later months see earlier choices before anything is committed.
+    Each month's night shifts are written with ``_persist_night_diff``, as a single
+    generate does, so unchanged shifts keep their ids and swaps.
+    """
+    all_members = Member.query.filter_by(team_id=team_id).all()
+    members = [m for m in all_members if not m.is_leader]
     member_ids = [m.id for m in members]
-    count_q = db.session.query(ShotefDay.member_id, func.count(ShotefDay.id)).filter(
-        ShotefDay.member_id.in_(member_ids),
-        ~((ShotefDay.year == year) & (ShotefDay.month == month)),
-    )
-    if cutoff:
-        count_q = count_q.filter(ShotefDay.date >= cutoff)
-    shotef_counts = dict(count_q.group_by(ShotefDay.member_id).all())
-    for m in members:
-        shotef_counts.setdefault(m.id, 0)
-        shotef_counts[m.id] += m.shotef_credit
-
-    unav_dict = {m.id: set() for m in members}
-    reason_dict = {}
-    all_unav = Unavailability.query.filter(
-        Unavailability.member_id.in_(member_ids),
-        extract("year", Unavailability.date) == year,
-        extract("month", Unavailability.date) == month,
+    index_of = {m_id: i for i, m_id in enumerate(member_ids)}
+    horizon = _horizon_months(year, month, months)
+    gen_start = _generation_start(year, month)
+    horizon_end = month_bounds(*horizon[-1])[1]
+    shotef_on = _shotef_enabled(team_id) and bool(members)
+
+    # Generated shifts already stored in the horizon are diffed away month by month
+    # below, so no month may count them as history.
+    stored = db.session.query(Shift.member_id, Shift.shift_date).filter(
+        Shift.team_id == team_id,
+        Shift.member_id.in_(member_ids),
+        Shift.shift_date >= gen_start,
+        Shift.shift_date < horizon_end,
     ).all()
-    for ua in all_unav:
-        unav_dict[ua.member_id].add(ua.date)
-        reason_dict[(ua.member_id, ua.date)] = ua.reason
-
-    week_blocks = _get_shotef_week_blocks(year, month)
-
-    shotef_assignments = []
-    shotef_needs_substitute = []
-    assigned_this_month = set()
-
-    for week_start, days in week_blocks:
-        eligible = [m for m in members if m.id not in assigned_this_month]
-        if not eligible:
-            eligible = list(members)
-
-        eligible.sort(key=lambda m: (shotef_counts.get(m.id, 0), random.random()))
-        chosen = eligible[0]
-        assigned_this_month.add(chosen.id)
-
-        created_days = []
-        unavailable_days = []
-        for d in days:
-            sd = ShotefDay(team_id=team_id, member_id=chosen.id, date=d, year=year, month=month)
-            db.session.add(sd)
-            created_days.append(sd)
-            if d in unav_dict[chosen.id]:
-                unavailable_days.append(d)
-
-        shotef_counts[chosen.id] = shotef_counts.get(chosen.id, 0) + len(days)
-
-        shotef_assignments.append({
-            "week_start": week_start.isoformat(),
-            "member_name": chosen.name,
-            "member_id": chosen.id,
-            "days": [d.isoformat() for d in days],
-            "unavailable_days": [d.isoformat() for d in unavailable_days],
-        })
+    if shotef_on:
+        ShotefDay.query.filter(
+            ShotefDay.team_id == team_id,
+            ShotefDay.date >= date(year, month, 1),
+            ShotefDay.date < horizon_end,
+        ).delete(synchronize_session="fetch")
+    db.session.flush()
 
-        for ud in unavailable_days:
-            optional = []
-            for m in members:
-                if m.id == chosen.id:
-                    continue
-                optional.append({
-                    "member_name": m.name,
-                    "member_id": m.id,
-                    "shotef_count": shotef_counts.get(m.id, 0),
-                    "is_unavailable": ud in unav_dict[m.id],
-                })
-            optional.sort(key=lambda x: (x["is_unavailable"], x["shotef_count"], random.random()))
-            shotef_needs_substitute.append({
-                "member_name": chosen.name,
-                "date": ud.isoformat(),
-                "day_of_week": ud.strftime("%A"),
-                "reason": reason_dict.get((chosen.id, ud), "Marked unavailable"),
-                "optional_members": optional,
-            })
+    settings = get_team_settings(team_id)
+    lookback_months = settings.justice_lookback_months
+    cutoffs = [_lookback_cutoff(y, m, lookback_months) for y, m in horizon]
+    history = ledger.member_totals_windows(db.session, member_ids, list(zip(cutoffs, horizon)))
+    unavailability = _unavailability_by_month(members, horizon)
+    caps = _night_caps(settings)
+    if shotef_on:
+        shotef_cutoffs = [_shotef_cutoff(y, m, settings) for y, m in horizon]
+        shotef_history = _shotef_counts(members, list(zip(shotef_cutoffs, horizon)))
+    prev_friday = _prev_friday(team_id, gen_start)
+
+    planned_shifts = []  # (date, member index) across the horizon so far
+    planned_shotef = []
+    results = []
+    for k, (y, m) in enumerate(horizon):
+        for member_id, d in stored:
+            if (d.year, d.month) != (y, m) and (cutoffs[k] is None or d >= cutoffs[k]):
+                history[k][member_id][ledger.shift_kind(d)] -= 1
+        past_count, past_weekend, past_thursday = _effective_history(members, history[k])
+        for d, i in planned_shifts:
+            if cutoffs[k] is None or d >= cutoffs[k]:
+                past_count[i] += 1
+                kind = planner.day_type(d)
+                if kind == "weekend":
+                    past_weekend[i] += 1
+                elif kind == "thursday":
+                    past_thursday[i] += 1
+
+        start = gen_start if k == 0 else date(y, m, 1)
+        unavailable, reasons = unavailability[(y, m)]
+        plan = planner.plan_night_shifts(planner.NightSnapshot(
+            year=y,
+            month=m,
+            start_day=start.day,
+            member_ids=member_ids,
+            names=[mem.name for mem in members],
+            unavailable=unavailable,
+            reasons=reasons,
+            past_count=past_count,
+            past_weekend=past_weekend,
+            past_thursday=past_thursday,
+            prev_friday=prev_friday,
+            **caps,
+        ))
+        changes = _persist_night_diff(team_id, member_ids, y, m, start, plan)
+        planned_shifts.extend((shift_date, index_of[member_id]) for shift_date, member_id in plan.shifts)
+
+        # Carry the Friday/Saturday pairing into a next month that starts on Saturday.
+        next_first = month_bounds(y, m)[1]
+        prev_friday = None
+        if next_first.weekday() == 5:
+            friday = next_first - timedelta(days=1)
+            prev_friday = next(
+                ((member_id, members[index_of[member_id]].name)
+                 for shift_date, member_id in plan.shifts if shift_date == friday),
+                None,
+            )
+
+        shotef_plan = planner.ShotefPlan()
+        if shotef_on:
+            counts = list(shotef_history[k])
+            for d, i in planned_shotef:
+                if shotef_cutoffs[k] is None or d >= shotef_cutoffs[k]:
+                    counts[i] += 1
+            shotef_plan = planner.plan_shotef(planner.ShotefSnapshot(
+                year=y,
+                month=m,
+                member_ids=member_ids,
+                names=[mem.name for mem in members],
+                counts=counts,
+                unavailable=unavailable,
+                reasons=reasons,
+            ))
+            _add_shotef_days(team_id, shotef_plan)
+            for a in shotef_plan.assignments:
+                planned_shotef.extend((date.fromisoformat(d), index_of[a["member_id"]]) for d in a["days"])
+
+        results.append({
+            "year": y,
+            "month": m,
+            "assignments": plan.assignments,
+            "suggestions": plan.suggestions,
+            "shotef_assignments": shotef_plan.assignments,
+            "shotef_needs_substitute": shotef_plan.needs_substitute,
+            "diff": changes,
+        })
 
     db.session.commit()
-    return shotef_assignments, shotef_needs_substitute
+    return results
+
+
+# ══════════════════════════════════════
+#  GENERATION JOBS
+# ══════════════════════════════════════
+
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", "2"))
+JOB_OPTION_FIELDS = ("mode", "time_budget_ms", "improve_ms", "seed", "reroll")
+_job_pool = ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="generate")
+
+
+def submit_generation_job(team_id, year, month, options=None):
+    """Queue a generation for ``team_id``/``year``/``month``, or return the one already active.
+
+    ``options`` holds the generate request's planner fields (``mode``, ``seed``,
+    ``reroll``, ...), already checked by ``_planner_options``. Returns ``(job, created)``.
+    """
+    active_key = f"{team_id}:{year}:{month}"
+    existing = GenerationJob.query.filter_by(active_key=active_key).first()
+    if existing and not _job_is_stale(existing):
+        return existing, False
+    if existing:
+        _fail_stale_job(existing)
+        db.session.flush()
+    job = GenerationJob(
+        team_id=team_id, year=year, month=month, status="queued", active_key=active_key, owner=_job_owner(),
+        options=json.dumps(options or {}),
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request queued the same team-month between our check and insert.
+        db.session.rollback()
+        return GenerationJob.query.filter_by(active_key=active_key).one(), False
+    _job_pool.submit(_run_generation_job, job.id)
+    return job, True
+
+
+def _run_generation_job(job_id):
+    with app.app_context():
+        job = db.session.get(GenerationJob, job_id)
+        if job is None or job.status != "queued":  # failed as stale before a worker got to it
+            return
+        team_id, year, month = job.team_id, job.year, job.month
+        data = json.loads(job.options or "{}")
+
+        result, error = None, None
+        try:
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+            options, problem = _planner_options(data)
+            if problem:
+                raise ValueError(problem)
+            ctx = load_generation_context(team_id, year, month)
+            if ctx is None:
+                raise ValueError("No members found for this team")
+            result = generate_or_reuse(ctx, options, data.get("seed"), reroll=bool(data.get("reroll")))
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Generation job %s failed", job_id)
+            error = str(e)
+
+        job = db.session.get(GenerationJob, job_id)
+        job.status = "done" if error is None else "failed"
+        job.result = json.dumps(result) if result is not None else None
+        job.error = error
+        job.active_key = None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        # Runs outside any request, so ``invalidates`` can't bump these for us.
+        if error is None and not result["cached"]:
+            _cache_bump(f"team:{team_id}", "teams", "reports")
+
+
+@app.route("/api/teams/<int:team_id>/schedule/generate-jobs", methods=["POST"])
+def api_submit_generation_job(team_id):
+    """Start generating a month in the background; repeated submits attach to the active job."""
+    Team.query.get_or_404(team_id)
+    data = request.get_json() or {}
+    year = data.get("year")
+    month = data.get("month")
+
+    if not year or not month:
+        return json_error("Year and month are required")
+    year, month = int(year), int(month)
+    if not (1 <= month <= 12):
+        return json_error("Month must be between 1 and 12")
+    _, error = _planner_options(data)
+    if error:
+        return json_error(error)
+
+    today = date.today()
+    if date(year, month, 1) < date(today.year, today.month, 1):
+        return json_error("Cannot generate schedules for past months. Use 'Past Shifts' to add historical data.")
+
+    if not Member.query.filter_by(team_id=team_id).first():
+        return json_error("No members found for this team")
+
+    options = {k: data[k] for k in JOB_OPTION_FIELDS if data.get(k) is not None}
+    job, created = submit_generation_job(team_id, year, month, options)
+    return jsonify({"job": job.to_dict()}), 202 if created else 200
+
+
+@app.route("/api/generation-jobs/<int:job_id>", methods=["GET"])
+def api_get_generation_job(job_id):
+    job = GenerationJob.query.get_or_404(job_id)
+    return jsonify({"job": job.to_dict()})
 
 
 # ══════════════════════════════════════
@@ -1052,14 +2073,13 @@ def api_get_schedule(team_id):
         return json_error("Year and month are required")
 
     shifts = (
-        Shift.query.join(Member)
+        Shift.query
         .options(
             joinedload(Shift.member),
             subqueryload(Shift.swaps).joinedload(ShiftSwap.original_member),
         )
-        .filter(Member.team_id == team_id)
-        .filter(extract("year", Shift.shift_date) == year)
-        .filter(extract("month", Shift.shift_date) == month)
+        .filter(Shift.team_id == team_id)
+        .filter(in_month(Shift.shift_date, year, month))
         .order_by(Shift.shift_date)
         .all()
     )
@@ -1067,6 +2087,7 @@ def api_get_schedule(team_id):
 
 
 @app.route("/api/teams/<int:team_id>/schedule", methods=["DELETE"])
+@invalidates("team", "teams", "reports")
 def api_delete_schedule(team_id):
     Team.query.get_or_404(team_id)
     year = request.args.get("year", type=int)
@@ -1074,14 +2095,10 @@ def api_delete_schedule(team_id):
     if not year or not month:
         return json_error("Year and month are required")
 
-    start_dt = date(year, month, 1)
-    end_dt = date(year, month, monthrange(year, month)[1])
-    Shift.query.filter(
-        Shift.member_id.in_([m.id for m in Member.query.filter_by(team_id=team_id).all()]),
-        Shift.shift_date >= start_dt,
-        Shift.shift_date <= end_dt,
+    ledger.bulk_delete_shifts(db.session, Shift.team_id == team_id, in_month(Shift.shift_date, year, month))
+    ShotefDay.query.filter(
+        ShotefDay.team_id == team_id, in_month(ShotefDay.date, year, month),
     ).delete(synchronize_session="fetch")
-    ShotefDay.query.filter_by(team_id=team_id, year=year, month=month).delete(synchronize_session="fetch")
     db.session.commit()
     return jsonify({"message": "Schedule deleted"})
 
@@ -1095,10 +2112,9 @@ def api_export_schedule(team_id):
         return json_error("Year and month are required")
 
     shifts = (
-        Shift.query.join(Member)
-        .filter(Member.team_id == team_id)
-        .filter(extract("year", Shift.shift_date) == year)
-        .filter(extract("month", Shift.shift_date) == month)
+        Shift.query
+        .filter(Shift.team_id == team_id)
+        .filter(in_month(Shift.shift_date, year, month))
         .order_by(Shift.shift_date)
         .all()
     )
@@ -1137,10 +2153,10 @@ def api_schedule_view(team_id):
     if not year or not month:
         return json_error("Year and month are required")
 
-    cache_key = f"/teams/{team_id}/schedule-view/{year}/{month}"
+    cache_key = _cache_key(f"/teams/{team_id}/schedule-view/{year}/{month}", *_team_scopes(team_id))
     cached = _cache_get(cache_key)
     if cached is not None:
-        return jsonify(cached)
+        return _cached_response(cached)
 
     team = Team.query.get_or_404(team_id)
 
@@ -1158,14 +2174,13 @@ def api_schedule_view(team_id):
     ) if member_ids else {}
 
     shifts = (
-        Shift.query.join(Member)
+        Shift.query
         .options(
             joinedload(Shift.member),
             subqueryload(Shift.swaps).joinedload(ShiftSwap.original_member),
         )
-        .filter(Member.team_id == team_id)
-        .filter(extract("year", Shift.shift_date) == year)
-        .filter(extract("month", Shift.shift_date) == month)
+        .filter(Shift.team_id == team_id)
+        .filter(in_month(Shift.shift_date, year, month))
         .order_by(Shift.shift_date)
         .all()
     )
@@ -1173,7 +2188,7 @@ def api_schedule_view(team_id):
     shotef_days = (
         ShotefDay.query
         .options(joinedload(ShotefDay.member))
-        .filter_by(team_id=team_id, year=year, month=month)
+        .filter(ShotefDay.team_id == team_id, in_month(ShotefDay.date, year, month))
         .order_by(ShotefDay.date).all()
     )
 
@@ -1189,8 +2204,7 @@ def api_schedule_view(team_id):
         "shifts": [s.to_dict() for s in shifts],
         "shotef_days": [d.to_dict() for d in shotef_days],
     }
-    _cache_set(cache_key, result)
-    return jsonify(result)
+    return _cached_response(_cache_set(cache_key, result))
 
 
 @app.route("/api/teams/<int:team_id>/past-shifts-view", methods=["GET"])
@@ -1201,24 +2215,24 @@ def api_past_shifts_view(team_id):
     if not year or not month:
         return json_error("Year and month are required")
 
-    cache_key = f"/teams/{team_id}/past-shifts-view/{year}/{month}"
+    cache_key = _cache_key(f"/teams/{team_id}/past-shifts-view/{year}/{month}", *_team_scopes(team_id))
     cached = _cache_get(cache_key)
     if cached is not None:
-        return jsonify(cached)
+        return _cached_response(cached)
 
     team = Team.query.get_or_404(team_id)
 
     members = Member.query.filter_by(team_id=team_id).all()
 
     shifts_query = (
-        Shift.query.join(Member)
+        Shift.query
         .options(
             joinedload(Shift.member),
             subqueryload(Shift.swaps).joinedload(ShiftSwap.original_member),
             subqueryload(Shift.swaps).joinedload(ShiftSwap.covering_member),
         )
-        .filter(Member.team_id == team_id)
-        .filter(extract("year", Shift.shift_date) == year, extract("month", Shift.shift_date) == month)
+        .filter(Shift.team_id == team_id)
+        .filter(in_month(Shift.shift_date, year, month))
         .order_by(Shift.shift_date.desc())
         .all()
     )
@@ -1236,7 +2250,7 @@ def api_past_shifts_view(team_id):
     shotef_days = (
         ShotefDay.query
         .options(joinedload(ShotefDay.member))
-        .filter_by(team_id=team_id, year=year, month=month)
+        .filter(ShotefDay.team_id == team_id, in_month(ShotefDay.date, year, month))
         .order_by(ShotefDay.date).all()
     )
 
@@ -1246,8 +2260,13 @@ def api_past_shifts_view(team_id):
         "shifts": date_map,
         "shotef_days": [d.to_dict() for d in shotef_days],
     }
-    _cache_set(cache_key, result)
-    return jsonify(result)
+    return _cached_response(_cache_set(cache_key, result))
+
+
+@app.route("/api/cache/stats", methods=["GET"])
+def api_cache_stats():
+    """Response-cache size and this process's hit/miss/eviction counters."""
+    return jsonify(_resp_cache.stats())
 
 
 # ══════════════════════════════════════
@@ -1261,20 +2280,17 @@ def api_get_past_shifts(team_id):
     month = request.args.get("month", type=int)
 
     query = (
-        Shift.query.join(Member)
+        Shift.query
         .options(
             joinedload(Shift.member),
             subqueryload(Shift.swaps).joinedload(ShiftSwap.original_member),
             subqueryload(Shift.swaps).joinedload(ShiftSwap.covering_member),
         )
-        .filter(Member.team_id == team_id)
+        .filter(Shift.team_id == team_id)
         .order_by(Shift.shift_date.desc())
     )
     if year and month:
-        query = query.filter(
-            extract("year", Shift.shift_date) == year,
-            extract("month", Shift.shift_date) == month,
-        )
+        query = query.filter(in_month(Shift.shift_date, year, month))
 
     shifts = query.all()
     date_map = defaultdict(list)
@@ -1292,6 +2308,7 @@ def api_get_past_shifts(team_id):
 
 
 @app.route("/api/teams/<int:team_id>/past-shifts", methods=["POST"])
+@invalidates("team", "teams", "reports")
 def api_bulk_add_past_shifts(team_id):
     Team.query.get_or_404(team_id)
     data = request.get_json() or {}
@@ -1302,23 +2319,29 @@ def api_bulk_add_past_shifts(team_id):
     if member.team_id != team_id:
         return json_error("Member does not belong to this team")
 
-    added = 0
-    for d_str in shift_dates:
-        try:
-            d_obj = datetime.strptime(d_str, "%Y-%m-%d").date()
-        except ValueError:
-            continue
-        existing = Shift.query.filter_by(member_id=member.id, shift_date=d_obj).first()
-        if not existing:
-            db.session.add(Shift(shift_date=d_obj, member_id=member.id))
-            added += 1
-    db.session.commit()
+    parsed, results = _parse_bulk_dates(shift_dates)
+    existing = {
+        d for (d,) in db.session.query(Shift.shift_date)
+        .filter(Shift.member_id == member.id, Shift.shift_date.in_(list(parsed)))
+    } if parsed else set()
+    try:
+        ledger.bulk_insert_shifts(db.session, [
+            {"shift_date": d, "member_id": member.id, "team_id": team_id} for d in parsed if d not in existing
+        ])
+        db.session.commit()
+    except ledger.ShiftConflict as e:
+        db.session.rollback()
+        return json_error(f"{e}; please retry", 409)
 
+    for d, result in parsed.items():
+        result["status"] = "exists" if d in existing else "added"
+    added = len(parsed) - len(existing)
     msg = f"{added} shift{'s' if added != 1 else ''} added"
-    return jsonify({"message": msg}), 201
+    return jsonify({"message": msg, "count": added, "results": results}), 201
 
 
 @app.route("/api/shifts/<int:shift_id>", methods=["PUT"])
+@invalidates("team", "teams", "reports")
 def api_reassign_shift(shift_id):
     """Directly reassign a shift to a different member (not a swap)."""
     shift = Shift.query.get_or_404(shift_id)
@@ -1328,11 +2351,13 @@ def api_reassign_shift(shift_id):
         return json_error("member_id is required")
     member = Member.query.get_or_404(new_member_id)
     shift.member_id = member.id
+    shift.team_id = member.team_id
     db.session.commit()
     return jsonify(shift.to_dict(member_name=member.name))
 
 
 @app.route("/api/shifts/<int:shift_id>", methods=["DELETE"])
+@invalidates("team", "teams", "reports")
 def api_delete_shift(shift_id):
     shift = Shift.query.get_or_404(shift_id)
     db.session.delete(shift)
@@ -1340,6 +2365,63 @@ def api_delete_shift(shift_id):
     return jsonify({"message": "Shift deleted"})
 
 
+# ══════════════════════════════════════
+#  HISTORY IMPORT
+# ══════════════════════════════════════
+
+@app.route("/api/history/import", methods=["POST"])
+@invalidates("global", "teams", "reports")
+def api_import_history():
+    """Load past shifts, swaps and Shotef days for any teams from an uploaded CSV/XLSX ``file``.
+
+    Form field ``dry_run=1`` validates and counts without writing. Chunks already
+    loaded stay committed if a later one fails.
+    """
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        return json_error("A .csv or .xlsx file is required")
+    dry_run = request.form.get("dry_run", "").lower() in ("1", "true", "yes")
+    try:
+        rows = history_import.read_rows(upload.stream, upload.filename)
+        return jsonify(history_import.import_history(db.session, rows, dry_run=dry_run))
+    except history_import.ImportFileError as e:
+        return json_error(str(e))
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("History import failed")
+        return json_error(str(e), 500)
+
+
+@app.cli.command("import-history")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--dry-run", is_flag=True, help="Validate and count rows without writing.")
+def import_history_command(path, dry_run):
+    """Load past shifts, swaps and Shotef days from the CSV or XLSX file at PATH."""
+    def progress(report):
+        click.echo(
+            f"chunk {report['chunks']}: {report['rows']} rows read, {report['shifts']} shifts, "
+            f"{report['swaps']} swaps, {report['shotef_days']} shotef days, {report['error_count']} errors"
+        )
+
+    with open(path, "rb") as f:
+        try:
+            report = history_import.import_history(
+                db.session, history_import.read_rows(f, path), dry_run=dry_run, progress=progress,
+            )
+        except history_import.ImportFileError as e:
+            raise click.ClickException(str(e))
+    if not dry_run:
+        _cache_bump("global", "teams", "reports")  # reaches the servers when they share a SQLite cache
+    for err in report["errors"]:
+        click.echo(f"row {err['row']}: {err['error']}")
+    click.echo(
+        f"{'Checked' if dry_run else 'Imported'} {report['rows']} rows for {report['teams']} team(s) "
+        f"in {report['elapsed_ms']} ms: {report['shifts']} shifts, {report['swaps']} swaps, "
+        f"{report['shotef_days']} shotef days; {report['exists']} already present, "
+        f"{report['duplicates']} duplicates, {report['error_count']} errors"
+    )
+
+
 # ══════════════════════════════════════
 #  SAVED SCHEDULES (grouped by month)
 # ══════════════════════════════════════
@@ -1348,12 +2430,12 @@ def api_delete_shift(shift_id):
 def api_get_saved_schedules(team_id):
     Team.query.get_or_404(team_id)
     shifts = (
-        Shift.query.join(Member)
+        Shift.query
         .options(
             joinedload(Shift.member),
             subqueryload(Shift.swaps).joinedload(ShiftSwap.original_member),
         )
-        .filter(Member.team_id == team_id)
+        .filter(Shift.team_id == team_id)
         .order_by(Shift.shift_date.desc())
         .all()
     )
@@ -1374,13 +2456,13 @@ def api_get_saved_schedules(team_id):
 @app.route("/api/settings", methods=["GET"])
 def api_get_settings():
     team_id = request.args.get("team_id", type=int)
-    result = {}
-    for key, default in SETTINGS_DEFAULTS.items():
-        result[key] = get_setting(key, team_id)
+    settings = get_all_settings(team_id)
+    result = {key: settings[key] for key in SETTINGS_DEFAULTS}
     return jsonify({"settings": result, "defaults": SETTINGS_DEFAULTS})
 
 
 @app.route("/api/settings", methods=["PUT"])
+@invalidates("team")
 def api_update_settings():
     data = request.get_json() or {}
     team_id = data.get("team_id")
@@ -1394,13 +2476,11 @@ def api_update_settings():
             existing.value = str(value)
         else:
             db.session.add(Settings(team_id=team_id, key=key, value=str(value)))
+    bump_settings_version()
     db.session.commit()
-    invalidate_settings_cache()
 
-    result = {}
-    for key in SETTINGS_DEFAULTS:
-        result[key] = get_setting(key, team_id)
-    return jsonify({"settings": result})
+    settings = get_all_settings(team_id)
+    return jsonify({"settings": {key: settings[key] for key in SETTINGS_DEFAULTS}})
 
 
 # ══════════════════════════════════════
@@ -1418,7 +2498,7 @@ def api_get_shotef(team_id):
     days = (
         ShotefDay.query
         .options(joinedload(ShotefDay.member))
-        .filter_by(team_id=team_id, year=year, month=month)
+        .filter(ShotefDay.team_id == team_id, in_month(ShotefDay.date, year, month))
         .order_by(ShotefDay.date).all()
     )
 
@@ -1426,6 +2506,7 @@ def api_get_shotef(team_id):
 
 
 @app.route("/api/teams/<int:team_id>/shotef/reassign", methods=["POST"])
+@invalidates("team", "reports")
 def api_shotef_reassign(team_id):
     """Reassign a single shotef day to a different member."""
     Team.query.get_or_404(team_id)
@@ -1447,6 +2528,7 @@ def api_shotef_reassign(team_id):
 
 
 @app.route("/api/shotef-days/<int:sd_id>", methods=["DELETE"])
+@invalidates("team", "reports")
 def api_delete_shotef_day(sd_id):
     sd = ShotefDay.query.get_or_404(sd_id)
     db.session.delete(sd)
@@ -1460,17 +2542,14 @@ def api_shotef_history(team_id):
     members = Member.query.filter_by(team_id=team_id).all()
     member_ids = [m.id for m in members]
 
-    settled_at_str = get_setting("shotef_settled_at", team_id)
+    settings = get_team_settings(team_id)
+    settled_at_str = settings.raw["shotef_settled_at"]
 
     day_counts_q = db.session.query(ShotefDay.member_id, func.count(ShotefDay.id)).filter(
         ShotefDay.member_id.in_(member_ids)
     )
-    if settled_at_str:
-        try:
-            settled_date = datetime.strptime(settled_at_str, "%Y-%m-%d").date()
-            day_counts_q = day_counts_q.filter(ShotefDay.date >= settled_date)
-        except ValueError:
-            pass
+    if settings.shotef_settled_at:
+        day_counts_q = day_counts_q.filter(ShotefDay.date >= settings.shotef_settled_at)
     day_counts = dict(day_counts_q.group_by(ShotefDay.member_id).all()) if member_ids else {}
 
     result = []
@@ -1491,6 +2570,7 @@ def api_shotef_history(team_id):
 
 
 @app.route("/api/teams/<int:team_id>/shotef-settle", methods=["POST"])
+@invalidates("team")
 def api_shotef_settle(team_id):
     """Settle shotef fairness: future calculations only consider data after today."""
     Team.query.get_or_404(team_id)
@@ -1504,8 +2584,8 @@ def api_shotef_settle(team_id):
     members = Member.query.filter_by(team_id=team_id).all()
     for m in members:
         m.shotef_credit = 0
+    bump_settings_version()
     db.session.commit()
-    invalidate_settings_cache()
     return jsonify({"message": "Shotef settled", "settled_at": today_str})
 
 
@@ -1514,6 +2594,7 @@ def api_shotef_settle(team_id):
 # ══════════════════════════════════════
 
 @app.route("/api/teams/<int:team_id>/shotef-days", methods=["POST"])
+@invalidates("team", "reports")
 def api_add_shotef_days(team_id):
     """Add shotef day assignments for specific dates."""
     Team.query.get_or_404(team_id)
@@ -1528,22 +2609,28 @@ def api_add_shotef_days(team_id):
     if member.team_id != team_id:
         return json_error("Member does not belong to this team")
 
-    added = 0
-    for d_str in dates:
-        try:
-            d_obj = datetime.strptime(d_str, "%Y-%m-%d").date()
-        except ValueError:
-            continue
-        existing = ShotefDay.query.filter_by(team_id=team_id, date=d_obj).first()
-        if existing:
-            continue
-        db.session.add(ShotefDay(
-            team_id=team_id, member_id=member.id, date=d_obj,
-            year=d_obj.year, month=d_obj.month,
-        ))
-        added += 1
+    parsed, results = _parse_bulk_dates(dates)
+    holders = dict(
+        db.session.query(ShotefDay.date, ShotefDay.member_id)
+        .filter(ShotefDay.team_id == team_id, ShotefDay.date.in_(list(parsed)))
+    ) if parsed else {}
+    insert_on_conflict(db.session, ShotefDay, [
+        {"team_id": team_id, "member_id": member.id, "date": d, "year": d.year, "month": d.month}
+        for d in parsed if d not in holders
+    ], ["team_id", "date"])
     db.session.commit()
-    return jsonify({"message": f"{added} shotef day{'s' if added != 1 else ''} added", "count": added}), 201
+
+    for d, result in parsed.items():
+        if d not in holders:
+            result["status"] = "added"
+        else:
+            result["status"] = "exists" if holders[d] == member.id else "taken"
+    added = len(parsed) - len(holders)
+    return jsonify({
+        "message": f"{added} shotef day{'s' if added != 1 else ''} added",
+        "count": added,
+        "results": results,
+    }), 201
 
 
 # ══════════════════════════════════════
@@ -1552,31 +2639,19 @@ def api_add_shotef_days(team_id):
 
 @app.route("/api/reports", methods=["GET"])
 def api_get_reports():
-    cached = _cache_get("reports")
+    cache_key = _cache_key("reports", "reports")
+    cached = _cache_get(cache_key)
     if cached is not None:
-        return jsonify(cached)
+        return _cached_response(cached)
     teams = Team.query.all()
     all_members = Member.query.all()
 
     all_member_ids = [m.id for m in all_members]
 
-    shift_counts = dict(
-        db.session.query(Shift.member_id, func.count(Shift.id))
-        .filter(Shift.member_id.in_(all_member_ids))
-        .group_by(Shift.member_id).all()
-    ) if all_member_ids else {}
-
-    covers_done = dict(
-        db.session.query(ShiftSwap.covering_member_id, func.count(ShiftSwap.id))
-        .filter(ShiftSwap.covering_member_id.in_(all_member_ids))
-        .group_by(ShiftSwap.covering_member_id).all()
-    ) if all_member_ids else {}
-
-    covers_received = dict(
-        db.session.query(ShiftSwap.original_member_id, func.count(ShiftSwap.id))
-        .filter(ShiftSwap.original_member_id.in_(all_member_ids))
-        .group_by(ShiftSwap.original_member_id).all()
-    ) if all_member_ids else {}
+    totals = ledger.member_totals(db.session, all_member_ids)
+    shift_counts = {m_id: sum(t[k] for k in ledger.SHIFT_KINDS) for m_id, t in totals.items()}
+    covers_done = {m_id: t["covers_done"] for m_id, t in totals.items()}
+    covers_received = {m_id: t["covers_received"] for m_id, t in totals.items()}
 
     shotef_counts = dict(
         db.session.query(ShotefDay.member_id, func.count(ShotefDay.id))
@@ -1627,8 +2702,7 @@ def api_get_reports():
             "total_shifts": total_shifts_count,
         },
     }
-    _cache_set("reports", result)
-    return jsonify(result)
+    return _cached_response(_cache_set(cache_key, result))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+"""Benchmark the pure planners on synthetic snapshots, without a database.
+
+    python bench_planner.py --members 40 --runs 200
+    python bench_planner.py --members 400 --profile
+"""
+
+import argparse
+import cProfile
+import pstats
+import random
+import statistics
+import time
+
+import planner
+
+
+def synthetic_snapshots(n_members, year, month, seed=0):
+    rnd = random.Random(seed)
+    member_ids = list(range(1, n_members + 1))
+    names = [f"Member {i}" for i in member_ids]
+    unavailable = [set(rnd.sample(range(1, 29), rnd.randint(0, 6))) for _ in member_ids]
+    reasons = {(i, d): "Vacation" for i, days in enumerate(unavailable) for d in days}
+    night = planner.NightSnapshot(
+        year=year, month=month, start_day=1,
+        member_ids=member_ids, names=names,
+        unavailable=unavailable, reasons=reasons,
+        past_count=[rnd.randint(20, 40) for _ in member_ids],
+        past_weekend=[rnd.randint(2, 8) for _ in member_ids],
+        past_thursday=[rnd.randint(2, 8) for _ in member_ids],
+        max_normal=6, max_thursday=1, max_weekend=1, min_gap=1,
+    )
+    shotef = planner.ShotefSnapshot(
+        year=year, month=month, member_ids=member_ids, names=names,
+        counts=[rnd.randint(0, 30) for _ in member_ids],
+        unavailable=unavailable, reasons=reasons,
+    )
+    return night, shotef
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=40)
+    parser.add_argument("--year", type=int, default=2027)
+    parser.add_argument("--month", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--profile", action="store_true", help="print a cProfile of the night planner")
+    args = parser.parse_args()
+
+    night, shotef = synthetic_snapshots(args.members, args.year, args.month)
+    rng = random.Random(1)
+    print(f"{args.members} members, {args.year}-{args.month:02d}")
+    print(f"  night shifts: {timed(lambda: planner.plan_night_shifts(night, rng), args.runs):.0f} us median")
+    print(f"  shotef:       {timed(lambda: planner.plan_shotef(shotef, rng), args.runs):.0f} us median")
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        for _ in range(args.runs):
+            planner.plan_night_shifts(night, rng)
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+
+
+if __name__ == "__main__":
+    main()
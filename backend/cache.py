@@ -0,0 +1,215 @@
+"""Response cache backends for the read-heavy GET endpoints.
+
+``MemoryCache`` is a bounded, lock-protected LRU private to one process.
+``SQLiteCache`` keeps entries in a local SQLite file, so every worker process on a
+host shares them (and a write in one worker invalidates them for all). Both expire
+entries after ``ttl`` seconds and count hits, misses and evictions per process.
+``from_env`` picks the backend from ``RESPONSE_CACHE`` (``memory`` or ``sqlite``).
+
+Invalidation is by version: each backend keeps a counter per scope (a team, the
+teams list, ...), callers put the versions of the scopes a response depends on into
+its key, and writes ``bump`` the scopes they touch. Superseded entries are never
+read again and age out through the TTL and the LRU bound.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+DEFAULT_TTL = 5  # seconds
+DEFAULT_MAX_ENTRIES = 512
+TOUCH_FRACTION = 0.25  # SQLiteCache refreshes used_at once it is this much of the TTL old
+EVICT_EVERY = 32  # SQLiteCache trims to max_entries at most once per this many sets in a process
+
+
+class _Counters:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+class MemoryCache:
+    """In-process LRU holding at most ``max_entries`` values for ``ttl`` seconds each."""
+
+    backend = "memory"
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires at)
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+        self._counters = _Counters()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._counters.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self._counters.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def versions(self, scopes):
+        with self._lock:
+            return tuple(self._versions[scope] for scope in scopes)
+
+    def bump(self, scopes):
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] += 1
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+            counters = self._counters.as_dict()
+        return {"backend": self.backend, "size": size, "max_entries": self.max_entries, "ttl": self.ttl, **counters}
+
+
+class SQLiteCache:
+    """LRU of JSON values in a SQLite file shared by the worker processes on one host.
+
+    Each thread (and each forked process) opens its own connection; the file runs in
+    WAL mode so readers do not block the worker that is writing. To keep hits mostly
+    read-only, ``used_at`` is only refreshed once it is ``TOUCH_FRACTION`` of the TTL
+    old, and the LRU trim runs every ``EVICT_EVERY`` sets (fewer for a small cache), so
+    the file can briefly hold a few more than ``max_entries`` entries.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, dumps=json.dumps, loads=json.loads):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._dumps = dumps
+        self._loads = loads
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = _Counters()
+        self._sets = 0
+        self._evict_every = max(1, min(EVICT_EVERY, max_entries // 16))
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_used_at ON entries (used_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS versions (scope TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            setattr(self._counters, counter, getattr(self._counters, counter) + n)
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at, used_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            if row is not None:
+                conn.execute("DELETE FROM entries WHERE key = ? AND expires_at <= ?", (key, now))
+            self._count("misses")
+            return None
+        stale = now - self.ttl * TOUCH_FRACTION
+        if row[2] < stale:
+            conn.execute("UPDATE entries SET used_at = ? WHERE key = ? AND used_at < ?", (now, key, stale))
+        self._count("hits")
+        return self._loads(row[0])
+
+    def set(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, self._dumps(value), now + self.ttl, now),
+        )
+        with self._lock:
+            self._sets += 1
+            if self._sets % self._evict_every:
+                return
+        evicted = conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            " SELECT key FROM entries ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if evicted > 0:
+            self._count("evictions", evicted)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM entries")
+
+    def versions(self, scopes):
+        rows = self._connect().execute(
+            f"SELECT scope, version FROM versions WHERE scope IN ({', '.join('?' * len(scopes))})", tuple(scopes),
+        ).fetchall()
+        found = dict(rows)
+        return tuple(found.get(scope, 0) for scope in scopes)
+
+    def bump(self, scopes):
+        self._connect().executemany(
+            "INSERT INTO versions (scope, version) VALUES (?, 1)"
+            " ON CONFLICT (scope) DO UPDATE SET version = version + 1",
+            [(scope,) for scope in scopes],
+        )
+
+    def stats(self):
+        size = self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        with self._lock:
+            counters = self._counters.as_dict()
+        return {
+            "backend": self.backend, "path": self.path, "size": size,
+            "max_entries": self.max_entries, "ttl": self.ttl, **counters,
+        }
+
+
+def from_env(dumps=json.dumps, loads=json.loads):
+    """Build the backend named by ``RESPONSE_CACHE`` (default ``memory``).
+
+    ``RESPONSE_CACHE_SIZE`` bounds the entry count and ``RESPONSE_CACHE_PATH`` sets the
+    SQLite file; ``dumps``/``loads`` serialize values for the SQLite backend.
+    """
+    backend = os.environ.get("RESPONSE_CACHE", "memory").lower()
+    max_entries = int(os.environ.get("RESPONSE_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+    if backend == "sqlite":
+        path = os.environ.get("RESPONSE_CACHE_PATH") or os.path.join(tempfile.gettempdir(), "shifter-cache.sqlite")
+        return SQLiteCache(path, max_entries=max_entries, dumps=dumps, loads=loads)
+    if backend != "memory":
+        raise ValueError(f"Unknown RESPONSE_CACHE backend: {backend}")
+    return MemoryCache(max_entries=max_entries)
@@ -0,0 +1,230 @@
+"""Bulk history import: past shifts, swaps and Shotef days for many teams from one file.
+
+The file is a CSV or XLSX sheet whose header row names the columns ``team``,
+``member`` and ``date``, plus optionally ``type`` (``shift``, the default, or
+``shotef``) and ``covered_by`` (the member who actually worked a shift the listed
+member handed over; it is stored as a swap). Rows are streamed (openpyxl read-only
+mode for XLSX), checked against the unique constraints and loaded in chunks, each
+committed on its own. Bad rows are reported and skipped, and rows already in the
+database count as ``exists``, so an import can be fixed up and run again.
+"""
+import csv
+import io
+import time
+from datetime import date, datetime
+from zipfile import BadZipFile
+
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+import ledger
+from models import Member, Shift, ShotefDay, Team
+from queries import copy_rows
+
+CHUNK_ROWS = 5000
+MAX_ERRORS = 100  # errors listed in the report; the rest are only counted
+COLUMNS = ("team", "member", "date", "type", "covered_by")
+REQUIRED = ("team", "member", "date")
+TYPES = ("shift", "shotef")
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be read (format, header)."""
+
+
+def read_rows(stream, filename):
+    """Yield ``(row_number, {column: value})`` for each data row of a CSV or XLSX file."""
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if ext == "csv":
+        return _read_csv(stream)
+    if ext == "xlsx":
+        return _read_xlsx(stream)
+    raise ImportFileError("Expected a .csv or .xlsx file")
+
+
+def _header(cells):
+    header = [str(c).strip().lower() if c is not None else "" for c in cells]
+    missing = [col for col in REQUIRED if col not in header]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+    return [(i, col) for i, col in enumerate(header) if col in COLUMNS]
+
+
+def _read_csv(stream):
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    try:
+        columns = _header(next(reader, []))
+        for row_no, cells in enumerate(reader, start=2):
+            if any(cells):
+                yield row_no, {col: cells[i] if i < len(cells) else None for i, col in columns}
+    except UnicodeDecodeError:
+        raise ImportFileError("CSV files must be UTF-8 encoded") from None
+
+
+def _read_xlsx(stream):
+    try:
+        wb = load_workbook(stream, read_only=True, data_only=True)
+    except (InvalidFileException, BadZipFile):
+        raise ImportFileError("Not a valid .xlsx file") from None
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        columns = _header(next(rows, ()))
+        for row_no, cells in enumerate(rows, start=2):
+            if any(c not in (None, "") for c in cells):
+                yield row_no, {col: cells[i] if i < len(cells) else None for i, col in columns}
+    finally:
+        wb.close()
+
+
+def _text(value):
+    return str(value).strip() if value is not None else ""
+
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(_text(value))
+
+
+class _Members:
+    """Team and member name lookups, loading each team's members once."""
+
+    def __init__(self, session):
+        self.session = session
+        self.teams = {}  # team name -> (team_id, {member name: member_id}), or None if unknown
+
+    def team(self, name):
+        if name not in self.teams:
+            team = self.session.query(Team.id).filter(Team.name == name).first()
+            self.teams[name] = None if team is None else (team.id, dict(
+                self.session.query(Member.name, Member.id).filter(Member.team_id == team.id)
+            ))
+        return self.teams[name]
+
+
+class _Import:
+    def __init__(self, session, dry_run, progress):
+        self.session = session
+        self.dry_run = dry_run
+        self.progress = progress
+        self.members = _Members(session)
+        self.seen_shifts = set()  # (member_id, date) already taken by an earlier row
+        self.seen_shotef = set()  # (team_id, date)
+        self.shifts, self.shotef = [], []
+        self.team_ids = set()
+        self.report = {
+            "rows": 0, "shifts": 0, "swaps": 0, "shotef_days": 0,
+            "exists": 0, "duplicates": 0, "error_count": 0, "errors": [], "chunks": 0,
+        }
+
+    def error(self, row_no, message):
+        self.report["error_count"] += 1
+        if len(self.report["errors"]) < MAX_ERRORS:
+            self.report["errors"].append({"row": row_no, "error": message})
+
+    def add(self, row_no, values):
+        """Validate one row and queue it for the current chunk."""
+        self.report["rows"] += 1
+        team_name, member_name = _text(values.get("team")), _text(values.get("member"))
+        kind = _text(values.get("type")).lower() or "shift"
+        covered_by = _text(values.get("covered_by"))
+        if not team_name or not member_name or values.get("date") in (None, ""):
+            return self.error(row_no, "team, member and date are required")
+        if kind not in TYPES:
+            return self.error(row_no, f"Unknown type '{kind}'")
+        try:
+            d = _date(values["date"])
+        except ValueError:
+            return self.error(row_no, f"Invalid date '{values['date']}' (expected YYYY-MM-DD)")
+
+        team = self.members.team(team_name)
+        if team is None:
+            return self.error(row_no, f"Unknown team '{team_name}'")
+        team_id, names = team
+        for name in filter(None, (member_name, covered_by)):
+            if name not in names:
+                return self.error(row_no, f"Unknown member '{name}' in team '{team_name}'")
+        member_id = names[member_name]
+
+        if kind == "shotef":
+            if covered_by:
+                return self.error(row_no, "covered_by applies to shifts only")
+            key = (team_id, d)
+            if key in self.seen_shotef:
+                self.report["duplicates"] += 1
+                return
+            self.seen_shotef.add(key)
+            self.shotef.append({"team_id": team_id, "member_id": member_id, "date": d, "year": d.year, "month": d.month})
+        else:
+            covering_id = names[covered_by] if covered_by else None
+            if covering_id == member_id:
+                return self.error(row_no, "A member cannot cover their own shift")
+            holder_id = covering_id or member_id
+            key = (holder_id, d)
+            if key in self.seen_shifts:
+                self.report["duplicates"] += 1
+                return
+            self.seen_shifts.add(key)
+            self.shifts.append((holder_id, d, team_id, member_id if covering_id else None))
+        self.team_ids.add(team_id)
+        if len(self.shifts) + len(self.shotef) >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Drop rows already in the database, load the rest and commit the chunk."""
+        if not self.shifts and not self.shotef:
+            return
+        session = self.session
+        shifts, shotef = self.shifts, self.shotef
+        self.shifts, self.shotef = [], []
+
+        if shifts:
+            existing = {tuple(r) for r in session.query(Shift.member_id, Shift.shift_date).filter(
+                Shift.member_id.in_({s[0] for s in shifts}), Shift.shift_date.in_({s[1] for s in shifts}),
+            )}
+            new = [s for s in shifts if (s[0], s[1]) not in existing]
+            self.report["exists"] += len(shifts) - len(new)
+            shifts = new
+        if shotef:
+            existing = {tuple(r) for r in session.query(ShotefDay.team_id, ShotefDay.date).filter(
+                ShotefDay.team_id.in_({r["team_id"] for r in shotef}), ShotefDay.date.in_({r["date"] for r in shotef}),
+            )}
+            new = [r for r in shotef if (r["team_id"], r["date"]) not in existing]
+            self.report["exists"] += len(shotef) - len(new)
+            shotef = new
+
+        swaps = [(holder_id, d, original_id) for holder_id, d, _, original_id in shifts if original_id]
+        if not self.dry_run:
+            ledger.bulk_load_shifts(session, [
+                {"shift_date": d, "member_id": holder_id, "team_id": team_id} for holder_id, d, team_id, _ in shifts
+            ], swaps)
+            copy_rows(session, ShotefDay.__table__, shotef)
+            session.commit()
+        self.report["shifts"] += len(shifts)
+        self.report["swaps"] += len(swaps)
+        self.report["shotef_days"] += len(shotef)
+        self.report["chunks"] += 1
+        if self.progress:
+            self.progress(self.report)
+
+
+def import_history(session, rows, dry_run=False, progress=None):
+    """Load ``(row_number, values)`` rows from ``read_rows``; returns the import report.
+
+    ``progress(report)`` is called after each chunk. With ``dry_run`` everything is
+    validated and counted but nothing is written.
+    """
+    started = time.perf_counter()
+    job = _Import(session, dry_run, progress)
+    try:
+        for row_no, values in rows:
+            job.add(row_no, values)
+        job.flush()
+    except Exception:
+        session.rollback()
+        raise
+    report = dict(job.report, dry_run=dry_run, teams=len(job.team_ids))
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+    return report
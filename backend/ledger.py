@@ -0,0 +1,358 @@
+"""Fairness ledger: monthly per-member shift and swap counters.
+
+``fairness_ledger`` mirrors ``shifts`` and ``shift_swaps`` bucketed by
+(member, year, month, kind), so fairness reads scale with members x months instead
+of with history. ORM writes are picked up by the ``before_flush`` hook below; bulk
+writes must go through ``bulk_delete_shifts``, ``bulk_reassign_shifts``,
+``bulk_insert_shifts`` and ``bulk_load_shifts`` so the ledger stays in step.
+"""
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect, or_
+from sqlalchemy.orm import Session
+
+from models import Member, Shift, ShiftSwap, FairnessLedger
+from queries import copy_rows, insert_on_conflict, upsert_many
+
+SHIFT_KINDS = ("normal", "thursday", "weekend")
+SWAP_KINDS = ("covers_done", "covers_received")
+
+
+def shift_kind(d):
+    wd = d.weekday()
+    if wd == 3:
+        return "thursday"
+    if wd in (4, 5):
+        return "weekend"
+    return "normal"
+
+
+def _bucket(member_id, d, kind):
+    return (member_id, d.year, d.month, kind)
+
+
+def apply_deltas(session, deltas):
+    """Add ``{(member_id, year, month, kind): delta}`` to the ledger inside ``session``.
+
+    Written as ``INSERT ... ON CONFLICT DO UPDATE SET count = count + excluded.count``,
+    so concurrent writers to the same bucket add up instead of overwriting each other
+    or racing to insert it. Ledger rows are never loaded as ORM objects, so there is
+    no identity-map copy to go stale.
+    """
+    upsert_many(session, FairnessLedger, [
+        {"member_id": k[0], "year": k[1], "month": k[2], "kind": k[3], "count": v}
+        for k, v in deltas.items() if v
+    ], ["member_id", "year", "month", "kind"], increment=["count"])
+
+
+def _old(obj, attr):
+    """Value of ``attr`` as last loaded from the database (before pending changes)."""
+    hist = inspect(obj).attrs[attr].history
+    if hist.deleted:
+        return hist.deleted[0]
+    return getattr(obj, attr)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_ledger(session, flush_context, instances):
+    gone_members = {o.id for o in session.deleted if isinstance(o, Member)}
+    deltas = defaultdict(int)
+
+    def bump(member_id, d, kind, n):
+        if member_id is None or d is None or member_id in gone_members:
+            return
+        deltas[_bucket(member_id, d, kind)] += n
+
+    def bump_swap(swap, n, old):
+        get = _old if old else getattr
+        shift = swap.shift if swap.shift is not None else session.get(Shift, get(swap, "shift_id"))
+        if shift is None:
+            return
+        d = _old(shift, "shift_date")
+        bump(get(swap, "covering_member_id"), d, "covers_done", n)
+        bump(get(swap, "original_member_id"), d, "covers_received", n)
+
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Shift):
+                bump(obj.member_id, obj.shift_date, shift_kind(obj.shift_date), 1)
+            elif isinstance(obj, ShiftSwap):
+                bump_swap(obj, 1, old=False)
+
+        for obj in session.deleted:
+            if isinstance(obj, Shift):
+                d = _old(obj, "shift_date")
+                bump(_old(obj, "member_id"), d, shift_kind(d), -1)
+            elif isinstance(obj, ShiftSwap):
+                bump_swap(obj, -1, old=True)
+
+        for obj in session.dirty:
+            if not isinstance(obj, Shift) or not session.is_modified(obj):
+                continue
+            old_m, old_d = _old(obj, "member_id"), _old(obj, "shift_date")
+            if (old_m, old_d) != (obj.member_id, obj.shift_date):
+                bump(old_m, old_d, shift_kind(old_d), -1)
+                bump(obj.member_id, obj.shift_date, shift_kind(obj.shift_date), 1)
+
+    apply_deltas(session, deltas)
+
+
+def bulk_delete_shifts(session, *criteria):
+    """Bulk-delete shifts matching ``criteria`` and their swaps, keeping the ledger in step.
+
+    Returns the number of shifts deleted.
+    """
+    deltas = defaultdict(int)
+    shift_ids = []
+    for shift_id, member_id, d in session.query(Shift.id, Shift.member_id, Shift.shift_date).filter(*criteria):
+        shift_ids.append(shift_id)
+        deltas[_bucket(member_id, d, shift_kind(d))] -= 1
+    if not shift_ids:
+        return 0
+
+    swap_rows = (
+        session.query(ShiftSwap.covering_member_id, ShiftSwap.original_member_id, Shift.shift_date)
+        .join(Shift, ShiftSwap.shift_id == Shift.id)
+        .filter(Shift.id.in_(shift_ids))
+        .all()
+    )
+    for covering_id, original_id, d in swap_rows:
+        deltas[_bucket(covering_id, d, "covers_done")] -= 1
+        deltas[_bucket(original_id, d, "covers_received")] -= 1
+
+    apply_deltas(session, deltas)
+    if swap_rows:
+        session.query(ShiftSwap).filter(ShiftSwap.shift_id.in_(shift_ids)).delete(synchronize_session="fetch")
+    session.query(Shift).filter(Shift.id.in_(shift_ids)).delete(synchronize_session="fetch")
+    return len(shift_ids)
+
+
+def bulk_reassign_shifts(session, changes):
+    """Move shifts to other members with one executemany, keeping the ledger in step.
+
+    ``changes`` holds ``(shift_id, shift_date, old_member_id, new_member_id)``. Swaps on
+    those shifts are deleted, since the member they settled no longer holds the night.
+    """
+    if not changes:
+        return
+    deltas = defaultdict(int)
+    for _, d, old_id, new_id in changes:
+        deltas[_bucket(old_id, d, shift_kind(d))] -= 1
+        deltas[_bucket(new_id, d, shift_kind(d))] += 1
+    shift_ids = [shift_id for shift_id, _, _, _ in changes]
+
+    swap_rows = (
+        session.query(ShiftSwap.covering_member_id, ShiftSwap.original_member_id, Shift.shift_date)
+        .join(Shift, ShiftSwap.shift_id == Shift.id)
+        .filter(Shift.id.in_(shift_ids))
+        .all()
+    )
+    for covering_id, original_id, d in swap_rows:
+        deltas[_bucket(covering_id, d, "covers_done")] -= 1
+        deltas[_bucket(original_id, d, "covers_received")] -= 1
+
+    apply_deltas(session, deltas)
+    if swap_rows:
+        session.query(ShiftSwap).filter(ShiftSwap.shift_id.in_(shift_ids)).delete(synchronize_session="fetch")
+    session.bulk_update_mappings(Shift, [
+        {"id": shift_id, "member_id": new_id} for shift_id, _, _, new_id in changes
+    ])
+
+
+class ShiftConflict(Exception):
+    """A bulk insert met shifts written concurrently; roll back and retry."""
+
+
+def bulk_insert_shifts(session, rows):
+    """Insert new ``[{"shift_date", "member_id", "team_id"}]`` in multi-row statements, keeping the ledger in step.
+
+    Runs ``INSERT ... ON CONFLICT DO NOTHING`` on ``(member_id, shift_date)``. The
+    ledger already counts every row, so if any was skipped because another writer got
+    there first this raises ``ShiftConflict`` and the caller must roll back.
+    """
+    if not rows:
+        return
+    deltas = defaultdict(int)
+    for row in rows:
+        deltas[_bucket(row["member_id"], row["shift_date"], shift_kind(row["shift_date"]))] += 1
+    apply_deltas(session, deltas)
+    inserted = insert_on_conflict(session, Shift, rows, ["member_id", "shift_date"])
+    if inserted != len(rows):
+        raise ShiftConflict(f"{len(rows) - inserted} shift(s) were added concurrently")
+
+
+def bulk_load_shifts(session, rows, swaps=()):
+    """Load history ``[{"shift_date", "member_id", "team_id"}]`` and its swaps, keeping the ledger in step.
+
+    For imports: the rows must not exist yet (callers check), and go in with
+    ``copy_rows`` (COPY on Postgres). ``swaps`` holds ``(covering_member_id,
+    shift_date, original_member_id)``, each for one of ``rows`` that the original
+    member handed over to the covering one.
+    """
+    if not rows:
+        return
+    deltas = defaultdict(int)
+    for row in rows:
+        deltas[_bucket(row["member_id"], row["shift_date"], shift_kind(row["shift_date"]))] += 1
+    for covering_id, d, original_id in swaps:
+        deltas[_bucket(covering_id, d, "covers_done")] += 1
+        deltas[_bucket(original_id, d, "covers_received")] += 1
+    apply_deltas(session, deltas)
+    copy_rows(session, Shift.__table__, rows)
+    if not swaps:
+        return
+
+    shift_ids = {
+        (member_id, d): shift_id for shift_id, member_id, d in session.query(Shift.id, Shift.member_id, Shift.shift_date)
+        .filter(Shift.member_id.in_({s[0] for s in swaps}), Shift.shift_date.in_({s[1] for s in swaps}))
+    }
+    copy_rows(session, ShiftSwap.__table__, [
+        {"shift_id": shift_ids[(covering_id, d)], "original_member_id": original_id, "covering_member_id": covering_id}
+        for covering_id, d, original_id in swaps
+    ])
+
+
+def member_totals(session, member_ids, since=None, exclude_month=None):
+    """Per-member ``{kind: count}`` read from the ledger.
+
+    ``since`` is an inclusive cut-off date; days of its month before the cut-off are
+    taken back out using the raw tables, so day-level cut-offs stay exact.
+    ``exclude_month`` ``(year, month)`` drops that month's shift kinds but not its swaps,
+    matching how ``create_schedule`` has always counted history.
+    """
+    totals = {m_id: dict.fromkeys(SHIFT_KINDS + SWAP_KINDS, 0) for m_id in member_ids}
+    if not member_ids:
+        return totals
+
+    q = session.query(
+        FairnessLedger.member_id, FairnessLedger.kind, func.sum(FairnessLedger.count)
+    ).filter(FairnessLedger.member_id.in_(member_ids))
+    if since:
+        q = q.filter(FairnessLedger.year * 12 + FairnessLedger.month >= since.year * 12 + since.month)
+    if exclude_month:
+        q = q.filter(~(
+            (FairnessLedger.year == exclude_month[0])
+            & (FairnessLedger.month == exclude_month[1])
+            & FairnessLedger.kind.in_(SHIFT_KINDS)
+        ))
+    for m_id, kind, n in q.group_by(FairnessLedger.member_id, FairnessLedger.kind):
+        totals[m_id][kind] += n or 0
+
+    _subtract_leading_days(session, member_ids, [(since, exclude_month, totals)])
+    return totals
+
+
+def member_totals_windows(session, member_ids, windows):
+    """``member_totals`` for several ``(since, exclude_month)`` windows in one ledger read."""
+    results = [{m_id: dict.fromkeys(SHIFT_KINDS + SWAP_KINDS, 0) for m_id in member_ids} for _ in windows]
+    if not member_ids or not windows:
+        return results
+
+    q = session.query(
+        FairnessLedger.member_id, FairnessLedger.year, FairnessLedger.month,
+        FairnessLedger.kind, FairnessLedger.count,
+    ).filter(FairnessLedger.member_id.in_(member_ids))
+    if all(since for since, _ in windows):
+        earliest = min(since for since, _ in windows)
+        q = q.filter(FairnessLedger.year * 12 + FairnessLedger.month >= earliest.year * 12 + earliest.month)
+    rows = q.all()
+
+    for (since, exclude_month), totals in zip(windows, results):
+        floor = since.year * 12 + since.month if since else None
+        for m_id, year, month, kind, n in rows:
+            if floor is not None and year * 12 + month < floor:
+                continue
+            if (year, month) == exclude_month and kind in SHIFT_KINDS:
+                continue
+            totals[m_id][kind] += n
+
+    _subtract_leading_days(session, member_ids, [
+        (since, exclude_month, totals) for (since, exclude_month), totals in zip(windows, results)
+    ])
+    return results
+
+
+def _subtract_leading_days(session, member_ids, windows):
+    """Take the days before each ``since`` out of its month's bucket, using the raw tables.
+
+    ``windows`` holds ``(since, exclude_month, totals)``; all of them share one read.
+    """
+    partial = [w for w in windows if w[0] and w[0].day > 1]
+    if not partial:
+        return
+    lo = min(since for since, _, _ in partial).replace(day=1)
+    hi = max(since for since, _, _ in partial)
+    shift_rows = session.query(Shift.member_id, Shift.shift_date).filter(
+        Shift.member_id.in_(member_ids), Shift.shift_date >= lo, Shift.shift_date < hi,
+    ).all()
+    swap_rows = (
+        session.query(ShiftSwap.covering_member_id, ShiftSwap.original_member_id, Shift.shift_date)
+        .join(Shift, ShiftSwap.shift_id == Shift.id)
+        .filter(
+            or_(ShiftSwap.covering_member_id.in_(member_ids), ShiftSwap.original_member_id.in_(member_ids)),
+            Shift.shift_date >= lo, Shift.shift_date < hi,
+        )
+        .all()
+    )
+    for since, exclude_month, totals in partial:
+        month_start = since.replace(day=1)
+        if exclude_month != (since.year, since.month):
+            for m_id, d in shift_rows:
+                if month_start <= d < since:
+                    totals[m_id][shift_kind(d)] -= 1
+        for covering_id, original_id, d in swap_rows:
+            if not month_start <= d < since:
+                continue
+            if covering_id in totals:
+                totals[covering_id]["covers_done"] -= 1
+            if original_id in totals:
+                totals[original_id]["covers_received"] -= 1
+
+
+# ── Rebuild / verify ──
+
+def compute_from_raw(session):
+    """Ledger buckets recomputed from ``shifts`` and ``shift_swaps``."""
+    counts = defaultdict(int)
+    for member_id, d in session.query(Shift.member_id, Shift.shift_date).yield_per(10000):
+        counts[_bucket(member_id, d, shift_kind(d))] += 1
+    swap_q = (
+        session.query(ShiftSwap.covering_member_id, ShiftSwap.original_member_id, Shift.shift_date)
+        .join(Shift, ShiftSwap.shift_id == Shift.id)
+    )
+    for covering_id, original_id, d in swap_q.yield_per(10000):
+        counts[_bucket(covering_id, d, "covers_done")] += 1
+        counts[_bucket(original_id, d, "covers_received")] += 1
+    return counts
+
+
+def verify(session):
+    """Return ``[(key, ledger_count, raw_count)]`` for every bucket that disagrees."""
+    expected = compute_from_raw(session)
+    actual = defaultdict(int)
+    for r in session.query(FairnessLedger.member_id, FairnessLedger.year, FairnessLedger.month,
+                           FairnessLedger.kind, FairnessLedger.count):
+        actual[(r.member_id, r.year, r.month, r.kind)] += r.count
+    keys = {k for k, v in expected.items() if v} | {k for k, v in actual.items() if v}
+    return sorted(
+        (k, actual.get(k, 0), expected.get(k, 0))
+        for k in keys if actual.get(k, 0) != expected.get(k, 0)
+    )
+
+
+def rebuild(session):
+    """Replace the ledger with counts recomputed from the raw tables. Returns the row count."""
+    expected = compute_from_raw(session)
+    session.query(FairnessLedger).delete(synchronize_session=False)
+    session.bulk_insert_mappings(FairnessLedger, [
+        {"member_id": k[0], "year": k[1], "month": k[2], "kind": k[3], "count": n}
+        for k, n in expected.items() if n
+    ])
+    return sum(1 for n in expected.values() if n)
+
+
+def ensure_built(session):
+    """Backfill an empty ledger on databases that predate it."""
+    if session.query(FairnessLedger.id).first() is None and session.query(Shift.id).first() is not None:
+        rebuild(session)
+        session.commit()
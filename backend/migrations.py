@@ -0,0 +1,43 @@
+"""Idempotent schema upgrades for databases created before a column or index existed.
+
+``db.create_all()`` only creates missing tables, so additive changes to existing tables
+are applied here at startup. Each step checks the live schema before touching it.
+"""
+from sqlalchemy import inspect, text
+
+from models import Shift
+
+
+def _add_shift_team_id(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("shifts")}
+    if "team_id" in columns:
+        return
+    conn.execute(text("ALTER TABLE shifts ADD COLUMN team_id INTEGER REFERENCES teams(id)"))
+    conn.execute(text(
+        "UPDATE shifts SET team_id = (SELECT members.team_id FROM members WHERE members.id = shifts.member_id)"
+    ))
+
+
+def _add_generation_job_columns(conn):
+    columns = {c["name"] for c in inspect(conn).get_columns("generation_jobs")}
+    for name, sql_type in (("owner", "VARCHAR(100)"), ("options", "TEXT")):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE generation_jobs ADD COLUMN {name} {sql_type}"))
+
+
+def _create_missing_indexes(conn):
+    for index in Shift.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+
+STEPS = [
+    _add_shift_team_id,
+    _add_generation_job_columns,
+    _create_missing_indexes,
+]
+
+
+def upgrade(engine):
+    with engine.begin() as conn:
+        for step in STEPS:
+            step(conn)
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 
@@ -46,6 +47,9 @@ class Member(db.Model):
     shifts = db.relationship(
         "Shift", backref="member", cascade="all, delete-orphan", lazy="select"
     )
+    ledger_entries = db.relationship(
+        "FairnessLedger", backref="member", cascade="all, delete-orphan", lazy="select"
+    )
 
     __table_args__ = (
         db.UniqueConstraint("team_id", "name", name="uq_member_team_name"),
@@ -92,12 +96,15 @@ class Shift(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     shift_date = db.Column(db.Date, nullable=False, index=True)
     member_id = db.Column(db.Integer, db.ForeignKey("members.id"), nullable=False, index=True)
+    # Denormalized from members.team_id so team calendars are single-table range scans.
+    team_id = db.Column(db.Integer, db.ForeignKey("teams.id"), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     swaps = db.relationship("ShiftSwap", backref="shift", cascade="all, delete-orphan", lazy="select")
 
     __table_args__ = (
         db.UniqueConstraint("member_id", "shift_date", name="uq_member_shift_date"),
+        db.Index("ix_shifts_team_date", "team_id", "shift_date"),
     )
 
     def to_dict(self, member_name=None, swap_info=None):
@@ -144,6 +151,21 @@ class ShiftSwap(db.Model):
         }
 
 
+class FairnessLedger(db.Model):
+    """Monthly per-member shift and swap counts, maintained alongside shifts/shift_swaps."""
+    __tablename__ = "fairness_ledger"
+    id = db.Column(db.Integer, primary_key=True)
+    member_id = db.Column(db.Integer, db.ForeignKey("members.id"), nullable=False, index=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint("member_id", "year", "month", "kind", name="uq_ledger_member_month_kind"),
+    )
+
+
 class ShotefDay(db.Model):
     __tablename__ = "shotef_days"
     id = db.Column(db.Integer, primary_key=True)
@@ -172,6 +194,76 @@ class ShotefDay(db.Model):
         }
 
 
+class GenerationJob(db.Model):
+    """A schedule generation request run on the background worker pool."""
+    __tablename__ = "generation_jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey("teams.id"), nullable=False, index=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued / running / done / failed
+    # "team:year:month" while queued or running, NULL once finished; the unique
+    # constraint keeps a single active job per team-month.
+    active_key = db.Column(db.String(50), unique=True, nullable=True)
+    # "host:pid" of the server process that queued the job and runs it.
+    owner = db.Column(db.String(100), nullable=True)
+    options = db.Column(db.Text, nullable=True)  # JSON planner options from the request body
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    team = db.relationship("Team", backref=db.backref("generation_jobs", cascade="all, delete-orphan", lazy=True))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "team_id": self.team_id,
+            "year": self.year,
+            "month": self.month,
+            "status": self.status,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class SchedulePreview(db.Model):
+    """A planned month held for review until it is applied by its token (or expires)."""
+    __tablename__ = "schedule_previews"
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(64), nullable=False, unique=True)
+    team_id = db.Column(db.Integer, db.ForeignKey("teams.id"), nullable=False, index=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    start_day = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON: planned rows and the preview response
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    team = db.relationship("Team", backref=db.backref("schedule_previews", cascade="all, delete-orphan", lazy=True))
+
+
+class GenerationFingerprint(db.Model):
+    """Input fingerprint and response of the last plan generated for a team-month."""
+    __tablename__ = "generation_fingerprints"
+    __table_args__ = (
+        db.UniqueConstraint("team_id", "year", "month", name="uq_fingerprint_team_month"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey("teams.id"), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON: persisted rows and the generate response
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    team = db.relationship("Team", backref=db.backref("generation_fingerprints", cascade="all, delete-orphan", lazy=True))
+
+
 class Settings(db.Model):
     __tablename__ = "settings"
     id = db.Column(db.Integer, primary_key=True)
@@ -183,6 +275,14 @@ class Settings(db.Model):
         db.UniqueConstraint("team_id", "key", name="uq_settings_team_key"),
     )
 
+class SettingsVersion(db.Model):
+    """Single-row counter bumped by every settings write; processes compare it against
+    the version their cached settings were loaded at."""
+    __tablename__ = "settings_version"
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
 SETTINGS_DEFAULTS = {
     "max_normal_shifts": "6",
     "max_thursday_shifts": "1",
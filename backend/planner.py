@@ -0,0 +1,437 @@
+"""Pure scheduling engine for night shifts and Shotef (day duty).
+
+Nothing here touches the database: callers load a snapshot of the team (members,
+unavailability, caps and fairness history) into the plain structures below, call a
+planner, and persist what comes back. Members are referred to by their index in the
+snapshot's lists; unavailability is kept as day-of-month numbers.
+"""
+import heapq
+import random
+import time
+from calendar import monthrange
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+NO_ONE = "No one available"
+
+
+@dataclass
+class NightSnapshot:
+    year: int
+    month: int
+    start_day: int                      # first day of the month to plan
+    member_ids: list
+    names: list
+    unavailable: list                   # per member: set of unavailable days of month
+    reasons: dict                       # (member index, day) -> unavailability reason
+    past_count: list                    # effective history (shifts - covers done + covers received + credit)
+    past_weekend: list
+    past_thursday: list
+    max_normal: int
+    max_thursday: int
+    max_weekend: int
+    min_gap: int
+    prev_friday: tuple = None           # (member_id, name) on the previous month's last Friday
+
+
+@dataclass
+class NightPlan:
+    assignments: list = field(default_factory=list)
+    suggestions: list = field(default_factory=list)
+    shifts: list = field(default_factory=list)  # (date, member_id) rows to persist
+    stats: dict = field(default_factory=dict)   # solver details, when a solver reports any
+
+
+@dataclass
+class ShotefSnapshot:
+    year: int
+    month: int
+    member_ids: list
+    names: list
+    counts: list                        # effective Shotef days (history + credit)
+    unavailable: list                   # per member: set of unavailable days of month
+    reasons: dict                       # (member index, day) -> unavailability reason
+
+
+@dataclass
+class ShotefPlan:
+    assignments: list = field(default_factory=list)
+    needs_substitute: list = field(default_factory=list)
+
+
+def day_type(d):
+    wd = d.weekday()
+    if wd == 3:
+        return "thursday"
+    if wd in (4, 5):
+        return "weekend"
+    return "normal"
+
+
+# ══════════════════════════════════════
+#  ELIGIBILITY MATRIX
+# ══════════════════════════════════════
+
+def iter_members(mask):
+    """Yield the member indexes whose bit is set in ``mask``, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def unavailable_masks(unavailable, last_day):
+    """Per-day bitmasks (indexed by day of month) of members marked unavailable."""
+    masks = [0] * (last_day + 2)
+    for i, days in enumerate(unavailable):
+        bit = 1 << i
+        for day in days:
+            if day <= last_day:
+                masks[day] |= bit
+    return masks
+
+
+class Eligibility:
+    """Member x day constraint matrix for one month of night shifts.
+
+    Every constraint is a per-day (or per-shift-type) int bitmask with bit ``i`` set for
+    member ``i``. Unavailability is fixed when the matrix is built; min-gap blocks and
+    cap exhaustion are set by ``record`` as members get assigned.
+    """
+
+    def __init__(self, snap):
+        n = len(snap.member_ids)
+        self.last_day = monthrange(snap.year, snap.month)[1]
+        self.everyone = (1 << n) - 1
+        self.unavailable = unavailable_masks(snap.unavailable, self.last_day)
+        self.gap_blocked = [0] * (self.last_day + 2)
+        self.min_gap = snap.min_gap
+        self.caps = {"normal": snap.max_normal, "thursday": snap.max_thursday, "weekend": snap.max_weekend}
+        self.counts = {kind: [0] * n for kind in self.caps}
+        self.capped = {kind: self.everyone if cap <= 0 else 0 for kind, cap in self.caps.items()}
+
+    def eligible(self, day, cap_kind=None):
+        mask = self.everyone & ~self.unavailable[day] & ~self.gap_blocked[day]
+        if cap_kind:
+            mask &= ~self.capped[cap_kind]
+        return mask
+
+    def monthly_total(self, i):
+        return self.counts["normal"][i] + self.counts["thursday"][i] + self.counts["weekend"][i]
+
+    def record(self, i, kind, last_day):
+        """Count one ``kind`` assignment for member ``i`` whose last shift is on ``last_day``."""
+        bit = 1 << i
+        self.counts[kind][i] += 1
+        if self.counts[kind][i] >= self.caps[kind]:
+            self.capped[kind] |= bit
+        for day in range(last_day + 1, min(last_day + self.min_gap, self.last_day + 1)):
+            self.gap_blocked[day] |= bit
+
+    def reasons(self, i, day, wd, unavailable_reason):
+        """Why member ``i`` can't take ``day`` (weekday ``wd``), for suggestions."""
+        bit = 1 << i
+        if self.unavailable[day] & bit:
+            return [unavailable_reason]
+        reasons = []
+        if self.gap_blocked[day] & bit:
+            gap = self.min_gap
+            reasons.append(f"Min gap not met ({gap} day{'s' if gap != 1 else ''})")
+        if wd == 3 and self.capped["thursday"] & bit:
+            reasons.append(f"Reached max Thursday shifts ({self.caps['thursday']})")
+        if wd in (4, 5) and self.capped["weekend"] & bit:
+            reasons.append(f"Reached max weekend shifts ({self.caps['weekend']})")
+        if wd not in (3, 4, 5) and self.capped["normal"] & bit:
+            reasons.append(f"Reached max normal shifts ({self.caps['normal']})")
+        return reasons or ["Unknown constraint"]
+
+
+class CandidateQueues:
+    """Per-day-type min-heaps of members ordered by the fairness tuple.
+
+    ``key(i, kind)`` gives member ``i``'s fairness tuple for a day type. Entries are
+    refreshed lazily: ``update`` pushes new ones and stale ones are dropped as they
+    surface. Ties on the tuple are broken as the old per-day sort by
+    ``(key, rng.random())`` broke them, with one draw per eligible member in index
+    order, so a seeded plan comes out the same as it did with the sort.
+    """
+
+    KINDS = ("normal", "thursday", "weekend")
+
+    def __init__(self, n, key, rng, kinds=KINDS):
+        self.key = key
+        self.rng = rng
+        self.version = [0] * n
+        self.heaps = {}
+        for kind in kinds:
+            heap = [(key(i, kind), 0, i) for i in range(n)]
+            heapq.heapify(heap)
+            self.heaps[kind] = heap
+
+    def update(self, i):
+        """Re-key member ``i`` after its counters changed."""
+        self.version[i] += 1
+        for kind, heap in self.heaps.items():
+            heapq.heappush(heap, (self.key(i, kind), self.version[i], i))
+
+    def best(self, kind, eligible, drop=0):
+        """Best member in the ``eligible`` mask for ``kind``, or None.
+
+        Members in the ``drop`` mask can never be eligible for ``kind`` again this
+        month and are discarded from its heap; other skipped members are kept.
+        """
+        if not eligible:
+            return None
+        heap = self.heaps[kind]
+        popped = []
+        top, tied = None, 0
+        while heap:
+            key, version, i = heap[0]
+            if version != self.version[i] or drop >> i & 1:
+                heapq.heappop(heap)
+                continue
+            if top is not None and key != top:
+                break
+            popped.append(heapq.heappop(heap))
+            if eligible >> i & 1:
+                top = key
+                tied |= 1 << i
+        for entry in popped:
+            heapq.heappush(heap, entry)
+
+        if not tied:
+            return None
+        # The draw of member i is the one at its rank among the eligible members.
+        draws = [self.rng.random() for _ in range(eligible.bit_count())]
+        return min(iter_members(tied), key=lambda i: draws[(eligible & ((1 << i) - 1)).bit_count()])
+
+
+# ══════════════════════════════════════
+#  NIGHT SHIFTS
+# ══════════════════════════════════════
+
+def plan_night_shifts(snap, rng=random):
+    """Greedy day-by-day plan for one month. Returns a ``NightPlan``."""
+    year, month = snap.year, snap.month
+    el = Eligibility(snap)
+    last_day = el.last_day
+
+    past = list(snap.past_count)
+    past_weekend = list(snap.past_weekend)
+    past_thursday = list(snap.past_thursday)
+
+    plan = NightPlan()
+
+    def fairness_key(i, kind):
+        if kind == "weekend":
+            type_count = past_weekend[i]
+        elif kind == "thursday":
+            type_count = past_thursday[i]
+        else:
+            type_count = past[i]
+        return (type_count, past[i], el.monthly_total(i))
+
+    queues = CandidateQueues(len(snap.member_ids), fairness_key, rng)
+
+    def assign(day, member_id, name):
+        d = date(year, month, day)
+        plan.assignments.append({"date": d.isoformat(), "day_of_week": d.strftime("%A"), "member_name": name})
+        plan.shifts.append((d, member_id))
+
+    def unfilled(day):
+        d = date(year, month, day)
+        unavailable, optional = _suggestion_info(snap, el, day, past)
+        plan.suggestions.append({
+            "date": d.isoformat(),
+            "day_of_week": d.strftime("%A"),
+            "unavailable_members": unavailable,
+            "optional_members": optional,
+        })
+        plan.assignments.append({"date": d.isoformat(), "day_of_week": d.strftime("%A"), "member_name": NO_ONE})
+
+    day = snap.start_day
+    while day <= last_day:
+        current = date(year, month, day)
+        wd = current.weekday()
+
+        # ── Friday-Saturday pair ──
+        if wd == 4:
+            pair = day + 1 <= last_day
+            mask = el.eligible(day, "weekend")
+            if pair:
+                mask &= ~el.unavailable[day + 1]
+            chosen = queues.best("weekend", mask)
+            if chosen is None:
+                unfilled(day)
+                if pair:
+                    unfilled(day + 1)
+            else:
+                assign(day, snap.member_ids[chosen], snap.names[chosen])
+                if pair:
+                    assign(day + 1, snap.member_ids[chosen], snap.names[chosen])
+                past[chosen] += 2 if pair else 1
+                past_weekend[chosen] += 1
+                el.record(chosen, "weekend", day + 1 if pair else day)
+                queues.update(chosen)
+            day += 2 if pair else 1
+            continue
+
+        # ── Saturday at start of month: pair with last month's Friday ──
+        if day == 1 and wd == 5 and snap.prev_friday:
+            member_id, name = snap.prev_friday
+            i = snap.member_ids.index(member_id) if member_id in snap.member_ids else None
+            if i is None:
+                takes_it = snap.max_weekend > 0
+            else:
+                takes_it = not (el.unavailable[day] | el.capped["weekend"]) & (1 << i)
+            if takes_it:
+                assign(day, member_id, name)
+                if i is not None:
+                    past[i] += 1
+                    past_weekend[i] += 1
+                    el.record(i, "weekend", day)
+                    queues.update(i)
+                day += 1
+                continue
+
+        # ── Normal days (Sun-Thu) or unhandled Saturday (no cap check) ──
+        kind = day_type(current)
+        cap_kind = kind if wd != 5 else None
+        chosen = queues.best(kind, el.eligible(day, cap_kind), drop=el.capped[cap_kind] if cap_kind else 0)
+
+        if chosen is None:
+            unfilled(day)
+        else:
+            assign(day, snap.member_ids[chosen], snap.names[chosen])
+            if kind == "thursday":
+                past_thursday[chosen] += 1
+            elif kind == "weekend":
+                past_weekend[chosen] += 1
+            past[chosen] += 1
+            el.record(chosen, kind, day)
+            queues.update(chosen)
+
+        day += 1
+
+    return plan
+
+
+def _suggestion_info(snap, el, day, past):
+    """Return (unavailable_members, optional_members) for a day with no eligible member."""
+    wd = date(snap.year, snap.month, day).weekday()
+    unavailable = []
+    optional = []
+    for i, name in enumerate(snap.names):
+        reason = "; ".join(el.reasons(i, day, wd, snap.reasons.get((i, day), "Marked unavailable")))
+        unavailable.append({"member_name": name, "reason": reason})
+        optional.append({"member_name": name, "shift_count": past[i], "reason": reason})
+
+    optional.sort(key=lambda x: x["shift_count"])
+    return unavailable, optional
+
+
+# ══════════════════════════════════════
+#  SHOTEF (DAY DUTY)
+# ══════════════════════════════════════
+
+def shotef_week_blocks(year, month):
+    """Return list of (week_start_sunday, [days_in_month]) for Sun-Thu blocks."""
+    _, last_day = monthrange(year, month)
+    first = date(year, month, 1)
+    last = date(year, month, last_day)
+
+    blocks = []
+    d = first
+    while d <= last:
+        wd = d.weekday()  # Mon=0 .. Sun=6
+        if wd == 6:  # Sunday
+            week_start = d
+            days = []
+            for offset in range(5):  # Sun-Thu
+                day = d + timedelta(days=offset)
+                if day.month == month and day <= last:
+                    days.append(day)
+            if days:
+                blocks.append((week_start, days))
+            d = d + timedelta(days=5)  # skip to Friday
+        elif wd < 4:  # Mon-Thu at the start of the month (partial week)
+            sun_before = d - timedelta(days=(wd + 1) % 7)
+            days = []
+            cursor = d
+            while cursor.weekday() != 4 and cursor.month == month:
+                days.append(cursor)
+                cursor += timedelta(days=1)
+            if cursor.weekday() == 4 and cursor.month == month:
+                days.append(cursor)
+            if days:
+                blocks.append((sun_before, days))
+            d = cursor + timedelta(days=1)
+        else:
+            d += timedelta(days=1)
+
+    return blocks
+
+
+def plan_shotef(snap, rng=random):
+    """Weekly Shotef rotation for one month. Returns a ``ShotefPlan``."""
+    n = len(snap.member_ids)
+    everyone = (1 << n) - 1
+    unav = unavailable_masks(snap.unavailable, monthrange(snap.year, snap.month)[1])
+    counts = list(snap.counts)
+    queues = CandidateQueues(n, lambda i, kind: counts[i], rng, kinds=("shotef",))
+    assigned_this_month = 0
+    plan = ShotefPlan()
+    if not n:
+        return plan
+
+    for week_start, days in shotef_week_blocks(snap.year, snap.month):
+        # Once everyone has had a week, the whole team is eligible again.
+        chosen = queues.best("shotef", everyone & ~assigned_this_month or everyone)
+        chosen_bit = 1 << chosen
+        assigned_this_month |= chosen_bit
+
+        unavailable_days = [d for d in days if unav[d.day] & chosen_bit]
+        counts[chosen] += len(days)
+        queues.update(chosen)
+
+        plan.assignments.append({
+            "week_start": week_start.isoformat(),
+            "member_name": snap.names[chosen],
+            "member_id": snap.member_ids[chosen],
+            "days": [d.isoformat() for d in days],
+            "unavailable_days": [d.isoformat() for d in unavailable_days],
+        })
+
+        for ud in unavailable_days:
+            optional = [
+                {
+                    "member_name": snap.names[i],
+                    "member_id": snap.member_ids[i],
+                    "shotef_count": counts[i],
+                    "is_unavailable": bool(unav[ud.day] & (1 << i)),
+                }
+                for i in iter_members(everyone & ~chosen_bit)
+            ]
+            optional.sort(key=lambda x: (x["is_unavailable"], x["shotef_count"], rng.random()))
+            plan.needs_substitute.append({
+                "member_name": snap.names[chosen],
+                "date": ud.isoformat(),
+                "day_of_week": ud.strftime("%A"),
+                "reason": snap.reasons.get((chosen, ud.day), "Marked unavailable"),
+                "optional_members": optional,
+            })
+
+    return plan
+
+
+def plan_team_month(night, shotef, seed):
+    """Plan one team-month (night shifts, then Shotef if ``shotef`` is given) with its own RNG.
+
+    Module-level and argument-only so it can run in a worker process; returns
+    ``(NightPlan, ShotefPlan, elapsed seconds)``.
+    """
+    t0 = time.perf_counter()
+    rng = random.Random(seed)
+    night_plan = plan_night_shifts(night, rng)
+    shotef_plan = plan_shotef(shotef, rng) if shotef is not None else ShotefPlan()
+    return night_plan, shotef_plan, time.perf_counter() - t0
@@ -0,0 +1,103 @@
+"""Shared query predicates and statement helpers.
+
+Month filters are emitted as half-open date ranges (``col >= first AND col < next_first``)
+rather than ``extract(year/month)`` so the date column's indexes stay usable.
+"""
+import csv
+import io
+from datetime import date
+
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+
+INSERT_CHUNK_ROWS = 500  # rows per multi-row INSERT; keeps SQLite under its bound-parameter limit
+
+
+def month_bounds(year, month):
+    """Return ``(first_day, first_day_of_next_month)`` for a month."""
+    first = date(year, month, 1)
+    next_first = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return first, next_first
+
+
+def in_month(col, year, month):
+    first, next_first = month_bounds(year, month)
+    return and_(col >= first, col < next_first)
+
+
+def outside_month(col, year, month):
+    first, next_first = month_bounds(year, month)
+    return or_(col < first, col >= next_first)
+
+
+def insert_on_conflict(session, model, rows, index_elements, update=()):
+    """Insert ``rows`` with multi-row ``INSERT ... ON CONFLICT`` on Postgres and SQLite.
+
+    Rows clashing with the unique constraint on ``index_elements`` get their ``update``
+    columns overwritten, or are skipped when ``update`` is empty. ``rows`` must not
+    clash with each other. Returns the number of rows inserted or updated.
+    """
+    dialects = {"postgresql": postgresql, "sqlite": sqlite}
+    dialect = dialects[session.bind.dialect.name]
+    written = 0
+    for i in range(0, len(rows), INSERT_CHUNK_ROWS):
+        stmt = dialect.insert(model.__table__).values(rows[i:i + INSERT_CHUNK_ROWS])
+        if update:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=index_elements, set_={col: stmt.excluded[col] for col in update},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+        written += session.execute(stmt).rowcount
+    return written
+
+
+def upsert_many(session, model, rows, index_elements, increment):
+    """Insert ``rows``, adding their ``increment`` columns onto rows that already exist.
+
+    One executemany of a single ``INSERT ... ON CONFLICT DO UPDATE``, so the statement
+    is compiled once however many rows there are (``insert_on_conflict`` compiles
+    each chunk, which dominates for tens of thousands of rows). No row count.
+    """
+    if not rows:
+        return
+    dialects = {"postgresql": postgresql, "sqlite": sqlite}
+    stmt = dialects[session.bind.dialect.name].insert(model.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={col: model.__table__.c[col] + stmt.excluded[col] for col in increment},
+    )
+    session.execute(stmt, rows)
+
+
+def copy_rows(session, table, rows):
+    """Insert ``rows`` (dicts with the same keys) into ``table`` in one statement.
+
+    Postgres gets ``COPY ... FROM STDIN`` on the session's connection, filling in the
+    Python-side column defaults (``created_at``) that COPY would skip; other databases
+    get a single executemany. Rows are not checked for conflicts.
+    """
+    if not rows:
+        return
+    if session.bind.dialect.name != "postgresql":
+        session.execute(table.insert(), rows)
+        return
+    names = list(rows[0])
+    defaults = [
+        col for col in table.columns
+        if col.name not in names and not col.primary_key and col.default is not None
+    ]
+    filled = [d.default.arg if d.default.is_scalar else d.default.arg(None) for d in defaults]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row[name] for name in names] + filled)
+    buf.seek(0)
+
+    quote = session.bind.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(name) for name in names + [d.name for d in defaults])
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {quote(table.name)} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cursor.close()
@@ -0,0 +1,695 @@
+"""Optimal night-shift planning as a min-cost flow.
+
+The month is cut into slots (a Friday-Saturday pair is one slot, every other night
+its own) and solved as a flow of one unit per slot through
+
+    source -> slot -> (member, day type) -> member -> sink
+
+Leaving a slot unfilled costs ``UNFILLED_COST``, which dwarfs every fairness cost, so
+the flow fills as many nights as unavailability and caps allow before it balances
+anything. Fairness is the sum of squared effective counts (per type for Thursday and
+weekend, weighted by ``TYPE_WEIGHT``, plus the overall total): every unit edge into a
+member's type or total node costs the marginal increase of that square, which is
+convex, so the whole month is balanced at once instead of day by day.
+
+The minimum gap between shifts is not a flow constraint. Each gap conflict is
+removed by forbidding one side of it and solving again, keeping the cheaper branch.
+Everything runs against a deadline; when it passes, or the result is no better than
+the greedy plan, the greedy plan is returned.
+
+``improve_night_plan`` is a separate post-pass for any plan: simulated annealing over
+single-slot moves and two-member swaps, under the same constraints and objective.
+"""
+import dataclasses
+import heapq
+import math
+import random
+import time
+from datetime import date, timedelta
+
+import planner
+
+UNFILLED_COST = 10 ** 9
+TYPE_WEIGHT = 2
+DEFAULT_BUDGET_MS = 2000
+
+_INF = float("inf")
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class MinCostFlow:
+    """Successive shortest paths (Dijkstra with potentials) over non-negative integer costs."""
+
+    def __init__(self, n):
+        self.n = n
+        self.graph = [[] for _ in range(n)]  # per node: [to, capacity, cost, reverse edge index]
+
+    def add_edge(self, u, v, cap, cost):
+        """Add ``u -> v``; returns ``(u, index)`` to read the edge's residual capacity later."""
+        self.graph[u].append([v, cap, cost, len(self.graph[v])])
+        self.graph[v].append([u, 0, -cost, len(self.graph[u]) - 1])
+        return u, len(self.graph[u]) - 1
+
+    def residual(self, ref):
+        u, idx = ref
+        return self.graph[u][idx][1]
+
+    def solve(self, s, t, max_flow, deadline):
+        """Push up to ``max_flow`` units from ``s`` to ``t``; returns ``(flow, cost)``."""
+        graph = self.graph
+        potential = [0] * self.n
+        flow = cost = 0
+        while flow < max_flow:
+            if time.perf_counter() > deadline:
+                raise BudgetExceeded
+            dist = [_INF] * self.n
+            prev = [None] * self.n
+            dist[s] = 0
+            heap = [(0, s)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                pu = potential[u]
+                for idx, (v, cap, c, _) in enumerate(graph[u]):
+                    if cap > 0:
+                        nd = d + c + pu - potential[v]
+                        if nd < dist[v]:
+                            dist[v] = nd
+                            prev[v] = (u, idx)
+                            heapq.heappush(heap, (nd, v))
+            if dist[t] == _INF:
+                break
+            for v in range(self.n):
+                if dist[v] < _INF:
+                    potential[v] += dist[v]
+
+            push = max_flow - flow
+            v = t
+            while v != s:
+                u, idx = prev[v]
+                push = min(push, graph[u][idx][1])
+                v = u
+            v = t
+            while v != s:
+                u, idx = prev[v]
+                edge = graph[u][idx]
+                edge[1] -= push
+                graph[v][edge[3]][1] += push
+                v = u
+            flow += push
+            cost += push * potential[t]
+        return flow, cost
+
+
+def _marginal(count, k):
+    """Increase of ``count**2`` when the ``k``-th unit is added."""
+    return 2 * (count + k) - 1
+
+
+# ══════════════════════════════════════
+#  MONTH MODEL
+# ══════════════════════════════════════
+
+class _Month:
+    """Slots, the fixed month-start Saturday and starting counters for one snapshot."""
+
+    def __init__(self, snap):
+        self.snap = snap
+        self.n = len(snap.member_ids)
+        self.last_day = planner.Eligibility(snap).last_day
+        self.unavailable = planner.unavailable_masks(snap.unavailable, self.last_day)
+        self.past = list(snap.past_count)
+        self.past_weekend = list(snap.past_weekend)
+        self.past_thursday = list(snap.past_thursday)
+        self.weekend_cap = [snap.max_weekend] * self.n
+        self.fixed = None  # (member index or None, member_id, name) on day 1
+        self.slots = []    # (first day, last day, kind, cap checked); every slot counts towards its kind
+        self.blocked = set()
+
+        day = snap.start_day
+        while day <= self.last_day:
+            wd = date(snap.year, snap.month, day).weekday()
+            if wd == 4:
+                end = day + 1 if day + 1 <= self.last_day else day
+                self.slots.append((day, end, "weekend", True))
+                day = end + 1
+                continue
+            if day == 1 and wd == 5 and snap.prev_friday and self._fix_saturday():
+                day += 1
+                continue
+            kind = planner.day_type(date(snap.year, snap.month, day))
+            self.slots.append((day, day, kind, wd != 5))
+            day += 1
+
+        if self.fixed and self.fixed[0] is not None:
+            i = self.fixed[0]
+            for s, (first, _, _, _) in enumerate(self.slots):
+                if first - 1 < snap.min_gap:
+                    self.blocked.add((i, s))
+
+    def _fix_saturday(self):
+        """Pair day 1 with last month's Friday on the same rule as the greedy planner."""
+        member_id, name = self.snap.prev_friday
+        i = self.snap.member_ids.index(member_id) if member_id in self.snap.member_ids else None
+        if i is None:
+            takes_it = self.snap.max_weekend > 0
+        else:
+            takes_it = self.snap.max_weekend > 0 and not self.unavailable[1] >> i & 1
+        if not takes_it:
+            return False
+        self.fixed = (i, member_id, name)
+        if i is not None:
+            self.past[i] += 1
+            self.past_weekend[i] += 1
+            self.weekend_cap[i] -= 1
+        return True
+
+    def cap_limit(self, kind, i, capped):
+        """Most ``kind`` slots member ``i`` may hold if one of them is a ``capped`` (or not) slot.
+
+        The unpaired Saturday that can open a plan is given out even to a member with no
+        weekend cap left, as the greedy pass does, but it still uses up a unit of the cap.
+        """
+        cap = self.weekend_cap[i] if kind == "weekend" else getattr(self.snap, f"max_{kind}")
+        return cap if capped else max(cap, 1)
+
+    def solve(self, forbidden, deadline):
+        """Min-cost flow with ``forbidden`` (member, slot) pairs; returns ``(slot -> member, cost)``."""
+        snap, n, slots = self.snap, self.n, self.slots
+        caps = {"normal": [snap.max_normal] * n, "thursday": [snap.max_thursday] * n, "weekend": self.weekend_cap}
+        type_counts = {"thursday": self.past_thursday, "weekend": self.past_weekend}
+        kinds = ("normal", "thursday", "weekend")
+
+        source, sink = 0, 1
+        slot_base = 2
+        kind_base = slot_base + len(slots)
+        member_base = kind_base + n * len(kinds)
+        mcf = MinCostFlow(member_base + n)
+
+        lowest = min(self.past, default=0)
+        for i in range(n):
+            for k in range(1, len(slots) + 1):
+                mcf.add_edge(member_base + i, sink, 1, _marginal(self.past[i] - lowest, k))
+            for t, kind in enumerate(kinds):
+                node = kind_base + i * len(kinds) + t
+                if caps[kind][i] <= 0:
+                    continue
+                if kind == "normal":
+                    mcf.add_edge(node, member_base + i, caps[kind][i], 0)
+                    continue
+                low = min(type_counts[kind], default=0)
+                for k in range(1, caps[kind][i] + 1):
+                    mcf.add_edge(node, member_base + i, 1, TYPE_WEIGHT * _marginal(type_counts[kind][i] - low, k))
+
+        uses = []
+        for s, (first, last, kind, capped) in enumerate(slots):
+            node = slot_base + s
+            mcf.add_edge(source, node, 1, 0)
+            mcf.add_edge(node, sink, 1, UNFILLED_COST)
+            away = self.unavailable[first] | self.unavailable[last]
+            low = min(self.past_weekend, default=0)
+            for i in range(n):
+                if away >> i & 1 or (i, s) in forbidden:
+                    continue
+                if capped or caps[kind][i] > 0:
+                    target, cost = kind_base + i * len(kinds) + kinds.index(kind), 0
+                else:
+                    # Opening Saturday for a member with no weekend cap: allowed, as in the greedy pass.
+                    target, cost = member_base + i, TYPE_WEIGHT * _marginal(self.past_weekend[i] - low, 1)
+                uses.append((s, i, mcf.add_edge(node, target, 1, cost)))
+
+        _, cost = mcf.solve(source, sink, len(slots), deadline)
+        chosen = {s: i for s, i, ref in uses if mcf.residual(ref) == 0}
+        return chosen, cost
+
+    def gap_conflict(self, chosen):
+        """First ``(member, earlier slot, later slot)`` closer than the minimum gap, or None."""
+        by_member = {}
+        for s in sorted(chosen):
+            i = chosen[s]
+            if i in by_member:
+                prev = by_member[i]
+                if self.slots[s][0] - self.slots[prev][1] < self.snap.min_gap:
+                    return i, prev, s
+            by_member[i] = s
+        return None
+
+
+def _optimal_assignment(month, deadline):
+    forbidden = set(month.blocked)
+    chosen, _ = month.solve(forbidden, deadline)
+    while True:
+        conflict = month.gap_conflict(chosen)
+        if conflict is None:
+            return chosen
+        i, earlier, later = conflict
+        branches = []
+        for s in (later, earlier):
+            trial = forbidden | {(i, s)}
+            branch, cost = month.solve(trial, deadline)
+            branches.append((cost, len(branches), trial, branch))
+        _, _, forbidden, chosen = min(branches)
+
+
+def _build_plan(month, chosen):
+    """Turn a slot assignment into a ``NightPlan``, replaying it for unfilled-day suggestions."""
+    snap = month.snap
+    el = planner.Eligibility(snap)
+    past = list(snap.past_count)
+    plan = planner.NightPlan()
+
+    def assign(day, member_id, name):
+        d = date(snap.year, snap.month, day)
+        plan.assignments.append({"date": d.isoformat(), "day_of_week": d.strftime("%A"), "member_name": name})
+        plan.shifts.append((d, member_id))
+
+    def unfilled(day):
+        d = date(snap.year, snap.month, day)
+        unavailable, optional = planner._suggestion_info(snap, el, day, past)
+        plan.suggestions.append({
+            "date": d.isoformat(),
+            "day_of_week": d.strftime("%A"),
+            "unavailable_members": unavailable,
+            "optional_members": optional,
+        })
+        plan.assignments.append({"date": d.isoformat(), "day_of_week": d.strftime("%A"), "member_name": planner.NO_ONE})
+
+    if month.fixed:
+        i, member_id, name = month.fixed
+        assign(1, member_id, name)
+        if i is not None:
+            past[i] += 1
+            el.record(i, "weekend", 1)
+
+    for s, (first, last, kind, _) in enumerate(month.slots):
+        i = chosen.get(s)
+        if i is None:
+            for day in range(first, last + 1):
+                unfilled(day)
+            continue
+        for day in range(first, last + 1):
+            assign(day, snap.member_ids[i], snap.names[i])
+        past[i] += last - first + 1
+        el.record(i, kind, last)
+    return plan
+
+
+def _effective_counts(snap, shifts):
+    """Per-member ``(total, weekend, thursday)`` lists: history plus a plan's ``(date, member_id)`` rows.
+
+    A Friday-Saturday pair counts as one weekend; an unpaired Saturday counts on its own.
+    """
+    index_of = {m_id: i for i, m_id in enumerate(snap.member_ids)}
+    total = list(snap.past_count)
+    weekend = list(snap.past_weekend)
+    thursday = list(snap.past_thursday)
+    taken = set(shifts)
+    for d, member_id in shifts:
+        i = index_of.get(member_id)
+        if i is None:
+            continue
+        total[i] += 1
+        wd = d.weekday()
+        if wd == 3:
+            thursday[i] += 1
+        elif wd == 4 or (wd == 5 and (d - timedelta(days=1), member_id) not in taken):
+            weekend[i] += 1
+    return total, weekend, thursday
+
+
+def _objective(snap, shifts, counts):
+    total, weekend, thursday = counts
+    last_day = planner.Eligibility(snap).last_day
+    unfilled = (last_day - snap.start_day + 1) - len(shifts)
+    fairness = sum(t * t for t in total) + TYPE_WEIGHT * (
+        sum(w * w for w in weekend) + sum(t * t for t in thursday)
+    )
+    return unfilled, fairness
+
+
+def night_objective(snap, shifts):
+    """``(unfilled nights, fairness)`` of a plan's ``(date, member_id)`` rows; lower is better.
+
+    Fairness is the sum over the snapshot's members of the squared effective totals plus
+    ``TYPE_WEIGHT`` times the squared Thursday and weekend counts after the month.
+    """
+    return _objective(snap, shifts, _effective_counts(snap, shifts))
+
+
+def cap_violations(snap, shifts):
+    """``[(member_id, kind, count, cap)]`` for every per-type cap a plan's rows break.
+
+    Counts slots as the planners do: a Friday-Saturday pair (or a lone Friday or
+    Saturday) is one weekend, and the Saturday that opens the plan may go to a member
+    with no weekend cap left.
+    """
+    index_of = {m_id: i for i, m_id in enumerate(snap.member_ids)}
+    counts = {kind: [0] * len(snap.member_ids) for kind in ("normal", "thursday", "weekend")}
+    taken = set(shifts)
+    opens = [0] * len(snap.member_ids)
+    for d, member_id in shifts:
+        i = index_of.get(member_id)
+        if i is None:
+            continue
+        wd = d.weekday()
+        if wd == 5 and (d - timedelta(days=1), member_id) in taken:
+            continue
+        counts[planner.day_type(d)][i] += 1
+        if wd == 5 and d.day == snap.start_day:
+            opens[i] = 1
+    violations = []
+    for kind, per_member in counts.items():
+        cap = getattr(snap, f"max_{kind}")
+        for i, count in enumerate(per_member):
+            limit = max(cap, opens[i]) if kind == "weekend" else max(cap, 0)
+            if count > limit:
+                violations.append((snap.member_ids[i], kind, count, cap))
+    return violations
+
+
+def plan_score(night, shotef, night_plan, shotef_plan):
+    """Unfilled nights, night fairness objective and Shotef spread (max - min) of a month plan."""
+    unfilled, fairness = night_objective(night, night_plan.shifts)
+    spread = 0
+    if shotef is not None and shotef.member_ids:
+        index_of = {m_id: i for i, m_id in enumerate(shotef.member_ids)}
+        counts = list(shotef.counts)
+        for a in shotef_plan.assignments:
+            counts[index_of[a["member_id"]]] += len(a["days"])
+        spread = max(counts) - min(counts)
+    return {"unfilled": unfilled, "fairness": fairness, "shotef_spread": spread}
+
+
+def plan_night_shifts_optimal(snap, budget_ms=DEFAULT_BUDGET_MS, rng=random):
+    """Globally optimised month plan, or the greedy plan if that is as good or time runs out.
+
+    The returned plan's ``stats`` say which solver won and why.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+    greedy = planner.plan_night_shifts(snap, rng)
+    greedy_score = night_objective(snap, greedy.shifts)
+    stats = {"mode": "optimal", "budget_ms": budget_ms, "greedy_objective": list(greedy_score)}
+
+    try:
+        month = _Month(snap)
+        plan = _build_plan(month, _optimal_assignment(month, deadline))
+    except BudgetExceeded:
+        plan = None
+        stats["fallback_reason"] = "time budget exceeded"
+
+    if plan is not None and cap_violations(snap, plan.shifts):
+        plan = None
+        stats["fallback_reason"] = "optimal plan broke a cap"
+
+    if plan is not None:
+        score = night_objective(snap, plan.shifts)
+        stats["optimal_objective"] = list(score)
+        if score >= greedy_score:
+            plan = None
+            stats["fallback_reason"] = "greedy plan was as good"
+
+    if plan is None:
+        plan = greedy
+        stats["used"] = "greedy"
+    else:
+        stats["used"] = "optimal"
+    stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    plan.stats = stats
+    return plan
+
+
+# ══════════════════════════════════════
+#  LOCAL SEARCH
+# ══════════════════════════════════════
+
+def fairness_report(snap, shifts):
+    """Unfilled nights, per-type variance of effective counts and the scalar objective."""
+    counts = _effective_counts(snap, shifts)
+    total, weekend, thursday = counts
+
+    def variance(values):
+        if not values:
+            return 0.0
+        mean = sum(values) / len(values)
+        return round(sum((v - mean) ** 2 for v in values) / len(values), 4)
+
+    unfilled, score = _objective(snap, shifts, counts)
+    return {
+        "unfilled": unfilled,
+        "variance": {"total": variance(total), "thursday": variance(thursday), "weekend": variance(weekend)},
+        "objective": score,
+    }
+
+
+class _Search:
+    """Mutable slot assignment with O(1) objective deltas and constraint checks."""
+
+    def __init__(self, month, chosen):
+        self.month = month
+        self.owner = [chosen.get(s) for s in range(len(month.slots))]
+        self.total = list(month.past)
+        self.weekend = list(month.past_weekend)
+        self.thursday = list(month.past_thursday)
+        self.kind_count = {kind: [0] * month.n for kind in ("normal", "thursday", "weekend")}
+        self.slots_of = [set() for _ in range(month.n)]
+        for s, i in enumerate(self.owner):
+            if i is not None:
+                self._apply(i, s, 1)
+
+    def _effect(self, s):
+        """(total nights, weekend, thursday) a slot adds to its owner."""
+        first, last, kind, _ = self.month.slots[s]
+        return last - first + 1, int(kind == "weekend"), int(kind == "thursday")
+
+    def _apply(self, i, s, sign):
+        nights, wk, th = self._effect(s)
+        self.total[i] += sign * nights
+        self.weekend[i] += sign * wk
+        self.thursday[i] += sign * th
+        self.kind_count[self.month.slots[s][2]][i] += sign
+        if sign > 0:
+            self.slots_of[i].add(s)
+        else:
+            self.slots_of[i].discard(s)
+
+    def can_take(self, i, s, giving_up=None):
+        """Whether member ``i`` may take slot ``s`` (after dropping ``giving_up``)."""
+        month = self.month
+        first, last, kind, capped = month.slots[s]
+        if (month.unavailable[first] | month.unavailable[last]) >> i & 1 or (i, s) in month.blocked:
+            return False
+        dropping = giving_up is not None and month.slots[giving_up][2] == kind
+        if self.kind_count[kind][i] - dropping + 1 > month.cap_limit(kind, i, capped):
+            return False
+        gap = month.snap.min_gap
+        for t in self.slots_of[i]:
+            if t == giving_up or t == s:
+                continue
+            t_first, t_last, _, _ = month.slots[t]
+            if (t_last < first and first - t_last < gap) or (t_first > last and t_first - last < gap):
+                return False
+        return True
+
+    def delta(self, changes):
+        """Objective change for ``[(member, slot, +1/-1)]``."""
+        bump = {}
+        for i, s, sign in changes:
+            nights, wk, th = self._effect(s)
+            b = bump.setdefault(i, [0, 0, 0])
+            b[0] += sign * nights
+            b[1] += sign * wk
+            b[2] += sign * th
+        d = 0
+        for i, (dt, dw, dth) in bump.items():
+            d += (self.total[i] + dt) ** 2 - self.total[i] ** 2
+            d += TYPE_WEIGHT * ((self.weekend[i] + dw) ** 2 - self.weekend[i] ** 2)
+            d += TYPE_WEIGHT * ((self.thursday[i] + dth) ** 2 - self.thursday[i] ** 2)
+        return d
+
+
+def improve_night_plan(snap, plan, budget_ms, rng=random):
+    """Simulated-annealing post-pass over ``plan``; returns the improved plan.
+
+    Moves hand one slot to another member (or fill an unfilled one); swaps exchange two
+    slots between members. Every move keeps unavailability, caps, the minimum gap and
+    the Friday-Saturday pairing intact, never empties a slot, and the best state seen
+    is kept; should it still break a cap the input kept, the input is returned instead.
+    The returned plan's ``stats["local_search"]`` has before/after objectives.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+    month = _Month(snap)
+    index_of = {m_id: i for i, m_id in enumerate(snap.member_ids)}
+    by_day = {d.day: index_of.get(member_id) for d, member_id in plan.shifts}
+    chosen = {s: by_day[first] for s, (first, _, _, _) in enumerate(month.slots) if by_day.get(first) is not None}
+
+    search = _Search(month, chosen)
+    n_slots = len(month.slots)
+    before = fairness_report(snap, plan.shifts)
+    stats = {"budget_ms": budget_ms, "iterations": 0, "accepted": 0, "before": before}
+
+    current = best = 0  # objective relative to the starting plan
+    best_owner = list(search.owner)
+    temperature0 = max(1.0, 2.0 * TYPE_WEIGHT)
+    iterations = accepted = 0
+    if month.n > 1 and n_slots:
+        while True:
+            if iterations % 64 == 0:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                temperature = temperature0 * (deadline - now) / (deadline - started)
+            iterations += 1
+            s = rng.randrange(n_slots)
+            a = search.owner[s]
+            b = rng.randrange(month.n)
+            if b == a:
+                continue
+
+            if a is not None and search.slots_of[b] and rng.random() < 0.5:
+                t = rng.choice(tuple(search.slots_of[b]))
+                if not (search.can_take(b, s, giving_up=t) and search.can_take(a, t, giving_up=s)):
+                    continue
+                changes = [(a, s, -1), (b, s, 1), (b, t, -1), (a, t, 1)]
+                d = search.delta(changes)
+                fills = 0
+            else:
+                if not search.can_take(b, s):
+                    continue
+                changes = [(b, s, 1)] if a is None else [(a, s, -1), (b, s, 1)]
+                d = search.delta(changes)
+                fills = a is None
+                t = None
+
+            if not fills and d > 0 and rng.random() >= math.exp(-d / max(temperature, 1e-9)):
+                continue
+            for i, slot, sign in changes:
+                if sign < 0:
+                    search._apply(i, slot, -1)
+            for i, slot, sign in changes:
+                if sign > 0:
+                    search._apply(i, slot, 1)
+            search.owner[s] = b
+            if t is not None:
+                search.owner[t] = a
+            accepted += 1
+            # Filling a night always wins; track it apart from fairness.
+            current += d - (UNFILLED_COST if fills else 0)
+            if current < best:
+                best = current
+                best_owner = list(search.owner)
+
+    result = _build_plan(month, {s: i for s, i in enumerate(best_owner) if i is not None})
+    broken = {v[:2] for v in cap_violations(snap, result.shifts)} - {v[:2] for v in cap_violations(snap, plan.shifts)}
+    if broken:
+        result = dataclasses.replace(plan)
+        stats["rejected"] = "improved plan broke a cap"
+    result.stats = dict(plan.stats)
+    stats.update(iterations=iterations, accepted=accepted, after=fairness_report(snap, result.shifts))
+    stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    result.stats["local_search"] = stats
+    return result
+
+
+# ══════════════════════════════════════
+#  INCREMENTAL REPAIR
+# ══════════════════════════════════════
+
+REPAIR_WINDOW_DAYS = 7
+
+
+def repair_night_plan(snap, shifts, days, locked_days=(), window=REPAIR_WINDOW_DAYS):
+    """Re-plan only ``days`` of an existing month, touching as few other nights as possible.
+
+    ``snap`` covers the whole month (``start_day`` 1) and ``shifts`` are its current
+    ``(date, member_id)`` rows. Nights on ``locked_days``, or held by someone outside the
+    snapshot, never change. A night on ``days`` is vacated if its holder is now
+    unavailable and filled if it is empty: by the fairest eligible member, or, when no
+    one is eligible, by a member moving over from a night within ``window`` days that
+    someone else then takes. Returns ``{date: member_id or None}`` for every night
+    whose holder changes.
+    """
+    month = _Month(snap)
+    index_of = {m_id: i for i, m_id in enumerate(snap.member_ids)}
+    by_day = {d.day: member_id for d, member_id in shifts}
+    locked_days = set(locked_days)
+
+    chosen, locked = {}, set()
+    for s, (first, last, _, _) in enumerate(month.slots):
+        holder = by_day.get(first)
+        if holder is not None and holder not in index_of:
+            locked.add(s)
+        elif holder is not None:
+            chosen[s] = index_of[holder]
+        if any(day in locked_days for day in range(first, last + 1)):
+            locked.add(s)
+
+    search = _Search(month, chosen)
+    wanted = set(days)
+    targets = [
+        s for s, (first, last, _, _) in enumerate(month.slots)
+        if s not in locked and wanted.intersection(range(first, last + 1))
+    ]
+
+    for s in targets:
+        first, last, _, _ = month.slots[s]
+        i = search.owner[s]
+        if i is not None:
+            if not (month.unavailable[first] | month.unavailable[last]) >> i & 1:
+                continue
+            search._apply(i, s, -1)
+            search.owner[s] = None
+        _fill(search, s, locked, window)
+
+    changed = {}
+    for s, (first, last, _, _) in enumerate(month.slots):
+        before, after = chosen.get(s), search.owner[s]
+        if s in locked or before == after:
+            continue
+        for day in range(first, last + 1):
+            changed[date(snap.year, snap.month, day)] = snap.member_ids[after] if after is not None else None
+    return changed
+
+
+def _fill(search, s, locked, window):
+    """Give empty slot ``s`` to the fairest taker, directly or through one neighbouring move."""
+    month = search.month
+    best = None
+    for b in range(month.n):
+        if search.can_take(b, s):
+            d = search.delta([(b, s, 1)])
+            if best is None or d < best[0]:
+                best = (d, [(b, s, 1)])
+
+    if best is None:
+        first = month.slots[s][0]
+        for t, (t_first, _, _, _) in enumerate(month.slots):
+            b = search.owner[t]
+            if b is None or t in locked or t == s or abs(t_first - first) > window:
+                continue
+            if not search.can_take(b, s, giving_up=t):
+                continue
+            moved = search.delta([(b, t, -1), (b, s, 1)])
+            search._apply(b, t, -1)
+            search._apply(b, s, 1)
+            for c in range(month.n):
+                if c != b and search.can_take(c, t):
+                    d = moved + search.delta([(c, t, 1)])
+                    if best is None or d < best[0]:
+                        best = (d, [(b, t, -1), (b, s, 1), (c, t, 1)])
+            search._apply(b, s, -1)
+            search._apply(b, t, 1)
+
+    if best is None:
+        return
+    for i, slot, sign in best[1]:
+        search._apply(i, slot, sign)
+        if sign > 0:
+            search.owner[slot] = i
+        elif search.owner[slot] == i:
+            search.owner[slot] = None
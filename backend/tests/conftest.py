@@ -0,0 +1,20 @@
+"""Backend modules importable the way app.py imports them (``import planner``), plus app fixtures."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """The Flask app on a throwaway SQLite database (``app`` reads DATABASE_URL at import)."""
+    os.environ["DATABASE_URL"] = "sqlite:///" + str(tmp_path_factory.mktemp("db") / "shifter.db")
+    import app as app_module
+    return app_module.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
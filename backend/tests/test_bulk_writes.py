@@ -0,0 +1,73 @@
+"""Bulk unavailability, past-shift and Shotef-day writes: per-date statuses and conflicts."""
+from datetime import date, datetime
+
+import pytest
+
+import ledger
+
+
+@pytest.fixture
+def team(client):
+    team = client.post("/api/teams", json={"name": f"bulk-{datetime.utcnow().timestamp()}"}).get_json()
+    a, b = (client.post(f"/api/teams/{team['id']}/members", json={"name": n}).get_json()["id"] for n in "AB")
+    return team["id"], a, b
+
+
+def _statuses(res):
+    return [(r["date"], r["status"]) for r in res.get_json()["results"]]
+
+
+def test_bulk_unavailability_adds_updates_and_skips(app, client, team):
+    from models import Unavailability
+    _, a, _ = team
+    url = f"/api/members/{a}/unavailabilities/bulk"
+    res = client.post(url, json={"dates": ["2031-01-01", "2031-01-02", "bad", "2031-01-01"], "reason": "x"})
+    assert res.status_code == 201
+    assert _statuses(res) == [
+        ("2031-01-01", "added"), ("2031-01-02", "added"), ("bad", "invalid"), ("2031-01-01", "duplicate"),
+    ]
+    res = client.post(url, json={"dates": ["2031-01-02", "2031-01-03"], "reason": "y"})
+    assert _statuses(res) == [("2031-01-02", "updated"), ("2031-01-03", "added")]
+    with app.app_context():
+        reasons = {u.date.isoformat(): u.reason for u in Unavailability.query.filter_by(member_id=a)}
+    assert reasons == {"2031-01-01": "x", "2031-01-02": "y", "2031-01-03": "y"}
+
+
+def test_bulk_past_shifts_report_existing_rows(app, client, team):
+    from app import db
+    team_id, a, _ = team
+    url = f"/api/teams/{team_id}/past-shifts"
+    res = client.post(url, json={"member_id": a, "shift_dates": ["2020-01-01", "2020-01-02", "x", "2020-01-01"]})
+    assert res.status_code == 201 and res.get_json()["count"] == 2
+    res = client.post(url, json={"member_id": a, "shift_dates": ["2020-01-02", "2020-01-03"]})
+    assert _statuses(res) == [("2020-01-02", "exists"), ("2020-01-03", "added")]
+    with app.app_context():
+        assert ledger.verify(db.session) == []
+
+
+def test_bulk_past_shifts_conflict_rolls_back(app, client, team, monkeypatch):
+    from app import db
+    from models import Shift
+    team_id, a, _ = team
+    original = ledger.insert_on_conflict
+
+    def lose_a_row(*args, **kwargs):  # as if another writer inserted one of the rows first
+        return original(*args, **kwargs) - 1
+
+    monkeypatch.setattr(ledger, "insert_on_conflict", lose_a_row)
+    res = client.post(f"/api/teams/{team_id}/past-shifts", json={"member_id": a, "shift_dates": ["2020-02-03"]})
+    assert res.status_code == 409
+    with app.app_context():
+        assert Shift.query.filter_by(member_id=a, shift_date=date(2020, 2, 3)).first() is None
+        assert ledger.verify(db.session) == []
+
+
+def test_bulk_shotef_days_skip_days_taken_in_the_team(client, team):
+    team_id, a, b = team
+    url = f"/api/teams/{team_id}/shotef-days"
+    res = client.post(url, json={"member_id": a, "dates": ["2031-02-03", "2031-02-04"]})
+    assert _statuses(res) == [("2031-02-03", "added"), ("2031-02-04", "added")]
+    res = client.post(url, json={"member_id": b, "dates": ["2031-02-03", "2031-02-05"]})
+    assert _statuses(res) == [("2031-02-03", "taken"), ("2031-02-05", "added")]
+    res = client.post(url, json={"member_id": a, "dates": ["2031-02-04"]})
+    assert _statuses(res) == [("2031-02-04", "exists")] and res.get_json()["count"] == 0
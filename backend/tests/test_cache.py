@@ -0,0 +1,31 @@
+"""SQLiteCache keeps hits read-only while fresh and trims in batches."""
+import cache
+
+
+def _used_at(c, key):
+    return c._connect().execute("SELECT used_at FROM entries WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_hit_refreshes_used_at_only_once_it_is_stale(tmp_path, monkeypatch):
+    c = cache.SQLiteCache(str(tmp_path / "c.sqlite"), ttl=100)
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    c.set("k", {"v": 1})
+    now[0] += 100 * cache.TOUCH_FRACTION - 1
+    assert c.get("k") == {"v": 1}
+    assert _used_at(c, "k") == 1000.0
+    now[0] += 2
+    assert c.get("k") == {"v": 1}
+    assert _used_at(c, "k") == now[0]
+
+
+def test_set_trims_once_per_batch(tmp_path):
+    c = cache.SQLiteCache(str(tmp_path / "c.sqlite"), ttl=100, max_entries=64)
+    every = c._evict_every
+    for i in range(64 + every - 1):
+        c.set(f"k{i}", i)
+    assert c.stats()["size"] == 64 + every - 1
+    c.set("last", 0)
+    stats = c.stats()
+    assert stats["size"] == 64 and stats["evictions"] == every
+    assert c.get("last") == 0 and c.get("k0") is None
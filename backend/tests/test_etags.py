@@ -0,0 +1,42 @@
+"""Strong ETags on the cached views and 304s for a matching If-None-Match."""
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def team(client):
+    team = client.post("/api/teams", json={"name": f"etag-{datetime.utcnow().timestamp()}"}).get_json()
+    member = client.post(f"/api/teams/{team['id']}/members", json={"name": "A"}).get_json()
+    return team["id"], member["id"]
+
+
+@pytest.mark.parametrize("path", [
+    "/api/teams/{team}/schedule-view?year=2031&month=8",
+    "/api/teams/{team}/past-shifts-view?year=2024&month=8",
+    "/api/teams",
+    "/api/reports",
+])
+def test_conditional_get_round_trip(client, team, path):
+    url = path.format(team=team[0])
+    first = client.get(url)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and not etag.startswith("W/")
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    again = client.get(url, headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+    assert again.headers["ETag"] == etag
+
+    other = client.get(url, headers={"If-None-Match": '"something-else"'})
+    assert other.status_code == 200 and other.get_json() == first.get_json()
+
+
+def test_write_changes_the_etag(client, team):
+    team_id, member_id = team
+    url = f"/api/teams/{team_id}/schedule-view?year=2031&month=8"
+    etag = client.get(url).headers["ETag"]
+    client.post(f"/api/members/{member_id}/unavailabilities", json={"date": "2031-08-12"})
+    res = client.get(url, headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
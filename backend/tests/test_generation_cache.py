@@ -0,0 +1,57 @@
+"""Fingerprint cache on generate, through the synchronous endpoint and background jobs."""
+import time
+from datetime import date, datetime, timedelta
+
+
+def _team(client, size=6):
+    team = client.post("/api/teams", json={"name": f"cache-{datetime.utcnow().timestamp()}"}).get_json()
+    for i in range(size):
+        client.post(f"/api/teams/{team['id']}/members", json={"name": f"M{i}"})
+    return team["id"]
+
+
+def _month():
+    first = date.today().replace(day=1) + timedelta(days=62)
+    return first.year, first.month
+
+
+def _run_job(client, team_id, body):
+    job = client.post(f"/api/teams/{team_id}/schedule/generate-jobs", json=body).get_json()["job"]
+    for _ in range(100):
+        job = client.get(f"/api/generation-jobs/{job['id']}").get_json()["job"]
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("job did not finish")
+
+
+def test_unseeded_rerun_is_cached_unless_rerolled(client):
+    team_id = _team(client)
+    year, month = _month()
+    url = f"/api/teams/{team_id}/schedule/generate"
+    first = client.post(url, json={"year": year, "month": month}).get_json()
+    again = client.post(url, json={"year": year, "month": month}).get_json()
+    assert not first["cached"] and again["cached"]
+    assert again["assignments"] == first["assignments"]
+    rerolled = client.post(url, json={"year": year, "month": month, "reroll": True}).get_json()
+    assert not rerolled["cached"]
+
+
+def test_generation_jobs_use_the_cache(client):
+    team_id = _team(client)
+    year, month = _month()
+    body = {"year": year, "month": month, "seed": 7}
+    first = _run_job(client, team_id, body)
+    again = _run_job(client, team_id, body)
+    assert first["status"] == again["status"] == "done"
+    assert not first["result"]["cached"] and again["result"]["cached"]
+    assert again["result"]["assignments"] == first["result"]["assignments"]
+    rerolled = _run_job(client, team_id, {**body, "reroll": True})
+    assert not rerolled["result"]["cached"]
+
+
+def test_generation_job_rejects_bad_options(client):
+    team_id = _team(client)
+    year, month = _month()
+    res = client.post(f"/api/teams/{team_id}/schedule/generate-jobs", json={"year": year, "month": month, "seed": "x"})
+    assert res.status_code == 400
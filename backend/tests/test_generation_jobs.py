@@ -0,0 +1,65 @@
+"""Stale generation jobs: only jobs whose process is gone (or whose lease ran out) are failed."""
+import socket
+import subprocess
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def team_id(app, client):
+    from app import db
+    from models import GenerationJob
+    with app.app_context():
+        GenerationJob.query.delete()
+        db.session.commit()
+    team = client.post("/api/teams", json={"name": f"jobs-{datetime.utcnow().timestamp()}"}).get_json()
+    return team["id"]
+
+
+def _dead_pid():
+    proc = subprocess.Popen(["true"])
+    proc.wait()
+    return proc.pid
+
+
+def _job(team_id, month, owner, age=timedelta(0)):
+    from models import GenerationJob
+    return GenerationJob(
+        team_id=team_id, year=2030, month=month, status="running", active_key=f"{team_id}:2030:{month}",
+        owner=owner, created_at=datetime.utcnow() - age, started_at=datetime.utcnow() - age,
+    )
+
+
+def test_only_stale_jobs_are_stale(app, team_id):
+    import app as app_module
+    host = socket.gethostname()
+    with subprocess.Popen(["sleep", "30"]) as live:
+        try:
+            cases = {
+                _job(team_id, 1, f"{host}:{live.pid}"): False,
+                _job(team_id, 2, f"{host}:{_dead_pid()}"): True,
+                _job(team_id, 3, "elsewhere:1"): False,
+                _job(team_id, 4, "elsewhere:1", timedelta(hours=1)): True,
+                _job(team_id, 5, None): False,
+                _job(team_id, 6, app_module._job_owner()): False,
+            }
+            for job, stale in cases.items():
+                assert app_module._job_is_stale(job) is stale, job.month
+        finally:
+            live.kill()
+    # At startup our own owner id can only belong to an earlier process.
+    assert app_module._job_is_stale(_job(team_id, 7, app_module._job_owner()), at_startup=True)
+
+
+def test_submit_replaces_a_stale_job(app, team_id):
+    from app import db, submit_generation_job
+    from models import GenerationJob
+    with app.app_context():
+        stale = _job(team_id, 2, f"{socket.gethostname()}:{_dead_pid()}")
+        db.session.add(stale)
+        db.session.commit()
+        job, created = submit_generation_job(team_id, 2030, 2)
+        assert created and job.id != stale.id
+        old = db.session.get(GenerationJob, stale.id)
+        assert old.status == "failed" and old.active_key is None
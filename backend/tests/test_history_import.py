@@ -0,0 +1,104 @@
+"""History import from CSV and XLSX: validation, chunked loading, swaps and re-runs."""
+import io
+from datetime import date, datetime
+
+import pytest
+from openpyxl import Workbook
+
+import history_import
+import ledger
+
+
+@pytest.fixture
+def teams(client):
+    suffix = datetime.utcnow().timestamp()
+    names = {}
+    for prefix in ("Alpha", "Beta"):
+        name = f"{prefix}-{suffix}"
+        team_id = client.post("/api/teams", json={"name": name}).get_json()["id"]
+        for i in range(3):
+            client.post(f"/api/teams/{team_id}/members", json={"name": f"{prefix}{i}"})
+        names[prefix] = (name, team_id)
+    return names
+
+
+def _rows(teams):
+    alpha, beta = teams["Alpha"][0], teams["Beta"][0]
+    return [
+        ["Team", "Member", "Date", "Type", "Covered_By"],
+        [alpha, "Alpha0", date(2024, 1, 1), "shift", ""],
+        [alpha, "Alpha1", date(2024, 1, 2), "", "Alpha2"],  # Alpha2 worked Alpha1's shift
+        [beta, "Beta0", date(2024, 1, 1), "shift", ""],
+        [beta, "Beta1", date(2024, 1, 7), "shotef", ""],
+        [alpha, "Alpha0", date(2024, 1, 1), "shift", ""],  # repeated in the file
+        ["Gamma", "X", date(2024, 1, 1), "", ""],
+        [alpha, "Nobody", date(2024, 1, 3), "", ""],
+        [alpha, "Alpha1", "13/01/2024", "", ""],
+        [alpha, "Alpha1", date(2024, 1, 4), "weird", ""],
+    ]
+
+
+def _csv(rows):
+    text = "\n".join(",".join(str(c) for c in row) for row in rows) + "\n"
+    return io.BytesIO(text.encode()), "history.csv"
+
+
+def _xlsx(rows):
+    wb = Workbook()
+    for row in rows:
+        wb.active.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf, "history.xlsx"
+
+
+def _import(client, file, **form):
+    res = client.post("/api/history/import", data={"file": file, **form}, content_type="multipart/form-data")
+    return res.status_code, res.get_json()
+
+
+@pytest.mark.parametrize("make_file", [_csv, _xlsx])
+def test_import_csv_and_xlsx(app, client, teams, make_file, monkeypatch):
+    from app import db
+    from models import Shift, ShiftSwap, ShotefDay
+    monkeypatch.setattr(history_import, "CHUNK_ROWS", 2)
+    team_ids = [team_id for _, team_id in teams.values()]
+
+    def stored():
+        with app.app_context():
+            return (
+                Shift.query.filter(Shift.team_id.in_(team_ids)).count(),
+                ShiftSwap.query.join(Shift).filter(Shift.team_id.in_(team_ids)).count(),
+                ShotefDay.query.filter(ShotefDay.team_id.in_(team_ids)).count(),
+            )
+
+    code, report = _import(client, make_file(_rows(teams)), dry_run="1")
+    assert code == 200 and report["dry_run"]
+    assert stored() == (0, 0, 0)
+
+    code, report = _import(client, make_file(_rows(teams)))
+    assert code == 200
+    assert (report["rows"], report["shifts"], report["swaps"], report["shotef_days"]) == (9, 3, 1, 1)
+    assert (report["duplicates"], report["error_count"], report["teams"]) == (1, 4, 2)
+    assert [e["row"] for e in report["errors"]] == [7, 8, 9, 10]
+    assert report["chunks"] >= 2
+    assert stored() == (3, 1, 1)
+    with app.app_context():
+        shift = Shift.query.filter_by(team_id=teams["Alpha"][1], shift_date=date(2024, 1, 2)).one()
+        swap = ShiftSwap.query.filter_by(shift_id=shift.id).one()
+        assert (shift.member.name, swap.original_member.name) == ("Alpha2", "Alpha1")
+        assert swap.covering_member_id == shift.member_id
+        assert ledger.verify(db.session) == []
+
+    code, report = _import(client, make_file(_rows(teams)))
+    assert (report["shifts"], report["shotef_days"], report["exists"]) == (0, 0, 4)
+    assert stored() == (3, 1, 1)
+
+
+def test_import_rejects_unreadable_files(client):
+    assert _import(client, (io.BytesIO(b"x"), "history.txt"))[0] == 400
+    code, body = _import(client, (io.BytesIO(b"team,date\nA,2024-01-01\n"), "history.csv"))
+    assert code == 400 and "member" in body["error"]
+    code, body = _import(client, (io.BytesIO(b"not a zip"), "history.xlsx"))
+    assert code == 400 and "xlsx" in body["error"]
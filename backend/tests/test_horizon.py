@@ -0,0 +1,33 @@
+"""Horizon generation persists each month as a diff, like a single generate."""
+import random
+from datetime import date, datetime, timedelta
+
+import ledger
+
+
+def test_regenerating_a_horizon_keeps_unchanged_shifts(app, client):
+    from app import db
+    from models import Shift
+    team = client.post("/api/teams", json={"name": f"horizon-{datetime.utcnow().timestamp()}"}).get_json()
+    for i in range(7):
+        client.post(f"/api/teams/{team['id']}/members", json={"name": f"M{i}"})
+    first = (date.today().replace(day=1) + timedelta(days=62)).replace(day=1)
+    body = {"year": first.year, "month": first.month, "months": 3}
+    url = f"/api/teams/{team['id']}/schedule/generate-horizon"
+
+    def stored():
+        with app.app_context():
+            return {(s.id, s.shift_date, s.member_id) for s in Shift.query.filter_by(team_id=team["id"])}
+
+    random.seed(3)
+    months = client.post(url, json=body).get_json()["months"]
+    assert all(m["diff"]["kept"] == 0 for m in months)
+    before = stored()
+
+    random.seed(3)
+    months = client.post(url, json=body).get_json()["months"]
+    assert sum(m["diff"]["kept"] for m in months) == len(before)
+    assert all(m["diff"]["reassigned"] == m["diff"]["inserted"] == m["diff"]["deleted"] == 0 for m in months)
+    assert stored() == before
+    with app.app_context():
+        assert ledger.verify(db.session) == []
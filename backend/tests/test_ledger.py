@@ -0,0 +1,51 @@
+"""The ledger stays exact when several sessions write the same bucket at once."""
+import threading
+from datetime import date, datetime
+
+import ledger
+
+
+def test_concurrent_writes_to_one_bucket(app, client):
+    from app import db
+    from models import Shift
+    team = client.post("/api/teams", json={"name": f"ledger-{datetime.utcnow().timestamp()}"}).get_json()
+    member = client.post(f"/api/teams/{team['id']}/members", json={"name": "A"}).get_json()
+    start = threading.Barrier(8)
+    errors = []
+
+    def add_shift(day):
+        with app.app_context():
+            try:
+                start.wait()
+                db.session.add(Shift(member_id=member["id"], team_id=team["id"], shift_date=date(2031, 3, day)))
+                db.session.commit()
+            except Exception as e:  # noqa: BLE001 - reported below
+                errors.append(e)
+
+    # Mondays to Wednesdays of March 2031: eight shifts in one (member, month, "normal") bucket.
+    threads = [threading.Thread(target=add_shift, args=(d,)) for d in (3, 4, 5, 10, 11, 12, 17, 18)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    with app.app_context():
+        assert ledger.verify(db.session) == []
+        totals = ledger.member_totals(db.session, [member["id"]])
+    assert totals[member["id"]]["normal"] == 8
+
+
+def test_mid_month_cutoff_takes_out_earlier_swaps(app, client):
+    from app import db
+    from models import Shift, ShiftSwap
+    team = client.post("/api/teams", json={"name": f"cutoff-{datetime.utcnow().timestamp()}"}).get_json()
+    a, b = (client.post(f"/api/teams/{team['id']}/members", json={"name": n}).get_json()["id"] for n in "AB")
+    with app.app_context():
+        for day in (3, 20):  # B covers A before and after the cut-off
+            shift = Shift(member_id=b, team_id=team["id"], shift_date=date(2031, 4, day))
+            db.session.add(ShiftSwap(shift=shift, original_member_id=a, covering_member_id=b))
+        db.session.commit()
+        totals = ledger.member_totals(db.session, [a, b], since=date(2031, 4, 15))
+    assert totals[b]["covers_done"] == 1 and totals[a]["covers_received"] == 1
+    assert totals[b]["normal"] + totals[b]["thursday"] + totals[b]["weekend"] == 1
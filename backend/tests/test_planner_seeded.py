@@ -0,0 +1,123 @@
+"""Seeded plans match the original per-day sort in create_schedule / generate_shotef.
+
+The reference planners below are that sort, lifted off the database unchanged: every
+day, each eligible member is keyed by ``(fairness tuple, rng.random())`` in member
+order and the smallest key wins.
+"""
+import random
+from calendar import monthrange
+from datetime import date
+
+import pytest
+
+import planner
+
+
+def baseline_plan_night_shifts(snap, rng):
+    el = planner.Eligibility(snap)
+    past = list(snap.past_count)
+    past_weekend = list(snap.past_weekend)
+    past_thursday = list(snap.past_thursday)
+    shifts = []
+
+    def sort_key(i, kind):
+        type_count = {"weekend": past_weekend, "thursday": past_thursday}.get(kind, past)[i]
+        return (type_count, past[i], el.monthly_total(i), rng.random())
+
+    day = snap.start_day
+    while day <= el.last_day:
+        d = date(snap.year, snap.month, day)
+        wd = d.weekday()
+        if wd == 4:
+            pair = day + 1 <= el.last_day
+            mask = el.eligible(day, "weekend")
+            if pair:
+                mask &= ~el.unavailable[day + 1]
+            potential = sorted(planner.iter_members(mask), key=lambda i: sort_key(i, "weekend"))
+            if potential:
+                chosen = potential[0]
+                shifts += [(d, snap.member_ids[chosen])] + ([(date(snap.year, snap.month, day + 1), snap.member_ids[chosen])] if pair else [])
+                past[chosen] += 2 if pair else 1
+                past_weekend[chosen] += 1
+                el.record(chosen, "weekend", day + 1 if pair else day)
+            day += 2 if pair else 1
+            continue
+        if day == 1 and wd == 5 and snap.prev_friday:
+            member_id, _ = snap.prev_friday
+            i = snap.member_ids.index(member_id) if member_id in snap.member_ids else None
+            takes_it = snap.max_weekend > 0 if i is None else not (el.unavailable[day] | el.capped["weekend"]) & (1 << i)
+            if takes_it:
+                shifts.append((d, member_id))
+                if i is not None:
+                    past[i] += 1
+                    past_weekend[i] += 1
+                    el.record(i, "weekend", day)
+                day += 1
+                continue
+        kind = planner.day_type(d)
+        potential = sorted(planner.iter_members(el.eligible(day, kind if wd != 5 else None)), key=lambda i: sort_key(i, kind))
+        if potential:
+            chosen = potential[0]
+            shifts.append((d, snap.member_ids[chosen]))
+            if kind == "thursday":
+                past_thursday[chosen] += 1
+            elif kind == "weekend":
+                past_weekend[chosen] += 1
+            past[chosen] += 1
+            el.record(chosen, kind, day)
+        day += 1
+    return shifts
+
+
+def baseline_plan_shotef(snap, rng):
+    everyone = (1 << len(snap.member_ids)) - 1
+    counts = list(snap.counts)
+    assigned = 0
+    weeks = []
+    for _, days in planner.shotef_week_blocks(snap.year, snap.month):
+        eligible = sorted(planner.iter_members(everyone & ~assigned or everyone), key=lambda i: (counts[i], rng.random()))
+        chosen = eligible[0]
+        assigned |= 1 << chosen
+        counts[chosen] += len(days)
+        weeks.append(snap.member_ids[chosen])
+        for d in days:
+            if d.day in snap.unavailable[chosen]:
+                # Substitute suggestions are sorted with a random tie-break of their own.
+                sorted(planner.iter_members(everyone & ~(1 << chosen)), key=lambda i: (counts[i], rng.random()))
+    return weeks
+
+
+def random_month(case):
+    rng = random.Random(case)
+    year, month = rng.choice([(2026, 11), (2027, 5), (2027, 2), (2026, 8), (2027, 1)])
+    last_day = monthrange(year, month)[1]
+    n = rng.randint(1, 14)
+    ids = list(range(10, 10 + n))
+    unavailable = [set(rng.sample(range(1, last_day + 1), rng.randint(0, 12))) for _ in ids]
+    # Small ranges so that fairness tuples tie often and the tie-break decides.
+    night = planner.NightSnapshot(
+        year=year, month=month, start_day=rng.choice([1, 1, rng.randint(1, last_day)]),
+        member_ids=ids, names=[f"m{i}" for i in ids], unavailable=unavailable, reasons={},
+        past_count=[rng.randint(0, 3) for _ in ids], past_weekend=[rng.randint(0, 1) for _ in ids],
+        past_thursday=[rng.randint(0, 1) for _ in ids],
+        max_normal=rng.randint(0, 10), max_thursday=rng.randint(0, 3), max_weekend=rng.randint(0, 3),
+        min_gap=rng.randint(1, 4), prev_friday=(rng.choice(ids), "prev") if rng.random() < 0.3 else None,
+    )
+    shotef = planner.ShotefSnapshot(
+        year=year, month=month, member_ids=ids, names=night.names,
+        counts=[rng.randint(0, 2) for _ in ids], unavailable=unavailable, reasons={},
+    )
+    return night, shotef
+
+
+@pytest.mark.parametrize("seed", [0, 1, 7, 42, 2024])
+def test_seeded_plans_match_the_per_day_sort(seed):
+    for case in range(60):
+        night, shotef = random_month(case)
+        expected_rng = random.Random(seed)
+        expected_shifts = baseline_plan_night_shifts(night, expected_rng)
+        expected_weeks = baseline_plan_shotef(shotef, expected_rng)
+
+        night_plan, shotef_plan, _ = planner.plan_team_month(night, shotef, seed)
+        assert night_plan.shifts == expected_shifts, case
+        assert [a["member_id"] for a in shotef_plan.assignments] == expected_weeks, case
@@ -0,0 +1,87 @@
+"""Preview plans without writing; apply rejects expired, stale and outdated previews."""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def team(client):
+    team = client.post("/api/teams", json={"name": f"preview-{datetime.utcnow().timestamp()}"}).get_json()
+    members = {
+        f"M{i}": client.post(f"/api/teams/{team['id']}/members", json={"name": f"M{i}"}).get_json()["id"]
+        for i in range(6)
+    }
+    first = date.today().replace(day=1) + timedelta(days=62)
+    return {"id": team["id"], "members": members, "year": first.year, "month": first.month}
+
+
+def _stored(app, team_id):
+    from models import Shift, ShotefDay
+    with app.app_context():
+        shifts = {(s.id, s.shift_date, s.member_id) for s in Shift.query.filter_by(team_id=team_id)}
+        shotef = {(d.id, d.date, d.member_id) for d in ShotefDay.query.filter_by(team_id=team_id)}
+    return shifts, shotef
+
+
+def _preview(client, team, **extra):
+    res = client.post(f"/api/teams/{team['id']}/schedule/preview", json={
+        "year": team["year"], "month": team["month"], **extra,
+    })
+    assert res.status_code == 200
+    return res.get_json()
+
+
+def _apply(client, team, token):
+    return client.post(f"/api/teams/{team['id']}/schedule/apply", json={"token": token})
+
+
+def test_preview_leaves_shifts_and_shotef_days_alone(app, client, team):
+    month = {"year": team["year"], "month": team["month"]}
+    client.post(f"/api/teams/{team['id']}/schedule/generate", json={**month, "seed": 1})
+    before = _stored(app, team["id"])
+    assert before[0] and before[1]
+    preview = _preview(client, team, seed=2)
+    assert preview["assignments"]
+    assert _stored(app, team["id"]) == before
+
+    applied = _apply(client, team, preview["token"])
+    assert applied.status_code == 200
+    shifts, _ = _stored(app, team["id"])
+    planned = {(a["date"], team["members"][a["member_name"]]) for a in preview["assignments"]}
+    assert {(d.isoformat(), member_id) for _, d, member_id in shifts} == planned
+    assert _apply(client, team, preview["token"]).status_code == 404
+
+
+def test_apply_rejects_an_expired_preview(app, client, team):
+    import app as app_module
+    from app import db
+    from models import SchedulePreview
+    token = _preview(client, team)["token"]
+    with app.app_context():
+        preview = SchedulePreview.query.filter_by(token=token).one()
+        preview.created_at -= app_module.PREVIEW_TTL + timedelta(minutes=1)
+        db.session.commit()
+    res = _apply(client, team, token)
+    assert res.status_code == 410
+    assert _stored(app, team["id"]) == (set(), set())
+    assert _apply(client, team, token).status_code == 404
+
+
+def test_apply_rejects_a_preview_whose_start_day_has_passed(app, client, team, monkeypatch):
+    import app as app_module
+    token = _preview(client, team)["token"]
+    monkeypatch.setattr(app_module, "_generation_start", lambda y, m: date(y, m, 5))
+    res = _apply(client, team, token)
+    assert res.status_code == 409
+    assert "passed" in res.get_json()["error"]
+    assert _stored(app, team["id"]) == (set(), set())
+
+
+def test_apply_rejects_a_preview_after_a_member_left(app, client, team):
+    preview = _preview(client, team)
+    gone = team["members"][preview["assignments"][0]["member_name"]]
+    assert client.delete(f"/api/members/{gone}").status_code == 200
+    res = _apply(client, team, preview["token"])
+    assert res.status_code == 409
+    assert "members changed" in res.get_json()["error"]
+    assert _stored(app, team["id"]) == (set(), set())
@@ -0,0 +1,62 @@
+"""Generation issues the same number of SQL statements whatever the team size."""
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+
+@contextmanager
+def count_statements(engine):
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+
+
+def _team_with_history(client, size):
+    from app import db
+    from models import Shift, ShiftSwap, Unavailability
+    team = client.post("/api/teams", json={"name": f"size-{size}-{datetime.utcnow().timestamp()}"}).get_json()
+    members = [
+        client.post(f"/api/teams/{team['id']}/members", json={"name": f"M{i}"}).get_json()["id"]
+        for i in range(size)
+    ]
+    rng = random.Random(size)
+    past = date.today().replace(day=1) - timedelta(days=90)
+    for i, member_id in enumerate(members):
+        shift = Shift(member_id=member_id, team_id=team["id"], shift_date=past + timedelta(days=i))
+        db.session.add(shift)
+        db.session.add(Unavailability(member_id=member_id, date=past + timedelta(days=120 + rng.randrange(20))))
+        if i:
+            db.session.add(ShiftSwap(shift=shift, original_member_id=members[i - 1], covering_member_id=member_id))
+    db.session.commit()
+    return team["id"]
+
+
+def _generation_statements(app, team_id, year, month):
+    import app as app_module
+    from app import db
+    db.session.remove()
+    with count_statements(db.engine) as statements:
+        ctx = app_module.load_generation_context(team_id, year, month)
+        app_module.create_schedule(ctx, rng=random.Random(1))
+    return len(statements)
+
+
+def test_generation_query_count_is_independent_of_team_size(app, client):
+    first = date.today().replace(day=1) + timedelta(days=62)
+    year, month = first.year, first.month
+    with app.app_context():
+        small, large = _team_with_history(client, 5), _team_with_history(client, 40)
+        counts = {}
+        for size, team_id in ((5, small), (40, large)):
+            # A first generation, then a regeneration that replaces it.
+            counts[size] = [_generation_statements(app, team_id, year, month) for _ in range(2)]
+    assert counts[5] == counts[40]
@@ -0,0 +1,37 @@
+"""Schedule repair limited to one member's nights."""
+from datetime import date, datetime, timedelta
+
+
+def _shifts(client, team_id, year, month):
+    body = client.get(f"/api/teams/{team_id}/schedule?year={year}&month={month}").get_json()
+    return {s["shift_date"]: s["member_id"] for s in body["shifts"]}
+
+
+def test_member_id_limits_repair_to_that_members_nights(client):
+    first = date.today().replace(day=1) + timedelta(days=62)
+    year, month = first.year, first.month
+    team = client.post("/api/teams", json={"name": f"repair-{datetime.utcnow().timestamp()}"}).get_json()
+    for i in range(8):
+        client.post(f"/api/teams/{team['id']}/members", json={"name": f"M{i}"})
+    assert client.post(f"/api/teams/{team['id']}/schedule/generate", json={"year": year, "month": month}).status_code == 200
+    before = _shifts(client, team["id"], year, month)
+
+    # Two weekday nights held by different members, both now unavailable.
+    weekdays = [d for d in sorted(before) if date.fromisoformat(d).weekday() in (0, 1, 2, 6)]
+    night_a = weekdays[0]
+    night_b = next(d for d in weekdays if before[d] != before[night_a])
+    for night in (night_a, night_b):
+        client.post(f"/api/members/{before[night]}/unavailabilities", json={"date": night})
+
+    res = client.post(f"/api/teams/{team['id']}/schedule/repair", json={
+        "year": year, "month": month, "dates": [night_a, night_b], "member_id": before[night_a],
+    })
+    assert res.status_code == 200
+    after = _shifts(client, team["id"], year, month)
+    assert after[night_a] != before[night_a]
+    assert after[night_b] == before[night_b]
+
+    bad = client.post(f"/api/teams/{team['id']}/schedule/repair", json={
+        "year": year, "month": month, "dates": [night_a], "member_id": "x",
+    })
+    assert bad.status_code == 400
@@ -0,0 +1,44 @@
+"""Versioned response cache: a write invalidates only the scopes it touches."""
+from datetime import datetime
+
+
+def _team(client, prefix):
+    team = client.post("/api/teams", json={"name": f"{prefix}-{datetime.utcnow().timestamp()}"}).get_json()
+    member = client.post(f"/api/teams/{team['id']}/members", json={"name": "A"}).get_json()
+    return team["id"], member["id"]
+
+
+def _hit(client, url):
+    """Whether GET ``url`` was served from the cache."""
+    before = client.get("/api/cache/stats").get_json()["hits"]
+    assert client.get(url).status_code == 200
+    return client.get("/api/cache/stats").get_json()["hits"] == before + 1
+
+
+def test_team_write_keeps_other_teams_warm(client):
+    team_a, member_a = _team(client, "cache-a")
+    team_b, _ = _team(client, "cache-b")
+    view = "/api/teams/{}/schedule-view?year=2031&month=7"
+    for url in (view.format(team_a), view.format(team_b), "/api/teams", "/api/reports"):
+        client.get(url)
+        assert _hit(client, url)
+
+    client.post(f"/api/members/{member_a}/unavailabilities", json={"date": "2031-07-09"})
+    assert _hit(client, view.format(team_b))
+    assert _hit(client, "/api/teams") and _hit(client, "/api/reports")
+    assert not _hit(client, view.format(team_a))
+    assert _hit(client, view.format(team_a))
+
+
+def test_global_write_invalidates_every_team(client):
+    team_id, _ = _team(client, "cache-global")
+    url = f"/api/teams/{team_id}/schedule-view?year=2031&month=7"
+    client.get(url)
+    assert _hit(client, url)
+    from models import SETTINGS_DEFAULTS
+    key = "min_days_between_shifts"
+    client.put("/api/settings", json={"settings": {key: "3"}})
+    try:
+        assert not _hit(client, url)
+    finally:
+        client.put("/api/settings", json={"settings": {key: SETTINGS_DEFAULTS[key]}})
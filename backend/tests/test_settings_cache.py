@@ -0,0 +1,30 @@
+"""Typed settings are cached across requests until the settings version row moves on."""
+from datetime import datetime
+
+from sqlalchemy import text
+
+
+def test_settings_cache_follows_the_version_row(app, client):
+    import app as app_module
+    from app import db
+    team_id = client.post("/api/teams", json={"name": f"settings-{datetime.utcnow().timestamp()}"}).get_json()["id"]
+    key = "min_days_between_shifts"
+
+    with app.app_context():
+        first = app_module.get_team_settings(team_id)
+    with app.app_context():
+        assert app_module.get_team_settings(team_id) is first  # no reload while the version is unchanged
+
+    client.put("/api/settings", json={"team_id": team_id, "settings": {key: "4"}})
+    with app.app_context():
+        assert app_module.get_team_settings(team_id).raw[key] == "4"
+
+    # Another process changes a setting: its row and version bump land in the database only.
+    with app.app_context():
+        db.session.execute(
+            text("UPDATE settings SET value = '5' WHERE team_id = :team AND key = :key"), {"team": team_id, "key": key},
+        )
+        db.session.execute(text("UPDATE settings_version SET version = version + 1 WHERE id = 1"))
+        db.session.commit()
+    with app.app_context():
+        assert app_module.get_team_settings(team_id).raw[key] == "5"
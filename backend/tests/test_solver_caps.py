@@ -0,0 +1,69 @@
+"""Per-type caps hold for the optimal solver, not just the greedy planner."""
+import random
+from calendar import monthrange
+
+import pytest
+
+import planner
+import solver
+
+
+def _snapshot(year, month, n, max_weekend, rng=None, start_day=1, prev_friday=None):
+    ids = [101 + i for i in range(n)]
+    last_day = monthrange(year, month)[1]
+    rng = rng or random.Random(0)
+    return planner.NightSnapshot(
+        year=year, month=month, start_day=start_day, member_ids=ids, names=[f"m{i}" for i in ids],
+        unavailable=[set(rng.sample(range(1, last_day + 1), rng.randint(0, 8))) for _ in ids], reasons={},
+        past_count=[rng.randint(0, 20) for _ in ids], past_weekend=[rng.randint(0, 5) for _ in ids],
+        past_thursday=[rng.randint(0, 5) for _ in ids],
+        max_normal=rng.randint(0, 12), max_thursday=rng.randint(0, 3), max_weekend=max_weekend,
+        min_gap=rng.randint(1, 4), prev_friday=prev_friday,
+    )
+
+
+def random_snapshot(case):
+    rng = random.Random(case)
+    year, month = rng.choice([(2027, 5), (2026, 8), (2025, 3), (2027, 1), (2026, 11)])
+    start_day = rng.choice([1, 1, 1, rng.randint(1, monthrange(year, month)[1])])
+    n = rng.randint(3, 9)
+    prev_friday = (101 + rng.randrange(n), "prev") if rng.random() < 0.5 else None
+    return _snapshot(year, month, n, rng.randint(0, 3), rng, start_day, prev_friday)
+
+
+def test_opening_saturday_uses_a_weekend():
+    # 1 May 2027 is a Saturday with no Friday to pair; member 101 is owed the most weekends.
+    snap = planner.NightSnapshot(
+        year=2027, month=5, start_day=1, member_ids=[101, 102, 103, 104], names=["a", "b", "c", "d"],
+        unavailable=[set() for _ in range(4)], reasons={}, past_count=[0, 5, 5, 5],
+        past_weekend=[0, 3, 3, 3], past_thursday=[0, 0, 0, 0],
+        max_normal=20, max_thursday=5, max_weekend=1, min_gap=1,
+    )
+    month = solver._Month(snap)
+    plan = solver._build_plan(month, solver._optimal_assignment(month, float("inf")))
+    assert solver.cap_violations(snap, plan.shifts) == []
+
+
+@pytest.mark.parametrize("case", range(0, 400, 7))
+def test_greedy_plans_pass_the_cap_check(case):
+    snap = random_snapshot(case)
+    plan = planner.plan_night_shifts(snap, random.Random(1))
+    assert solver.cap_violations(snap, plan.shifts) == []
+
+
+@pytest.mark.parametrize("case", range(0, 400, 7))
+def test_optimal_plans_respect_caps(case):
+    snap = random_snapshot(case)
+    month = solver._Month(snap)
+    plan = solver._build_plan(month, solver._optimal_assignment(month, float("inf")))
+    assert solver.cap_violations(snap, plan.shifts) == []
+
+
+@pytest.mark.parametrize("case", range(0, 400, 7))
+@pytest.mark.parametrize("seed", [1, 2])
+def test_local_search_keeps_caps(case, seed):
+    snap = random_snapshot(case)
+    plan = planner.plan_night_shifts(snap, random.Random(1))
+    improved = solver.improve_night_plan(snap, plan, 20, random.Random(seed))
+    assert solver.cap_violations(snap, improved.shifts) == []
+    assert "rejected" not in improved.stats["local_search"]
@@ -0,0 +1,52 @@
+"""Swap balance, matrix and revert."""
+from datetime import date, datetime
+
+
+def _team(client, names):
+    team = client.post("/api/teams", json={"name": f"swaps-{datetime.utcnow().timestamp()}"}).get_json()
+    ids = [client.post(f"/api/teams/{team['id']}/members", json={"name": n}).get_json()["id"] for n in names]
+    return team["id"], ids
+
+
+def test_swaps_with_other_teams_are_not_counted(app, client):
+    from app import db
+    from models import Shift, ShiftSwap
+    team_id, (a, b) = _team(client, ["A", "B"])
+    other_team_id, (x,) = _team(client, ["X"])
+    with app.app_context():
+        # B covered A (within the team), X from another team covered A, and A covered X.
+        for holder, team, original, day in ((b, team_id, a, 1), (x, other_team_id, a, 2), (a, team_id, x, 3)):
+            shift = Shift(member_id=holder, team_id=team, shift_date=date(2031, 5, day))
+            db.session.add(ShiftSwap(shift=shift, original_member_id=original, covering_member_id=holder))
+        db.session.commit()
+
+    balances = {
+        r["member_id"]: r for r in client.get(f"/api/teams/{team_id}/swap-balance").get_json()["balances"]
+    }
+    assert (balances[a]["covers_done"], balances[a]["covers_received"]) == (0, 1)
+    assert (balances[b]["covers_done"], balances[b]["covers_received"]) == (1, 0)
+
+    matrix = client.get(f"/api/teams/{team_id}/swap-matrix").get_json()
+    order = [m["member_id"] for m in matrix["members"]]
+    assert matrix["covers"][order.index(b)][order.index(a)] == 1
+    assert sum(map(sum, matrix["covers"])) == 1
+
+
+def test_revert_swap_when_the_original_member_row_is_gone(app, client):
+    from sqlalchemy import text
+    from app import db
+    from models import Shift, ShiftSwap
+    team_id, (a, b) = _team(client, ["A", "B"])
+    with app.app_context():
+        shift = Shift(member_id=b, team_id=team_id, shift_date=date(2031, 6, 1))
+        swap = ShiftSwap(shift=shift, original_member_id=a, covering_member_id=b)
+        db.session.add(swap)
+        db.session.commit()
+        swap_id = swap.id
+        db.session.execute(text("DELETE FROM members WHERE id = :id"), {"id": a})
+        db.session.commit()
+
+    res = client.delete(f"/api/swaps/{swap_id}")
+    assert res.status_code == 200
+    with app.app_context():
+        assert db.session.get(Shift, res.get_json()["shift"]["id"]).team_id == team_id
@@ -1,6 +1,34 @@
 import axios from "axios";
 
-const api = axios.create({ baseURL: "/api" });
+const api = axios.create({
+  baseURL: "/api",
+  validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+});
+
+// Conditional GETs: remember each response's ETag and body, send If-None-Match on the
+// next request for the same URL and reuse the remembered body on 304 Not Modified.
+const etagCache = new Map<string, { etag: string; data: unknown }>();
+
+api.interceptors.request.use((config) => {
+  if (config.method === "get") {
+    const cached = etagCache.get(api.getUri(config));
+    if (cached) config.headers.set("If-None-Match", cached.etag);
+  }
+  return config;
+});
+
+api.interceptors.response.use((response) => {
+  if (response.config.method !== "get") return response;
+  const key = api.getUri(response.config);
+  if (response.status === 304) {
+    const cached = etagCache.get(key);
+    if (cached) return { ...response, status: 200, data: cached.data };
+    return response;
+  }
+  const etag = response.headers["etag"];
+  if (etag) etagCache.set(key, { etag, data: response.data });
+  return response;
+});
 
 export interface Team {
   id: number;
@@ -79,6 +107,12 @@ export interface SwapBalance {
   net_balance: number;
 }
 
+export interface SwapMatrix {
+  members: { member_id: number; name: string }[];
+  covers: number[][]; // covers[i][j]: times members[i] covered members[j]
+  net: number[][]; // covers[i][j] - covers[j][i]; positive means j owes i
+}
+
 export interface ShiftSwapRecord {
   id: number;
   shift_id: number;
@@ -144,6 +178,56 @@ export interface ReportTeam {
   members: ReportMember[];
 }
 
+export interface ScheduleDiff {
+  kept: number;
+  reassigned: number;
+  inserted: number;
+  deleted: number;
+}
+
+export interface BulkDatesResult {
+  message: string;
+  count: number;
+  results: { date: string; status: 'added' | 'updated' | 'exists' | 'taken' | 'invalid' | 'duplicate' }[];
+}
+
+export interface HistoryImportReport {
+  rows: number;
+  shifts: number;
+  swaps: number;
+  shotef_days: number;
+  exists: number;
+  duplicates: number;
+  error_count: number;
+  errors: { row: number; error: string }[];
+  chunks: number;
+  teams: number;
+  dry_run: boolean;
+  elapsed_ms: number;
+}
+
+export interface GenerationResult {
+  assignments: Assignment[];
+  suggestions: Suggestion[];
+  shotef_assignments: ShotefAssignment[];
+  shotef_needs_substitute: ShotefSubNeed[];
+  diff?: ScheduleDiff;
+  cached?: boolean;
+}
+
+export interface GenerationJob {
+  id: number;
+  team_id: number;
+  year: number;
+  month: number;
+  status: "queued" | "running" | "done" | "failed";
+  result: GenerationResult | null;
+  error: string | null;
+  created_at: string | null;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
 // Teams
 export const getTeams = () => api.get<{ teams: Team[]; stats: { total_teams: number; total_members: number; total_shifts: number } }>("/teams");
 export const getTeam = (id: number) => api.get<{ team: Team; members: Member[] }>(`/teams/${id}`);
@@ -161,18 +245,136 @@ export const deleteMember = (id: number) => api.delete(`/members/${id}`);
 export const getUnavailabilities = (memberId: number) => api.get<{ unavailabilities: Unavailability[] }>(`/members/${memberId}/unavailabilities`);
 export const createUnavailability = (memberId: number, data: { date: string; reason?: string }) => api.post<Unavailability>(`/members/${memberId}/unavailabilities`, data);
 export const bulkCreateUnavailability = (memberId: number, data: { dates: string[]; reason?: string }) =>
-  api.post<{ message: string; count: number }>(`/members/${memberId}/unavailabilities/bulk`, data);
+  api.post<BulkDatesResult>(`/members/${memberId}/unavailabilities/bulk`, data);
 export const updateUnavailability = (id: number, data: Partial<Unavailability>) => api.put<Unavailability>(`/unavailabilities/${id}`, data);
 export const deleteUnavailability = (id: number) => api.delete(`/unavailabilities/${id}`);
 
 // Schedule
-export const generateSchedule = (teamId: number, year: number, month: number) =>
+export interface SolverStats {
+  mode?: "optimal";
+  used?: "optimal" | "greedy";
+  budget_ms?: number;
+  elapsed_ms?: number;
+  greedy_objective?: [number, number];
+  optimal_objective?: [number, number];
+  fallback_reason?: string;
+  local_search?: LocalSearchStats;
+}
+
+export interface FairnessReport {
+  unfilled: number;
+  variance: { total: number; thursday: number; weekend: number };
+  objective: number;
+}
+
+export interface LocalSearchStats {
+  budget_ms: number;
+  iterations: number;
+  accepted: number;
+  elapsed_ms: number;
+  before: FairnessReport;
+  after: FairnessReport;
+}
+
+export interface GenerateOptions {
+  mode?: "greedy" | "optimal";
+  time_budget_ms?: number;
+  improve_ms?: number;
+  seed?: number;
+  reroll?: boolean; // plan afresh even when nothing changed since the last run
+}
+export const generateSchedule = (
+  teamId: number, year: number, month: number,
+  options: GenerateOptions = {},
+) =>
   api.post<{
     assignments: Assignment[];
     suggestions: Suggestion[];
     shotef_assignments: ShotefAssignment[];
     shotef_needs_substitute: ShotefSubNeed[];
-  }>(`/teams/${teamId}/schedule/generate`, { year, month });
+    diff: ScheduleDiff;
+    cached: boolean;
+    solver?: SolverStats;
+  }>(`/teams/${teamId}/schedule/generate`, { year, month, ...options });
+export const generateHorizon = (teamId: number, year: number, month: number, months: number) =>
+  api.post<{
+    months: {
+      year: number;
+      month: number;
+      assignments: Assignment[];
+      suggestions: Suggestion[];
+      shotef_assignments: ShotefAssignment[];
+      shotef_needs_substitute: ShotefSubNeed[];
+      diff: ScheduleDiff;
+    }[];
+  }>(`/teams/${teamId}/schedule/generate-horizon`, { year, month, months });
+export interface SimulationRun {
+  seed: number;
+  unfilled: number;
+  fairness: number;
+  shotef_spread: number;
+  plan_ms: number;
+}
+
+export const simulateSchedule = (teamId: number, year: number, month: number, runs = 8, persist = false) =>
+  api.post<{
+    runs: SimulationRun[];
+    failed_runs: number;
+    best: SimulationRun & GenerationResult;
+    persisted: boolean;
+    workers: number;
+    elapsed_ms: number;
+  }>(`/teams/${teamId}/schedule/simulate`, { year, month, runs, persist });
+export const previewSchedule = (
+  teamId: number, year: number, month: number,
+  options: { mode?: "greedy" | "optimal"; time_budget_ms?: number; improve_ms?: number; seed?: number } = {},
+) =>
+  api.post<GenerationResult & { token: string; expires_at: string; solver?: SolverStats }>(
+    `/teams/${teamId}/schedule/preview`, { year, month, ...options },
+  );
+export const applyPreview = (teamId: number, token: string) =>
+  api.post<GenerationResult & { year: number; month: number; solver?: SolverStats }>(`/teams/${teamId}/schedule/apply`, { token });
+export const repairSchedule = (teamId: number, year: number, month: number, dates: string[], memberId?: number) =>
+  api.post<{
+    changes: { date: string; day_of_week: string; from: string | null; to: string | null }[];
+    unfilled: string[];
+    elapsed_ms: number;
+  }>(`/teams/${teamId}/schedule/repair`, { year, month, dates, member_id: memberId });
+export const generateAllTeams = (year: number, month: number) =>
+  api.post<{
+    year: number;
+    month: number;
+    workers: number;
+    elapsed_ms: number;
+    teams: {
+      team_id: number;
+      team_name: string;
+      status: "ok" | "skipped" | "error";
+      error?: string;
+      diff?: ScheduleDiff;
+      shifts?: number;
+      unfilled?: number;
+      shotef_days?: number;
+      snapshot_ms?: number;
+      plan_ms?: number;
+      persist_ms?: number;
+    }[];
+  }>("/schedule/generate-all", { year, month });
+export const submitGenerationJob = (teamId: number, year: number, month: number, options: GenerateOptions = {}) =>
+  api.post<{ job: GenerationJob }>(`/teams/${teamId}/schedule/generate-jobs`, { year, month, ...options });
+export const getGenerationJob = (jobId: number) => api.get<{ job: GenerationJob }>(`/generation-jobs/${jobId}`);
+export class GenerationJobTimeout extends Error {}
+export const waitForGenerationJob = async (jobId: number, intervalMs = 1000, maxWaitMs = 5 * 60 * 1000): Promise<GenerationJob> => {
+  const deadline = Date.now() + maxWaitMs;
+  for (;;) {
+    const { data } = await getGenerationJob(jobId);
+    if (data.job.status === "done" || data.job.status === "failed") return data.job;
+    if (Date.now() + intervalMs > deadline) {
+      throw new GenerationJobTimeout("Generation is still running; check the schedule again in a few minutes");
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
 export const getSchedule = (teamId: number, year: number, month: number) => api.get<{ shifts: ShiftEntry[] }>(`/teams/${teamId}/schedule`, { params: { year, month } });
 export const deleteSchedule = (teamId: number, year: number, month: number) => api.delete(`/teams/${teamId}/schedule`, { params: { year, month } });
 export const assignShift = (teamId: number, memberName: string, date: string) =>
@@ -183,13 +385,22 @@ export const getSavedSchedules = (teamId: number) => api.get<{ schedules: { year
 export const swapShift = (teamId: number, shiftId: number, coveringMemberId: number) =>
   api.post<{ shift: ShiftEntry; swap: ShiftSwapRecord }>(`/teams/${teamId}/schedule/swap`, { shift_id: shiftId, covering_member_id: coveringMemberId });
 export const revertSwap = (swapId: number) => api.delete<{ message: string; shift: ShiftEntry | null }>(`/swaps/${swapId}`);
-export const getSwapBalance = (teamId: number) => api.get<{ balances: SwapBalance[] }>(`/teams/${teamId}/swap-balance`);
+export const getSwapBalance = (teamId: number, window: { from?: string; to?: string } = {}) =>
+  api.get<{ balances: SwapBalance[] }>(`/teams/${teamId}/swap-balance`, { params: window });
+export const getSwapMatrix = (teamId: number, window: { from?: string; to?: string } = {}) =>
+  api.get<SwapMatrix>(`/teams/${teamId}/swap-matrix`, { params: window });
 
 // Past shifts
 export const getPastShifts = (teamId: number, year?: number, month?: number) => api.get<{ shifts: Record<string, { member_name: string; member_id: number; shift_id: number; swap?: ShiftSwapRecord }[]> }>(`/teams/${teamId}/past-shifts`, { params: { year, month } });
-export const bulkAddPastShifts = (teamId: number, memberId: number, dates: string[]) => api.post(`/teams/${teamId}/past-shifts`, { member_id: memberId, shift_dates: dates });
+export const bulkAddPastShifts = (teamId: number, memberId: number, dates: string[]) => api.post<BulkDatesResult>(`/teams/${teamId}/past-shifts`, { member_id: memberId, shift_dates: dates });
 export const reassignShift = (shiftId: number, memberId: number) => api.put<ShiftEntry>(`/shifts/${shiftId}`, { member_id: memberId });
 export const deleteShift = (id: number) => api.delete(`/shifts/${id}`);
+export const importHistory = (file: File, dryRun = false) => {
+  const form = new FormData();
+  form.append('file', file);
+  if (dryRun) form.append('dry_run', '1');
+  return api.post<HistoryImportReport>('/history/import', form);
+};
 
 // Shotef (day-level)
 export const getShotef = (teamId: number, year: number, month: number) =>
@@ -202,7 +413,7 @@ export const getShotefHistory = (teamId: number) =>
 export const settleShotef = (teamId: number) =>
   api.post<{ message: string; settled_at: string }>(`/teams/${teamId}/shotef-settle`);
 export const addShotefDays = (teamId: number, memberId: number, dates: string[]) =>
-  api.post<{ message: string; count: number }>(`/teams/${teamId}/shotef-days`, { member_id: memberId, dates });
+  api.post<BulkDatesResult>(`/teams/${teamId}/shotef-days`, { member_id: memberId, dates });
 
 // Combined view endpoints (performance)
 export const getScheduleView = (teamId: number, year: number, month: number) =>
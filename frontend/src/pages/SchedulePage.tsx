@@ -4,10 +4,10 @@ import toast from "react-hot-toast";
 import dayjs from "dayjs";
 import {
   ChevronLeft, ChevronRight, Wand2, Download, Trash2, AlertTriangle,
-  ArrowLeftRight, Undo2, ChevronDown, ChevronUp, Plus, X, Users, UserPlus, Pencil,
+  ArrowLeftRight, Undo2, ChevronDown, ChevronUp, Plus, X, Users, UserPlus, Pencil, Dices,
 } from "lucide-react";
 import {
-  getScheduleView, generateSchedule, deleteSchedule, assignShift,
+  getScheduleView, submitGenerationJob, waitForGenerationJob, GenerationJobTimeout, deleteSchedule, assignShift,
   swapShift, revertSwap, reassignShift,
   bulkCreateUnavailability, deleteUnavailability,
   reassignShotefDay,
@@ -116,18 +116,24 @@ export default function SchedulePage() {
     return map;
   }, [shotefDays]);
 
-  const handleGenerate = async () => {
+  const handleGenerate = async (reroll = false) => {
     setGenerating(true);
     try {
-      const { data } = await generateSchedule(id, month.year(), month.month() + 1);
-      toast.success("Schedule generated");
+      const { data: submitted } = await submitGenerationJob(id, month.year(), month.month() + 1, { reroll });
+      const job = await waitForGenerationJob(submitted.job.id);
+      if (job.status === "failed" || !job.result) {
+        toast.error(job.error || "Generation failed");
+        return;
+      }
+      const data = job.result;
+      toast.success(data.cached ? "Nothing changed since the last run; kept that schedule" : "Schedule generated");
       setSuggestions(data.suggestions);
       if (data.suggestions.length > 0) setShowSuggestions(true);
       setShotefSubNeeds(data.shotef_needs_substitute || []);
       if ((data.shotef_needs_substitute || []).length > 0) setShowShotefSubs(true);
       load();
     } catch (err: any) {
-      toast.error(err.response?.data?.error || "Generation failed");
+      toast.error(err.response?.data?.error || (err instanceof GenerationJobTimeout ? err.message : "Generation failed"));
     } finally {
       setGenerating(false);
     }
@@ -323,7 +329,7 @@ export default function SchedulePage() {
             )}
           </button>
           <button
-            onClick={handleGenerate}
+            onClick={() => handleGenerate()}
             disabled={generating || isPastMonth}
             title={isPastMonth ? "Cannot generate schedules for past months" : undefined}
             className="flex items-center gap-2 px-4 py-2 text-sm font-medium rounded-lg bg-indigo-600 text-white hover:bg-indigo-700 disabled:opacity-50 disabled:cursor-not-allowed"
@@ -332,6 +338,16 @@ export default function SchedulePage() {
           </button>
           {shifts.length > 0 && (
             <>
+              {!isPastMonth && (
+                <button
+                  onClick={() => handleGenerate(true)}
+                  disabled={generating}
+                  title="Draw a new schedule even if nothing changed"
+                  className="flex items-center gap-2 px-4 py-2 text-sm font-medium rounded-lg border border-gray-300 text-gray-700 hover:bg-gray-50 disabled:opacity-50"
+                >
+                  <Dices size={14} /> Re-roll
+                </button>
+              )}
               <button onClick={handleExport} className="flex items-center gap-2 px-4 py-2 text-sm font-medium rounded-lg border border-gray-300 text-gray-700 hover:bg-gray-50">
                 <Download size={14} /> Export
               </button>